@@ -122,7 +122,7 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "foodgram.core.pagination.FoodgramDefaultPagination",
     "PAGE_SIZE": 20,
-    'DATETIME_FORMAT': "%Y-%m-%dT%H:%M:%S",
+    "DATETIME_FORMAT": "%Y-%m-%dT%H:%M:%S",
     "TEST_REQUEST_DEFAULT_FORMAT": "json",
 }
 
@@ -183,6 +183,91 @@ FIXTURE_DIRS = (str(APPS_DIR / "fixtures"),)
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# CACHES
+# ------------------------------------------------------------------------------
+# https://docs.djangoproject.com/en/dev/ref/settings/#caches
+# Local memory cache is per process. Set shared cache (redis, memcached) for
+# several workers, e.g. DJANGO_CACHE_URL=rediscache://redis:6379/1
+CACHES = {
+    "default": env.cache("DJANGO_CACHE_URL", default="locmemcache://foodgram"),
+}
+
+
+# FOODGRAM
+# ------------------------------------------------------------------------------
+# How recipes get user's state ("is_favorited", "is_in_shopping_cart" and
+# author's "is_subscribed"):
+#   - "subquery": correlated EXISTS subqueries for every recipe row
+#   - "batch": three lookups limited to the fetched page, merged in python
+RECIPES_USER_STATE_STRATEGY = env(
+    "DJANGO_RECIPES_USER_STATE_STRATEGY",
+    default="subquery",
+)
+# Recipes list and detail responses for anonymous users are cached until
+# recipes change but no longer than the timeout (seconds)
+RECIPES_CACHE_TIMEOUT = env.int("DJANGO_RECIPES_CACHE_TIMEOUT", default=60)
+# Time of the last change of user's favorites, shopping cart and
+# subscriptions is kept in cache to validate recipes responses
+# ('Last-Modified', 'ETag'). Changes made outside of the API (e.g. in admin)
+# are noticed no later than the timeout (seconds)
+USER_STATE_CACHE_TIMEOUT = env.int(
+    "DJANGO_USER_STATE_CACHE_TIMEOUT", default=60 * 60
+)
+# Ids of users followed by every user are cached to set 'is_subscribed'
+# and paginate subscriptions without subqueries. The API outdates them on
+# every change, other changes are noticed no later than the timeout (seconds)
+FOLLOWING_CACHE_TIMEOUT = env.int(
+    "DJANGO_FOLLOWING_CACHE_TIMEOUT", default=60 * 60
+)
+# Following feed (see 'recipes.feed'). A new recipe is written to followers'
+# feeds in batches by background worker, unless the author has more than
+# FEED_FANOUT_MAX_FOLLOWERS followers: then it's read from recipes table.
+# A newly followed author's latest FEED_BACKFILL_SIZE recipes are added.
+FEED_FANOUT_BATCH_SIZE = env.int("DJANGO_FEED_FANOUT_BATCH_SIZE", default=1000)
+FEED_FANOUT_MAX_FOLLOWERS = env.int(
+    "DJANGO_FEED_FANOUT_MAX_FOLLOWERS", default=10000
+)
+FEED_BACKFILL_SIZE = env.int("DJANGO_FEED_BACKFILL_SIZE", default=100)
+# Recipe images larger than RECIPE_IMAGE_PROCESS_MIN_SIZE bytes or
+# RECIPE_IMAGE_MAX_SIDE pixels are downscaled and re-encoded by background
+# worker. Until then the original image is served.
+RECIPE_IMAGE_MAX_SIDE = env.int("DJANGO_RECIPE_IMAGE_MAX_SIDE", default=1920)
+RECIPE_IMAGE_PROCESS_MIN_SIZE = env.int(
+    "DJANGO_RECIPE_IMAGE_PROCESS_MIN_SIZE", default=512 * 1024
+)
+RECIPE_IMAGE_QUALITY = env.int("DJANGO_RECIPE_IMAGE_QUALITY", default=85)
+# Images still pending after RECIPE_IMAGE_PENDING_TIMEOUT seconds (e.g. the
+# worker was restarted) are processed again by
+# 'make_recipe_image_variants --pending'.
+RECIPE_IMAGE_PENDING_TIMEOUT = env.int(
+    "DJANGO_RECIPE_IMAGE_PENDING_TIMEOUT", default=15 * 60
+)
+# Widths (pixels) of recipe image copies in JPEG (PNG) and WebP for cards and
+# previews. They are made by background worker after upload and by
+# 'make_recipe_image_variants' command for existing images.
+RECIPE_IMAGE_VARIANT_WIDTHS = env.list(
+    "DJANGO_RECIPE_IMAGE_VARIANT_WIDTHS", cast=int, default=[320, 640]
+)
+# The max number of ingredients returned by ingredients search
+INGREDIENTS_SEARCH_LIMIT = env.int(
+    "DJANGO_INGREDIENTS_SEARCH_LIMIT", default=50
+)
+# Background tasks (e.g. PDF rendering) are run by pool of threads in every
+# process. With BACKGROUND_TASKS_SYNC tasks are run right in the request.
+BACKGROUND_TASKS_WORKERS = env.int(
+    "DJANGO_BACKGROUND_TASKS_WORKERS", default=2
+)
+BACKGROUND_TASKS_SYNC = env.bool("DJANGO_BACKGROUND_TASKS_SYNC", default=False)
+# Ingredients and tags lists are cached until they change but no longer
+# than the timeout (seconds)
+CATALOG_CACHE_TIMEOUT = env.int(
+    "DJANGO_CATALOG_CACHE_TIMEOUT", default=60 * 60
+)
+# The max number of ids in every list of bulk favorite, shopping cart and
+# subscribe requests
+BULK_ACTION_MAX_ITEMS = env.int("DJANGO_BULK_ACTION_MAX_ITEMS", default=500)
+
+
 # CORS
 # ------------------------------------------------------------------------------
 CORS_ORIGIN_ALLOW_ALL = True
@@ -24,6 +24,38 @@ PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
 # https://docs.djangoproject.com/en/dev/ref/settings/#email-backend
 EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
 
+# CACHES
+# ------------------------------------------------------------------------------
+# https://docs.djangoproject.com/en/dev/ref/settings/#caches
+# Tests are rolled back without signals, so cache is disabled. Tests of
+# caching have to override the setting.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.dummy.DummyCache",
+    }
+}
+
+# Transactions in tests are never committed, so tasks have to be run in the
+# request thread
+BACKGROUND_TASKS_SYNC = True
+
+# PERFORMANCE TESTS
+# ------------------------------------------------------------------------------
+# Queries budgets are always checked. Time budgets depend on the machine and
+# are checked only with PERFORMANCE_CHECK_TIMINGS: an endpoint fails when
+# the median of PERFORMANCE_REPEAT requests is longer than the baseline times
+# the tolerance plus the slack. Baselines are rewritten with
+# UPDATE_PERFORMANCE_BASELINES.
+PERFORMANCE_CHECK_TIMINGS = env.bool(
+    "PERFORMANCE_CHECK_TIMINGS", default=False
+)
+PERFORMANCE_REPEAT = env.int("PERFORMANCE_REPEAT", default=5)
+PERFORMANCE_TOLERANCE = env.float("PERFORMANCE_TOLERANCE", default=3.0)
+PERFORMANCE_SLACK_MS = env.float("PERFORMANCE_SLACK_MS", default=20.0)
+UPDATE_PERFORMANCE_BASELINES = env.bool(
+    "UPDATE_PERFORMANCE_BASELINES", default=False
+)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
@@ -0,0 +1,95 @@
+import json
+import math
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(values, percent):
+    """Returns 'percent' percentile of the values (nearest-rank method)."""
+    assert values, "'values' should not be empty."
+
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def measure(func: Callable, repeat: int = 20, warmup: int = 1) -> dict:
+    """
+    Calls 'func' 'repeat' times and returns timings in milliseconds and the
+    number of SQL queries one call does.
+    """
+    for _ in range(warmup):
+        func()
+
+    with CaptureQueriesContext(connection) as context:
+        func()
+    queries = len(context.captured_queries)
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "queries": queries,
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def measure_memory(func: Callable) -> dict:
+    """Returns peak of Python memory allocated by one 'func' call in KiB."""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"peak_kib": round(peak / 1024, 1)}
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    Base command for benchmarks.
+
+    Test data is created in the transaction that is rolled back after the run.
+    So the benchmark could be run against the working database. Results are
+    printed as JSON.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Сколько раз повторить каждый замер.",
+        )
+
+    def seed(self, **options: Any) -> None:
+        """Creates test data."""
+        raise NotImplementedError("'seed' должен быть реализован.")
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        """Runs benchmarks and returns results."""
+        raise NotImplementedError("'run' должен быть реализован.")
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        with transaction.atomic():
+            self.seed(**options)
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            results = self.run(**options)
+            transaction.set_rollback(True)
+
+        results["database"] = connection.vendor
+        self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
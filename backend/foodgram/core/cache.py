@@ -0,0 +1,100 @@
+import hashlib
+from functools import partial
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+USER_STATE_NAMESPACE = "users:state"
+
+
+def get_version(namespace):
+    """
+    Returns current version of cached data in 'namespace'. Version is a
+    random string, so a lost version (evicted or server restarted) never
+    matches old cached entries.
+    """
+    key = f"{namespace}:version"
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(namespace):
+    """Makes all cached data in 'namespace' outdated."""
+    cache.set(f"{namespace}:version", uuid4().hex, timeout=None)
+
+
+def get_user_state_changed_at(user_id):
+    """
+    Returns time of the last change of user's favorites, shopping cart or
+    subscriptions. If the time is unknown (evicted or expired) the current
+    time is stored, so clients revalidate their copies once.
+    """
+    key = f"{USER_STATE_NAMESPACE}:{user_id}"
+    changed_at = cache.get(key)
+    if changed_at is None:
+        changed_at = timezone.now()
+        timeout = settings.USER_STATE_CACHE_TIMEOUT
+        if not cache.add(key, changed_at, timeout=timeout):
+            changed_at = cache.get(key, changed_at)
+    return changed_at
+
+
+def _set_user_state_changed_at(user_id):
+    cache.set(
+        f"{USER_STATE_NAMESPACE}:{user_id}",
+        timezone.now(),
+        timeout=settings.USER_STATE_CACHE_TIMEOUT,
+    )
+
+
+def touch_user_state(user_id):
+    """Marks user's state changed once the transaction is committed."""
+    transaction.on_commit(partial(_set_user_state_changed_at, user_id))
+
+
+def versioned_key(namespace, *parts):
+    """Returns cache key that becomes outdated with 'bump_version'."""
+    version = get_version(namespace)
+    return ":".join([namespace, version, *map(str, parts)])
+
+
+def set_rendered(key, content, timeout=None):
+    """Caches content bytes with their etag, returns '(content, etag)'."""
+    etag = hashlib.md5(content).hexdigest()
+    cached = (content, etag)
+    cache.set(key, cached, timeout=timeout)
+    return cached
+
+
+def get_or_render(key, render, timeout=None):
+    """
+    Returns '(content, etag)' for the 'key'. If there is nothing in cache
+    calls 'render' to get content bytes and caches them.
+    """
+    cached = cache.get(key)
+    if cached is None:
+        cached = set_rendered(key, render(), timeout=timeout)
+    return cached
+
+
+def json_response(request, content, etag):
+    """
+    Returns response with pre-rendered JSON 'content' or 304 response if
+    the client has the same version ('If-None-Match' matches 'etag').
+    """
+    etag = quote_etag(etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type="application/json")
+    response["ETag"] = etag
+    return response
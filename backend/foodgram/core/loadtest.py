@@ -0,0 +1,207 @@
+"""
+Load testing of the API over HTTP.
+
+Virtual users run scenarios of the traffic mix against the server in
+threads. Every request is recorded as a sample '(endpoint, latency_ms,
+status, ok)'. Scenarios mimic what the frontend does: a screen makes a few
+requests in a row. Scenarios pick objects from 'data' dict: 'recipes_ids',
+'recipes_pages' (pages of RECIPES_PAGE_SIZE) and 'ingredients_prefixes'.
+"""
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+from urllib.error import HTTPError, URLError
+from urllib.parse import parse_qs, urlencode, urlsplit
+from urllib.request import Request, urlopen
+
+from .benchmark import percentile
+
+# Recipes on the page of the frontend
+RECIPES_PAGE_SIZE = 6
+
+
+class LoadTestClient:
+    """HTTP client of one virtual user, it records samples of requests."""
+
+    def __init__(self, base_url, token=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.samples = []
+
+    def request(self, endpoint, path, method="GET", params=None, ok=(200,)):
+        """
+        Makes the request and records the sample. Statuses from 'ok' are
+        expected ones, e.g. 404 for an empty shopping cart. Returns the
+        parsed JSON body or None.
+        """
+        url = self.base_url + path
+        if params:
+            url = f"{url}?{urlencode(params, doseq=True)}"
+        request = Request(url, method=method)
+        if self.token is not None:
+            request.add_header("Authorization", f"Token {self.token}")
+
+        status, body = None, b""
+        start = time.perf_counter()
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except HTTPError as error:
+            status = error.code
+        except (URLError, OSError):
+            pass
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        self.samples.append((endpoint, latency_ms, status, status in ok))
+        if status is None or not 200 <= status < 300:
+            return None
+        try:
+            return json.loads(body)
+        except ValueError:
+            return None
+
+
+def browse_feed(client, rng, data):
+    """Opens the feed and scrolls to the next page."""
+    page = client.request("feed", "/api/recipes/feed/")
+    if page and page.get("next"):
+        query = parse_qs(urlsplit(page["next"]).query)
+        client.request("feed_next_page", "/api/recipes/feed/", params=query)
+
+
+def browse_recipes(client, rng, data):
+    client.request(
+        "recipes_list",
+        "/api/recipes/",
+        params={
+            "page": rng.randint(1, min(data["recipes_pages"], 5)),
+            "limit": RECIPES_PAGE_SIZE,
+        },
+    )
+
+
+def autocomplete_ingredient(client, rng, data):
+    """The user types the ingredient name, every letter is a request."""
+    prefix = rng.choice(data["ingredients_prefixes"])
+    for length in range(1, len(prefix) + 1):
+        client.request(
+            "ingredients_autocomplete",
+            "/api/ingredients/",
+            params={"name": prefix[:length]},
+        )
+
+
+def _toggle(client, rng, data, action):
+    recipe_id = rng.choice(data["recipes_ids"])
+    path = f"/api/recipes/{recipe_id}/{action}/"
+    # The recipe could be in the list already, e.g. added by the fill
+    # commands or by other virtual user with the same account
+    client.request(f"{action}_add", path, ok=(201, 406))
+    client.request(f"{action}_remove", path, method="DELETE", ok=(204, 404))
+
+
+def toggle_favorite(client, rng, data):
+    _toggle(client, rng, data, "favorite")
+
+
+def toggle_shopping_cart(client, rng, data):
+    _toggle(client, rng, data, "shopping_cart")
+
+
+def list_subscriptions(client, rng, data):
+    client.request(
+        "subscriptions",
+        "/api/users/subscriptions/",
+        params={"recipes_limit": 3},
+    )
+
+
+def download_shopping_cart(client, rng, data):
+    client.request(
+        "download_shopping_cart",
+        "/api/recipes/download_shopping_cart/",
+        params={"format": "txt"},
+        ok=(200, 404),
+    )
+
+
+# Scenario and its weight in the traffic
+TRAFFIC_MIX = {
+    browse_feed: 30,
+    browse_recipes: 20,
+    autocomplete_ingredient: 15,
+    toggle_favorite: 10,
+    toggle_shopping_cart: 10,
+    list_subscriptions: 10,
+    download_shopping_cart: 5,
+}
+
+
+def run_virtual_user(client, data, seed, deadline, mix=TRAFFIC_MIX):
+    """Runs random scenarios of the mix until the deadline."""
+    rng = random.Random(seed)
+    scenarios, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        (scenario,) = rng.choices(scenarios, weights)
+        scenario(client, rng, data)
+    return client.samples
+
+
+def run_load(base_url, tokens, data, concurrency, duration, seed=0):
+    """
+    Runs 'concurrency' virtual users for 'duration' seconds. Users take
+    tokens in turn. Returns '(samples, elapsed_seconds)'.
+    """
+    start = time.perf_counter()
+    deadline = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                run_virtual_user,
+                LoadTestClient(base_url, tokens[number % len(tokens)]),
+                data,
+                seed + number,
+                deadline,
+            )
+            for number in range(concurrency)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    return samples, time.perf_counter() - start
+
+
+def _summarize_samples(samples, elapsed):
+    latencies = [latency_ms for _, latency_ms, _, _ in samples]
+    errors = sum(not ok for _, _, _, ok in samples)
+    statuses = Counter(str(status) for _, _, status, _ in samples)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+def summarize(samples, elapsed) -> Dict[str, Any]:
+    """
+    Returns throughput, latency percentiles and error rate of every
+    endpoint and of all requests. Unexpected statuses and failed
+    connections (status 'None') are errors.
+    """
+    by_endpoint = defaultdict(list)
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+    return {
+        "total": _summarize_samples(samples, elapsed) if samples else {},
+        "endpoints": {
+            endpoint: _summarize_samples(endpoint_samples, elapsed)
+            for endpoint, endpoint_samples in sorted(by_endpoint.items())
+        },
+    }
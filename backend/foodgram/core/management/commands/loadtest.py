@@ -0,0 +1,239 @@
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from ....recipes.models import Ingredient, Recipe
+from ...loadtest import RECIPES_PAGE_SIZE, run_load, summarize
+
+User = get_user_model()
+
+SERVER_START_TIMEOUT = 30
+INGREDIENTS_FIXTURE = Path(settings.ROOT_DIR) / "data/ingredients_updated.json"
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_server_command(server, address, workers, threads):
+    if server == "gunicorn":
+        return [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "config.wsgi:application",
+            f"--bind={address}",
+            f"--workers={workers}",
+            f"--threads={threads}",
+        ]
+    return [
+        sys.executable,
+        "manage.py",
+        "runserver",
+        address,
+        "--noreload",
+    ]
+
+
+def wait_for_server(base_url, process, log):
+    """Waits until the server responds, fails if it has exited."""
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            log.seek(0)
+            raise CommandError(
+                "Сервер не запустился:\n" + log.read().decode()[-2000:]
+            )
+        try:
+            with urlopen(f"{base_url}/api/tags/", timeout=1):
+                return
+        except (URLError, OSError):
+            time.sleep(0.2)
+    raise CommandError(f"Сервер не ответил за {SERVER_START_TIMEOUT} секунд.")
+
+
+@contextmanager
+def local_server(server, workers, threads):
+    """
+    Starts the server with the current settings in a subprocess and yields
+    its URL. The server is stopped on exit.
+    """
+    address = f"127.0.0.1:{get_free_port()}"
+    base_url = f"http://{address}"
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(
+            get_server_command(server, address, workers, threads),
+            cwd=settings.ROOT_DIR,
+            env=os.environ.copy(),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            wait_for_server(base_url, process, log)
+            yield base_url
+        finally:
+            process.terminate()
+            process.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочное тестирование API: виртуальные пользователи выполняют "
+        "смешанные сценарии (лента, поиск ингредиентов, избранное и "
+        "корзина, подписки, скачивание списка покупок) против локально "
+        "запущенного сервера. Выводит в JSON пропускную способность, "
+        "задержки p50/p95/p99 и долю ошибок по каждому эндпоинту. "
+        "Работает без интернета с SQLite и с локальным Postgres."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help=(
+                "Адрес уже запущенного сервера. Если не задан, сервер "
+                "запускается с текущими настройками."
+            ),
+        )
+        parser.add_argument(
+            "--server",
+            choices=["runserver", "gunicorn"],
+            default="runserver",
+        )
+        parser.add_argument(
+            "--server-workers",
+            type=int,
+            default=2,
+            help="Количество процессов gunicorn.",
+        )
+        parser.add_argument(
+            "--server-threads",
+            type=int,
+            default=4,
+            help="Количество потоков в процессе gunicorn.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Количество одновременных виртуальных пользователей.",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            default=30,
+            help="Длительность теста в секундах.",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed генератора сценариев, для повторяемости.",
+        )
+        parser.add_argument(
+            "--fill-users",
+            type=int,
+            default=0,
+            help="Сколько пользователей создать командой fill_users.",
+        )
+        parser.add_argument(
+            "--fill-recipes",
+            type=int,
+            default=0,
+            help="Сколько рецептов создать командой fill_recipes.",
+        )
+        parser.add_argument("--output", help="Файл для результатов.")
+
+    def fill_database(self, users_amount, recipes_amount):
+        """Creates test data with 'fill_users' and 'fill_recipes'."""
+        if users_amount:
+            call_command("fill_users", users_amount, stdout=self.stderr)
+        if recipes_amount:
+            if not Ingredient.objects.exists():
+                call_command(
+                    "loaddata", INGREDIENTS_FIXTURE, stdout=self.stderr
+                )
+            call_command("fill_recipes", recipes_amount, stdout=self.stderr)
+
+    def get_test_data(self, seed):
+        recipes_ids = list(Recipe.objects.values_list("id", flat=True))
+        names = Ingredient.objects.values_list("name", flat=True)
+        if not recipes_ids or not names.exists():
+            raise CommandError(
+                "В базе нет рецептов или ингредиентов. Заполните ее с "
+                "помощью --fill-users и --fill-recipes."
+            )
+        rng = random.Random(seed)
+        names = rng.sample(list(names), min(names.count(), 100))
+        return {
+            "recipes_ids": rng.sample(
+                recipes_ids, min(len(recipes_ids), 1000)
+            ),
+            "recipes_pages": math.ceil(len(recipes_ids) / RECIPES_PAGE_SIZE),
+            "ingredients_prefixes": [name[:4].lower() for name in names],
+        }
+
+    def get_tokens(self, amount):
+        """Auth tokens of the first users, they are the virtual users."""
+        users = list(User.objects.order_by("id")[:amount])
+        if not users:
+            raise CommandError("В базе нет пользователей.")
+        return [
+            Token.objects.get_or_create(user=user)[0].key for user in users
+        ]
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        self.fill_database(options["fill_users"], options["fill_recipes"])
+        data = self.get_test_data(options["seed"])
+        tokens = self.get_tokens(options["concurrency"])
+
+        def run(base_url):
+            return run_load(
+                base_url,
+                tokens,
+                data,
+                concurrency=options["concurrency"],
+                duration=options["duration"],
+                seed=options["seed"],
+            )
+
+        if options["url"]:
+            samples, elapsed = run(options["url"])
+        else:
+            with local_server(
+                options["server"],
+                options["server_workers"],
+                options["server_threads"],
+            ) as base_url:
+                samples, elapsed = run(base_url)
+
+        results = {
+            "database": connection.vendor,
+            "server": options["url"] or options["server"],
+            "concurrency": options["concurrency"],
+            "duration_s": round(elapsed, 3),
+            **summarize(samples, elapsed),
+        }
+        output = json.dumps(results, ensure_ascii=False, indent=2)
+        if options["output"]:
+            Path(options["output"]).write_text(output)
+        self.stdout.write(output)
@@ -0,0 +1,34 @@
+from django.db import models
+from django.db.models.query import ModelIterable
+
+
+class PostFetchHooksQuerySet(models.QuerySet):
+    """
+    QuerySet that calls hooks with the list of fetched objects. Hooks load
+    related data for the fetched page only, e.g. with one query by ids.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._post_fetch_hooks = ()
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._post_fetch_hooks = self._post_fetch_hooks
+        return clone
+
+    def _fetch_all(self):
+        is_fetched = self._result_cache is not None
+        super()._fetch_all()
+        if not is_fetched and issubclass(self._iterable_class, ModelIterable):
+            for hook in self._post_fetch_hooks:
+                hook(self._result_cache)
+
+    def _add_post_fetch_hook(self, hook):
+        """
+        Returns a copy of the queryset that calls 'hook(objects)' with the
+        list of fetched objects.
+        """
+        qs = self._chain()
+        qs._post_fetch_hooks = (*self._post_fetch_hooks, hook)
+        return qs
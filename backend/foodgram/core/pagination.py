@@ -1,5 +1,19 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class FoodgramDefaultPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class FoodgramCursorPagination(CursorPagination):
+    """
+    Keyset pagination. Pages are addressed with an opaque 'cursor' instead of
+    'page', so the database never runs 'OFFSET' and 'COUNT(*)' queries.
+    The response has 'next' and 'previous' links but no 'count'.
+
+    Ordering has to be backed by an index and be unique together, so 'id' is
+    used as a tie breaker.
+    """
+
+    ordering = ("-pub_date", "-id")
+    page_size_query_param = "limit"
@@ -0,0 +1,28 @@
+from django.conf import settings
+from rest_framework import serializers
+
+
+class BulkActionSerializer(serializers.Serializer):
+    """Ids of objects to add to and to remove from user's list."""
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BULK_ACTION_MAX_ITEMS,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BULK_ACTION_MAX_ITEMS,
+    )
+
+    def validate(self, data):
+        if not data["add"] and not data["remove"]:
+            raise serializers.ValidationError(
+                "Передайте id объектов в 'add' или 'remove'."
+            )
+        if set(data["add"]) & set(data["remove"]):
+            raise serializers.ValidationError(
+                "Один и тот же id не может быть в 'add' и 'remove'."
+            )
+        return data
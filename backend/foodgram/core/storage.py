@@ -0,0 +1,48 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    File system storage that names files by SHA-256 of their content:
+    '<directory>/<2 first digits>/<digest><extension>'. A file with the same
+    content is stored once and its name is returned for every save.
+
+    So files are shared between objects and must not be deleted with the
+    object that references them. Unreferenced files are deleted by a
+    cleanup command. Saving an existing file updates its modification
+    time, so the cleanup can skip recently used files.
+    """
+
+    @staticmethod
+    def get_content_digest(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def get_hashed_name(self, name, content):
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        digest = self.get_content_digest(content)
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = self.get_hashed_name(name, content)
+        if self.exists(name):
+            # The file is in use again, cleanup must not take it for an
+            # old unreferenced one
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
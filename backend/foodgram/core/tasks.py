@@ -0,0 +1,47 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    """Returns process wide pool of background workers."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_TASKS_WORKERS,
+            thread_name_prefix="foodgram-task",
+        )
+    return _executor
+
+
+def _run_task(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task '%s' failed.", func.__name__)
+    finally:
+        connections.close_all()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Runs 'func' in the background worker after the current transaction is
+    committed, so the worker sees all the data the request saved.
+
+    With BACKGROUND_TASKS_SYNC setting 'func' is called right away. It is
+    used in tests where transactions are never committed.
+    """
+    if settings.BACKGROUND_TASKS_SYNC:
+        func(*args, **kwargs)
+        return
+
+    transaction.on_commit(
+        lambda: get_executor().submit(_run_task, func, args, kwargs)
+    )
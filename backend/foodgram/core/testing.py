@@ -0,0 +1,102 @@
+import json
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .benchmark import percentile
+
+
+class PerformanceTestMixin:
+    """
+    Mixin for test cases that check performance budgets of API endpoints.
+
+    'assertEndpointBudget' asserts the exact number of SQL queries the
+    request makes. Wall time depends on the machine, so it's checked only
+    with PERFORMANCE_CHECK_TIMINGS setting: the median time is compared
+    against the baseline from 'baselines_path' JSON file and the test fails
+    if the endpoint got slower than the baseline times
+    PERFORMANCE_TOLERANCE plus PERFORMANCE_SLACK_MS. Endpoints without a
+    baseline are only measured. With UPDATE_PERFORMANCE_BASELINES setting
+    the measured times are written to the file after the test case.
+    """
+
+    baselines_path = None
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        assert (
+            cls.baselines_path is not None
+        ), f"'{cls.__name__}' должен задать 'baselines_path'."
+        cls.timings = {}
+        try:
+            cls.baselines = json.loads(cls.baselines_path.read_text())
+        except FileNotFoundError:
+            cls.baselines = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if settings.UPDATE_PERFORMANCE_BASELINES and cls.timings:
+            try:
+                baselines = json.loads(cls.baselines_path.read_text())
+            except FileNotFoundError:
+                baselines = {}
+            baselines.update(cls.timings)
+            cls.baselines_path.write_text(
+                json.dumps(baselines, indent=2, sort_keys=True) + "\n"
+            )
+        super().tearDownClass()
+
+    def assertEndpointBudget(
+        self, name, request, queries, status_code=200, undo=None
+    ):
+        """
+        Calls 'request' (returns a response) and checks its status code and
+        the number of queries. Then times PERFORMANCE_REPEAT calls if
+        timings are checked or updated. 'undo' is called after every call,
+        it reverts changes of write requests and is not timed.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        # Every request resets the queries log, so they are copied before
+        # 'undo' requests
+        captured_queries = context.captured_queries
+        if undo is not None:
+            undo()
+        self.assertEqual(response.status_code, status_code, msg=name)
+        self.assertEqual(
+            len(captured_queries),
+            queries,
+            msg=(
+                f"Количество запросов к базе '{name}' изменилось:\n"
+                + "\n".join(query["sql"] for query in captured_queries)
+            ),
+        )
+
+        check_timings = settings.PERFORMANCE_CHECK_TIMINGS
+        if not (check_timings or settings.UPDATE_PERFORMANCE_BASELINES):
+            return
+
+        timings = []
+        for _ in range(settings.PERFORMANCE_REPEAT):
+            start = time.perf_counter()
+            request()
+            timings.append((time.perf_counter() - start) * 1000)
+            if undo is not None:
+                undo()
+        median = round(percentile(timings, 50), 3)
+        self.timings[name] = median
+
+        baseline = self.baselines.get(name)
+        if check_timings and baseline is not None:
+            budget = (
+                baseline * settings.PERFORMANCE_TOLERANCE
+                + settings.PERFORMANCE_SLACK_MS
+            )
+            self.assertLessEqual(
+                median,
+                budget,
+                msg=f"'{name}' медленнее базового времени {baseline} мс.",
+            )
@@ -0,0 +1,50 @@
+import json
+from io import StringIO
+from tempfile import mkdtemp
+
+from django.core.management import call_command
+from django.test import LiveServerTestCase, override_settings
+
+from ...recipes.factories import (
+    IngredientFactory,
+    MeasurementUnitFactory,
+    RecipeFactory,
+    RecipeTagFactory,
+)
+from ...users.factories import UserFactory, UserSubscriptionFactory
+
+
+@override_settings(MEDIA_ROOT=mkdtemp())
+class LoadTestTest(LiveServerTestCase):
+    def test_command_output(self):
+        users = UserFactory.create_batch(3)
+        UserSubscriptionFactory(follower=users[0], following=users[1])
+        unit = MeasurementUnitFactory()
+        IngredientFactory.create_batch(5, measurement_unit=unit)
+        RecipeTagFactory.create_batch(2)
+        for user in users:
+            RecipeFactory.create_batch(2, author=user)
+
+        out = StringIO()
+        call_command(
+            "loadtest",
+            f"--url={self.live_server_url}",
+            "--concurrency=1",
+            "--duration=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertGreater(results["total"]["requests"], 0)
+        self.assertEqual(
+            results["total"]["errors"],
+            0,
+            msg=f"Ответы сервера с ошибками: {results['endpoints']}",
+        )
+        self.assertEqual(
+            sum(
+                endpoint["requests"]
+                for endpoint in results["endpoints"].values()
+            ),
+            results["total"]["requests"],
+        )
@@ -1,3 +1,8 @@
+from itertools import islice
+
+from django.db import connection
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.template.defaultfilters import slugify as django_slugify
 
 from .constants import CYRILLIC_ALPHABET
@@ -10,3 +15,75 @@ def cyrillic_slugify(name):
         CYRILLIC_ALPHABET.get(character, character) for character in name
     )
     return django_slugify(transliterated_name)
+
+
+def chunked(iterable, size):
+    """Splits iterable into lists with 'size' items at most."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def plan_bulk_action(
+    add_ids, remove_ids, existing_ids, related_ids, forbidden_ids=()
+):
+    """
+    Decides what to do with every id of bulk add/remove request.
+    'existing_ids' are ids of objects that exist, 'related_ids' are ids of
+    objects already in user's list, 'forbidden_ids' can't be added.
+    Returns '(to_add, to_remove, results)', where 'results' are per-item
+    statuses in request order.
+    """
+    to_add, to_remove, results = [], [], []
+
+    for object_id in dict.fromkeys(add_ids):
+        if object_id not in existing_ids:
+            item_status = "not_found"
+        elif object_id in forbidden_ids:
+            item_status = "not_allowed"
+        elif object_id in related_ids:
+            item_status = "already_exists"
+        else:
+            item_status = "added"
+            to_add.append(object_id)
+        results.append(
+            {"id": object_id, "action": "add", "status": item_status}
+        )
+
+    for object_id in dict.fromkeys(remove_ids):
+        if object_id in related_ids:
+            item_status = "removed"
+            to_remove.append(object_id)
+        else:
+            item_status = "not_found"
+        results.append(
+            {"id": object_id, "action": "remove", "status": item_status}
+        )
+
+    return to_add, to_remove, results
+
+
+def change_counter(queryset, field, delta):
+    """
+    Changes counter 'field' by 'delta' for every object in queryset with
+    single UPDATE. Counter never gets below zero.
+    """
+    return queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def lock_rows(queryset):
+    """
+    Locks rows of the queryset with 'SELECT ... FOR UPDATE' until the end
+    of the transaction. Rows are locked in primary key order to avoid
+    deadlocks. Databases without row locks (SQLite) serialize writing
+    transactions anyway, so no query is made for them.
+    """
+    if not connection.features.has_select_for_update:
+        return
+    list(
+        queryset.select_for_update()
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
@@ -1,6 +1,22 @@
+from collections import Counter
+
 from django.contrib import admin
-from django.db.models import Count
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from foodgram.core.tasks import run_in_background
+from foodgram.core.utils import change_counter
+from foodgram.recipes.cart import (
+    add_to_cart_totals,
+    delete_recipe_from_cart_totals,
+    get_recipes_amounts,
+    lock_recipes,
+    remove_from_cart_totals,
+    update_recipe_in_cart_totals,
+)
+from foodgram.recipes.images import process_recipe_image
 from foodgram.recipes.models import (
+    CartIngredientTotal,
     Ingredient,
     MeasurementUnit,
     Recipe,
@@ -8,8 +24,22 @@ from foodgram.recipes.models import (
     RecipeFavorite,
     RecipeIngredient,
     RecipeTag,
+    ShoppingCartPDF,
 )
 
+User = get_user_model()
+
+
+def change_counters(model, ids, field, delta=1):
+    """
+    Changes counter 'field' of objects 'ids' by 'delta' for every time
+    the object's id is in 'ids'.
+    """
+    for object_id, times in Counter(ids).items():
+        change_counter(
+            model.objects.filter(id=object_id), field, delta * times
+        )
+
 
 class MeasurementUnitAdmin(admin.ModelAdmin):
     list_display = ["name"]
@@ -34,33 +64,138 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ["name", "author", "pub_date", "favorite_count"]
+    list_display = ["name", "author", "pub_date", "favorites_count"]
     search_fields = ["name"]
     list_filter = ["author", "tags"]
-    readonly_fields = ["favorite_count"]
-
-    def favorite_count(self, obj):
-        return obj.favorite_count
-
-    favorite_count.short_description = "Раз добавили в избранное"
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(favorite_count=Count("favorites"))
-        return qs
+    readonly_fields = ["favorites_count", "cart_count", "image_status"]
 
     autocomplete_fields = ["ingredients"]
     inlines = [RecipeIngredientInline]
 
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        # New image is processed like the one uploaded with the API
+        image_changed = "image" in form.changed_data
+        if image_changed:
+            obj.image_status = Recipe.IMAGE_PENDING
+            obj.image_variants = []
+
+        if not change:
+            super().save_model(request, obj, form, change)
+            change_counters(User, [obj.author_id], "recipes_count")
+        else:
+            # Counters and fields set by background tasks are not written
+            # from the form's instance, they could be changed since it was
+            # loaded
+            update_fields = [
+                name
+                for name in form.changed_data
+                if not obj._meta.get_field(name).many_to_many
+            ]
+            if image_changed:
+                update_fields += ["image_status", "image_variants"]
+            obj.save(update_fields=[*update_fields, "updated_at"])
+            if "author" in form.changed_data:
+                change_counters(
+                    User, [form.initial["author"]], "recipes_count", -1
+                )
+                change_counters(User, [obj.author_id], "recipes_count")
+
+        if image_changed:
+            run_in_background(process_recipe_image, obj.id, obj.image.name)
+
+    def save_related(self, request, form, formsets, change):
+        lock_recipes([form.instance.id])
+        old_amounts = get_recipes_amounts([form.instance.id])
+        super().save_related(request, form, formsets, change)
+        new_amounts = get_recipes_amounts([form.instance.id])
+        update_recipe_in_cart_totals(
+            form.instance.id, old_amounts, new_amounts
+        )
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        delete_recipe_from_cart_totals(obj.id)
+        change_counters(User, [obj.author_id], "recipes_count", -1)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list("id", "author_id"))
+        for recipe_id, _ in recipes:
+            delete_recipe_from_cart_totals(recipe_id)
+        change_counters(
+            User,
+            [author_id for _, author_id in recipes],
+            "recipes_count",
+            -1,
+        )
+        super().delete_queryset(request, queryset)
+
+
+class RecipeListAdmin(admin.ModelAdmin):
+    """
+    Admin of recipes lists (favorites or shopping cart). Keeps the recipe's
+    'counter_field' in step with the list.
+    """
 
-class RecipeFavoriteAdmin(admin.ModelAdmin):
     fields = ["user", "recipe"]
     search_fields = ["user", "recipe"]
+    counter_field = None
 
+    def on_add(self, obj):
+        change_counters(Recipe, [obj.recipe_id], self.counter_field)
 
-class RecipeCartAdmin(admin.ModelAdmin):
-    fields = ["user", "recipe"]
-    search_fields = ["user", "recipe"]
+    def on_remove(self, user_id, recipe_id):
+        change_counters(Recipe, [recipe_id], self.counter_field, -1)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if change:
+            old = self.model.objects.get(id=obj.id)
+            self.on_remove(old.user_id, old.recipe_id)
+        super().save_model(request, obj, form, change)
+        self.on_add(obj)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.on_remove(obj.user_id, obj.recipe_id)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for user_id, recipe_id in queryset.values_list("user_id", "recipe_id"):
+            self.on_remove(user_id, recipe_id)
+        super().delete_queryset(request, queryset)
+
+
+class RecipeFavoriteAdmin(RecipeListAdmin):
+    counter_field = "favorites_count"
+
+
+class RecipeCartAdmin(RecipeListAdmin):
+    counter_field = "cart_count"
+
+    def on_add(self, obj):
+        super().on_add(obj)
+        add_to_cart_totals(obj.user_id, [obj.recipe_id])
+
+    def on_remove(self, user_id, recipe_id):
+        super().on_remove(user_id, recipe_id)
+        remove_from_cart_totals(user_id, [recipe_id])
+
+
+class CartIngredientTotalAdmin(admin.ModelAdmin):
+    list_display = ["user", "ingredient", "amount"]
+    list_select_related = ["user", "ingredient"]
+    search_fields = ["user__username"]
+    readonly_fields = ["user", "ingredient", "amount"]
+
+
+class ShoppingCartPDFAdmin(admin.ModelAdmin):
+    list_display = ["user", "status", "created_at"]
+    list_filter = ["status"]
+    readonly_fields = ["cart_hash", "created_at", "updated_at"]
 
 
 admin.site.register(MeasurementUnit, MeasurementUnitAdmin)
@@ -69,3 +204,5 @@ admin.site.register(RecipeTag, RecipeTagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeFavorite, RecipeFavoriteAdmin)
 admin.site.register(RecipeCart, RecipeCartAdmin)
+admin.site.register(CartIngredientTotal, CartIngredientTotalAdmin)
+admin.site.register(ShoppingCartPDF, ShoppingCartPDFAdmin)
@@ -0,0 +1,106 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from ..core.cache import (
+    bump_version,
+    get_or_render,
+    get_version,
+    versioned_key,
+)
+from .models import RecipeTag
+
+CATALOG_NAMESPACE = "recipes:catalog"
+RECIPES_NAMESPACE = "recipes:anonymous"
+
+# Anonymous recipes pages are cached only for these query params. Others
+# (e.g. search) have too many values to be worth caching.
+RECIPES_CACHE_PARAMS = {
+    "page",
+    "limit",
+    "tags",
+    "tags_mode",
+    "author",
+    "image_variants",
+}
+
+
+def bump_catalog_version(**kwargs):
+    """
+    Signal receiver. Outdates cached ingredients and tags lists (and the
+    tags ids map) once the transaction is committed, so lists rendered
+    before commit from old data are not cached under the new version.
+    """
+    transaction.on_commit(partial(bump_version, CATALOG_NAMESPACE))
+
+
+def get_catalog(name, queryset, serializer_class):
+    """
+    Returns '(content, etag)' of the whole catalog list (ingredients or
+    tags) rendered to JSON. The list is rendered once per catalog version.
+    """
+
+    def render():
+        serializer = serializer_class(queryset, many=True)
+        return JSONRenderer().render(serializer.data)
+
+    key = versioned_key(CATALOG_NAMESPACE, name)
+    return get_or_render(key, render, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+
+def get_tags_ids():
+    """Returns '{slug: id}' map of all the tags. Cached per catalog version."""
+    key = versioned_key(CATALOG_NAMESPACE, "tags_ids")
+    tags_ids = cache.get(key)
+    if tags_ids is None:
+        tags_ids = dict(RecipeTag.objects.values_list("slug", "id"))
+        cache.set(key, tags_ids, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return tags_ids
+
+
+def bump_recipes_version(**kwargs):
+    """
+    Signal receiver. Outdates cached anonymous recipes pages once the
+    transaction is committed, so pages rendered before commit from old
+    data are not left in cache.
+    """
+    transaction.on_commit(partial(bump_version, RECIPES_NAMESPACE))
+
+
+def _get_request_digest(request, *parts):
+    """
+    Returns digest of request URL with normalized query params (their order
+    and the order of values don't matter) and 'parts'. Responses have
+    absolute URLs, so the digest depends on the host as well.
+    """
+    query_params = request.query_params
+    normalized = sorted(
+        (name, sorted(query_params.getlist(name))) for name in query_params
+    )
+    url = f"{request.scheme}://{request.get_host()}{request.path}"
+    return hashlib.md5(repr((url, normalized, parts)).encode()).hexdigest()
+
+
+def get_recipes_cache_key(request, *parts):
+    """
+    Returns cache key of anonymous recipes response or None if the request
+    can't be cached.
+    """
+    if not set(request.query_params) <= RECIPES_CACHE_PARAMS:
+        return None
+    digest = _get_request_digest(request)
+    return versioned_key(RECIPES_NAMESPACE, *parts, digest)
+
+
+def get_recipes_etag(request, *validators):
+    """
+    Returns ETag of recipes response. It changes with the request, with
+    'validators' and with any change of data recipes are rendered from
+    (the version is bumped by signals).
+    """
+    version = get_version(RECIPES_NAMESPACE)
+    return _get_request_digest(request, version, *validators)
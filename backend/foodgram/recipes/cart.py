@@ -0,0 +1,192 @@
+"""
+Maintenance of 'CartIngredientTotal' table, the aggregated shopping lists.
+
+Every change of 'RecipeCart' objects or of ingredients of a recipe which
+is in somebody's cart should be followed by a call of one of these
+functions in the same transaction.
+
+Changes of a recipe's carts and of its ingredients are serialized on the
+recipe's row (see 'lock_recipes'). Otherwise a cart addition could read
+the old amounts of a recipe while its update, which doesn't see the new
+uncommitted cart row yet, applies the difference to other carts only.
+"""
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from ..core.utils import chunked, lock_rows
+from .models import CartIngredientTotal, Recipe, RecipeCart, RecipeIngredient
+
+USERS_CHUNK_SIZE = 500
+
+
+def lock_recipes(recipe_ids):
+    """
+    Locks rows of the recipes until the end of the transaction. Must be
+    called before the recipes' amounts or carts are read. The callers
+    write before reading, so SQLite's database lock is enough there.
+    """
+    lock_rows(Recipe.objects.filter(id__in=recipe_ids))
+
+
+def get_recipes_amounts(recipe_ids):
+    """Returns {ingredient_id: amount} summed over recipes 'recipe_ids'."""
+    queryset = (
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .order_by()
+        .values("ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("ingredient_id", "total")
+    )
+    return dict(queryset)
+
+
+def change_cart_totals(user_ids, amounts, sign=1):
+    """
+    Adds (or subtracts with 'sign' = -1) 'amounts' ({ingredient_id:
+    amount}) to the shopping lists of users 'user_ids'. Rows are changed
+    by 'UPDATE ... SET amount = amount + ...', so concurrent changes of the
+    same list don't override each other.
+    """
+    amounts = {
+        ingredient_id: amount * sign
+        for ingredient_id, amount in amounts.items()
+        if amount
+    }
+    if not amounts or not user_ids:
+        return
+
+    increased = [
+        ingredient_id
+        for ingredient_id, amount in amounts.items()
+        if amount > 0
+    ]
+    delta = Case(
+        *(
+            When(ingredient_id=ingredient_id, then=Value(amount))
+            for ingredient_id, amount in amounts.items()
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    for users in chunked(user_ids, USERS_CHUNK_SIZE):
+        CartIngredientTotal.objects.bulk_create(
+            (
+                CartIngredientTotal(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0
+                )
+                for user_id in users
+                for ingredient_id in increased
+            ),
+            ignore_conflicts=True,
+        )
+        totals = CartIngredientTotal.objects.filter(
+            user_id__in=users, ingredient_id__in=amounts
+        )
+        totals.update(amount=F("amount") + delta)
+        if len(increased) < len(amounts):
+            totals.filter(amount__lte=0).delete()
+
+
+def add_to_cart_totals(user_id, recipe_ids):
+    """Recipes 'recipe_ids' were added to the user's cart."""
+    lock_recipes(recipe_ids)
+    change_cart_totals([user_id], get_recipes_amounts(recipe_ids))
+
+
+def remove_from_cart_totals(user_id, recipe_ids):
+    """Recipes 'recipe_ids' were removed from the user's cart."""
+    lock_recipes(recipe_ids)
+    change_cart_totals([user_id], get_recipes_amounts(recipe_ids), sign=-1)
+
+
+def get_cart_user_ids(recipe_id):
+    return list(
+        RecipeCart.objects.filter(recipe_id=recipe_id).values_list(
+            "user_id", flat=True
+        )
+    )
+
+
+def update_recipe_in_cart_totals(recipe_id, old_amounts, new_amounts):
+    """
+    Ingredients of the recipe were changed from 'old_amounts' to
+    'new_amounts'. Applies the difference to all carts with the recipe.
+    The recipe must be locked before 'old_amounts' are read.
+    """
+    delta = {
+        ingredient_id: new_amounts.get(ingredient_id, 0)
+        - old_amounts.get(ingredient_id, 0)
+        for ingredient_id in {*old_amounts, *new_amounts}
+    }
+    if any(delta.values()):
+        change_cart_totals(get_cart_user_ids(recipe_id), delta)
+
+
+def delete_recipe_from_cart_totals(recipe_id):
+    """The recipe is going to be deleted with all its 'RecipeCart' rows."""
+    lock_recipes([recipe_id])
+    user_ids = get_cart_user_ids(recipe_id)
+    if user_ids:
+        amounts = get_recipes_amounts([recipe_id])
+        change_cart_totals(user_ids, amounts, sign=-1)
+
+
+def get_actual_cart_totals(user_ids):
+    """
+    Calculates shopping lists of users 'user_ids' from 'RecipeCart' and
+    'RecipeIngredient'. Returns {(user_id, ingredient_id): amount}.
+    """
+    queryset = (
+        RecipeIngredient.objects.filter(recipe__cart__user_id__in=user_ids)
+        .order_by()
+        .values("recipe__cart__user_id", "ingredient_id")
+        .annotate(total=Sum("amount"))
+        .values_list("recipe__cart__user_id", "ingredient_id", "total")
+    )
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset
+    }
+
+
+def get_stored_cart_totals(user_ids):
+    """Returns {(user_id, ingredient_id): amount} from the table."""
+    queryset = CartIngredientTotal.objects.filter(
+        user_id__in=user_ids
+    ).values_list("user_id", "ingredient_id", "amount")
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in queryset
+    }
+
+
+def get_cart_totals_user_ids():
+    """Returns ids of all users who have a cart or a stored list."""
+    cart_users = RecipeCart.objects.values_list("user_id", flat=True)
+    totals_users = CartIngredientTotal.objects.values_list(
+        "user_id", flat=True
+    )
+    return sorted(set(cart_users) | set(totals_users))
+
+
+def find_inconsistent_cart_totals(user_ids):
+    """Returns ids of users whose stored list differs from the actual."""
+    inconsistent = set()
+    for users in chunked(user_ids, USERS_CHUNK_SIZE):
+        actual = get_actual_cart_totals(users)
+        stored = get_stored_cart_totals(users)
+        differences = actual.items() ^ stored.items()
+        inconsistent.update(user_id for (user_id, _), _ in differences)
+    return sorted(inconsistent)
+
+
+def rebuild_cart_totals(user_ids):
+    """Replaces stored lists of users 'user_ids' with actual ones."""
+    for users in chunked(user_ids, USERS_CHUNK_SIZE):
+        actual = get_actual_cart_totals(users)
+        CartIngredientTotal.objects.filter(user_id__in=users).delete()
+        CartIngredientTotal.objects.bulk_create(
+            CartIngredientTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for (user_id, ingredient_id), amount in actual.items()
+        )
@@ -0,0 +1,83 @@
+import csv
+import json
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+from .models import CartIngredientTotal
+
+CART_FIELDS = (
+    "ingredient__name",
+    "ingredient__measurement_unit__name",
+    "amount",
+)
+
+
+def iter_cart_rows(user):
+    """
+    Returns iterator of '(name, measurement_unit, amount)' tuples of the
+    user's shopping list. Rows are read from the precomputed
+    'CartIngredientTotal' table and fetched in chunks.
+    """
+    queryset = CartIngredientTotal.objects.filter(user=user).order_by(
+        "ingredient__name"
+    )
+    return queryset.values_list(*CART_FIELDS).iterator()
+
+
+class Echo:
+    """File-like object that returns written value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def txt_lines(rows):
+    for number, (name, measurement_unit, amount) in enumerate(rows, 1):
+        yield f"{number}. {name[:1].upper()}{name[1:]} — {amount} "
+        yield f"{measurement_unit}\n"
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(["name", "measurement_unit", "amount"])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def json_lines(rows):
+    yield "["
+    for number, (name, measurement_unit, amount) in enumerate(rows):
+        row = {
+            "name": name,
+            "measurement_unit": measurement_unit,
+            "amount": amount,
+        }
+        yield ("," if number else "") + json.dumps(row, ensure_ascii=False)
+    yield "]"
+
+
+EXPORT_FORMATS = {
+    "txt": (txt_lines, "text/plain; charset=utf-8", "cart.txt"),
+    "csv": (csv_lines, "text/csv; charset=utf-8", "cart.csv"),
+    "json": (json_lines, "application/json", "cart.json"),
+}
+
+
+def stream_cart(rows, export_format):
+    """
+    Returns response that writes shopping list 'rows' in 'export_format'
+    (one of 'EXPORT_FORMATS') row by row without rendering templates.
+    Returns None if there are no rows.
+    """
+    first_row = next(rows, None)
+    if first_row is None:
+        return None
+
+    lines, content_type, filename = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        lines(chain([first_row], rows)),
+        content_type=content_type,
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
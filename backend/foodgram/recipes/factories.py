@@ -5,7 +5,8 @@ import factory
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 
-from ..core.utils import cyrillic_slugify
+from ..core.utils import chunked, cyrillic_slugify
+from .cart import add_to_cart_totals
 from .models import (
     Ingredient,
     MeasurementUnit,
@@ -29,6 +30,107 @@ def add_ingredients(recipe, ingredients):
         )
 
 
+def bulk_create_recipes(amount, authors, batch_size=5000):
+    """
+    Fast creation of many recipes for benchmarks. Recipes share one image
+    path and don't have tags and ingredients.
+    Returns list of created recipes ids.
+    """
+    authors_ids = [author.id for author in authors]
+    recipes = (
+        Recipe(
+            author_id=authors_ids[number % len(authors_ids)],
+            name=f"Рецепт {number}",
+            image="recipes/images/benchmark.png",
+            text=f"Описание рецепта {number}",
+            cooking_time=number % 50 + 1,
+        )
+        for number in range(amount)
+    )
+    for batch in chunked(recipes, batch_size):
+        Recipe.objects.bulk_create(batch)
+    return list(
+        Recipe.objects.filter(author_id__in=authors_ids).values_list(
+            "id", flat=True
+        )
+    )
+
+
+def bulk_create_user_recipe_objects(
+    model, amount, users, recipes_ids, batch_size=10000
+):
+    """
+    Fast creation of 'RecipeFavorite' or 'RecipeCart' objects. They are
+    spread evenly among users, every user gets unique random recipes.
+    """
+    per_user = min(amount // len(users), len(recipes_ids))
+    objects = (
+        model(user_id=user.id, recipe_id=recipe_id)
+        for user in users
+        for recipe_id in random.sample(recipes_ids, per_user)
+    )
+    for batch in chunked(objects, batch_size):
+        model.objects.bulk_create(batch)
+
+
+def bulk_create_catalog(ingredients_amount, tags_amount=3):
+    """
+    Fast creation of ingredients with one measurement unit and tags for
+    benchmarks. Returns '(ingredients_ids, tags_ids)'.
+    """
+    unit, _ = MeasurementUnit.objects.get_or_create(name="benchmark_unit")
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f"ингредиент {number}", measurement_unit=unit)
+        for number in range(ingredients_amount)
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(
+            name=f"benchmark {number}",
+            color="#000000",
+            slug=f"benchmark-{number}",
+        )
+        for number in range(tags_amount)
+    )
+    ingredients_ids = Ingredient.objects.filter(
+        measurement_unit=unit
+    ).values_list("id", flat=True)
+    tags_ids = RecipeTag.objects.filter(
+        slug__startswith="benchmark-"
+    ).values_list("id", flat=True)
+    return list(ingredients_ids), list(tags_ids)
+
+
+def bulk_add_ingredients(
+    recipes_ids, ingredients_ids, per_recipe, batch_size=10000
+):
+    """Adds 'per_recipe' random ingredients to every recipe."""
+    per_recipe = min(per_recipe, len(ingredients_ids))
+    objects = (
+        RecipeIngredient(
+            recipe_id=recipe_id,
+            ingredient_id=ingredient_id,
+            amount=random.randint(1, 50),
+        )
+        for recipe_id in recipes_ids
+        for ingredient_id in random.sample(ingredients_ids, per_recipe)
+    )
+    for batch in chunked(objects, batch_size):
+        RecipeIngredient.objects.bulk_create(batch)
+
+
+def bulk_add_tags(recipes_ids, tags_ids, per_recipe, batch_size=10000):
+    """Adds 'per_recipe' random tags to every recipe."""
+    per_recipe = min(per_recipe, len(tags_ids))
+    RecipeTags = Recipe.tags.through
+    objects = (
+        RecipeTags(recipe_id=recipe_id, recipetag_id=tag_id)
+        for recipe_id in recipes_ids
+        for tag_id in random.sample(tags_ids, per_recipe)
+    )
+    for batch in chunked(objects, batch_size):
+        RecipeTags.objects.bulk_create(batch)
+
+
 class MeasurementUnitFactory(factory.django.DjangoModelFactory):
     class Meta:
         model = MeasurementUnit
@@ -136,7 +238,10 @@ class RecipeFactory(factory.django.DjangoModelFactory):
 
 
 class RecipeCartFactory(factory.django.DjangoModelFactory):
-    """Relates on User on Recipe objects. Be sure there are enough in DB."""
+    """
+    Relates on User on Recipe objects. Be sure there are enough in DB.
+    Adds recipe's ingredients to the user's shopping list.
+    """
 
     class Meta:
         model = RecipeCart
@@ -145,6 +250,16 @@ class RecipeCartFactory(factory.django.DjangoModelFactory):
     user = factory.Iterator(User.objects.all())
     recipe = factory.Iterator(Recipe.objects.all())
 
+    @classmethod
+    def _create(cls, model_class, *args, **kwargs):
+        is_new = not model_class.objects.filter(
+            user=kwargs["user"], recipe=kwargs["recipe"]
+        ).exists()
+        cart = super()._create(model_class, *args, **kwargs)
+        if is_new:
+            add_to_cart_totals(cart.user_id, [cart.recipe_id])
+        return cart
+
 
 class RecipeFavoriteFactory(factory.django.DjangoModelFactory):
     """Relates on User on Recipe objects. Be sure there are enough in DB."""
@@ -0,0 +1,141 @@
+"""
+Feed of recipes of followed authors.
+
+Recipes are written to followers' timelines ('FeedEntry') when they are
+created (fan-out on write) and the latest recipes of an author are copied
+when the author is followed. Recipes of authors with more than
+FEED_FANOUT_MAX_FOLLOWERS followers are not fanned out: they are read from
+recipes table when the feed is read (fan-out on read), like recipes that
+are not fanned out yet.
+"""
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from ..core.utils import chunked
+from ..users.models import UserSubscription
+from .models import FeedEntry, Recipe
+
+
+def fan_out_recipe(recipe_id):
+    """
+    Background task: adds the new recipe to the feeds of the author's
+    followers. Entries are written in batches of FEED_FANOUT_BATCH_SIZE,
+    each in its own transaction, so no long transaction is kept.
+    """
+    recipe = (
+        Recipe.objects.filter(id=recipe_id)
+        .only("id", "author_id", "pub_date")
+        .first()
+    )
+    if recipe is None:
+        return
+    followers_ids = UserSubscription.objects.filter(
+        following_id=recipe.author_id
+    ).values_list("follower_id", flat=True)
+    if followers_ids.count() > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    for batch in chunked(followers_ids.iterator(), batch_size):
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create(
+                (
+                    FeedEntry(
+                        follower_id=follower_id,
+                        recipe_id=recipe.id,
+                        author_id=recipe.author_id,
+                        pub_date=recipe.pub_date,
+                    )
+                    for follower_id in batch
+                ),
+                ignore_conflicts=True,
+            )
+    Recipe.objects.filter(id=recipe.id).update(feed_fanout=True)
+
+
+def backfill_feed(follower_id, authors_ids):
+    """
+    Adds the latest FEED_BACKFILL_SIZE recipes of newly followed authors
+    to the follower's feed. Older recipes are not added.
+    """
+    recipes = Recipe.ext_objects.latest_by_authors(
+        authors_ids, settings.FEED_BACKFILL_SIZE
+    ).values_list("id", "author_id", "pub_date")
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                follower_id=follower_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, author_id, pub_date in recipes
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def remove_from_feed(follower_id, authors_ids):
+    """Removes recipes of unfollowed authors from the follower's feed."""
+    FeedEntry.objects.filter(
+        follower_id=follower_id, author_id__in=authors_ids
+    ).delete()
+
+
+def encode_cursor(pub_date, recipe_id):
+    value = f"{pub_date.isoformat()}|{recipe_id}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns '(pub_date, recipe_id)' position from the cursor. Raises
+    ValueError for a broken cursor.
+    """
+    value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    pub_date, recipe_id = value.split("|")
+    return datetime.fromisoformat(pub_date), int(recipe_id)
+
+
+def _after(pub_date, recipe_id, id_field):
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f"{id_field}__lt": recipe_id}
+    )
+
+
+def get_feed_page(follower_id, following_ids, size, after=None):
+    """
+    Returns '(recipes_ids, next_position)' of the feed page: 'size' recipes
+    newer first after the 'after' position ('(pub_date, recipe_id)').
+    The page is merged from two keyset queries: follower's timeline and
+    not fanned out recipes of followed authors. Both are backed by
+    indexes, no 'OFFSET' and 'COUNT(*)' are used.
+    """
+    entries = FeedEntry.objects.filter(follower_id=follower_id)
+    not_fanned_out = Recipe.objects.filter(
+        author_id__in=following_ids, feed_fanout=False
+    )
+    if after is not None:
+        entries = entries.filter(_after(*after, "recipe_id"))
+        not_fanned_out = not_fanned_out.filter(_after(*after, "id"))
+
+    # A recipe can be in both while it's being fanned out
+    positions = set(
+        entries.order_by("-pub_date", "-recipe_id").values_list(
+            "pub_date", "recipe_id"
+        )[: size + 1]
+    )
+    if following_ids:
+        positions.update(
+            not_fanned_out.order_by("-pub_date", "-id").values_list(
+                "pub_date", "id"
+            )[: size + 1]
+        )
+    positions = sorted(positions, reverse=True)
+
+    next_position = positions[size - 1] if len(positions) > size else None
+    return [recipe_id for _, recipe_id in positions[:size]], next_position
@@ -1,51 +1,153 @@
-from django.db.models import Case, Q, Value, When
+from django import forms
+from django.conf import settings
 from django_filters import rest_framework as filters
 
-from .models import Recipe, RecipeTag
+from .cache import get_tags_ids
+from .models import Recipe
+from .search import (
+    search_ingredients,
+    search_recipes,
+    search_recipes_by_ingredients,
+)
 
 
 class IngredientFilter(filters.FilterSet):
     """
     Filter ingredients with 'name' in it's name.
     It also reorders the queryset. Ingredients that starts with 'name' are
-    listed first.
+    listed first, others are ordered by similarity to 'name'.
+    The number of found ingredients is limited with 'limit' or
+    INGREDIENTS_SEARCH_LIMIT setting.
     """
 
     name = filters.CharFilter(method="name_filter")
+    limit = filters.NumberFilter(method="limit_filter", min_value=1)
 
     def name_filter(self, queryset, name, value):
-        qs = queryset.filter(Q(name__icontains=value))
-        qs = qs.annotate(
-            name_startswith=Case(
-                When(
-                    Q(name__istartswith=value),
-                    then=Value(True),
-                ),
-                default=Value(False),
-            ),
-        )
-        return qs.order_by("-name_startswith")
+        limit = self.form.cleaned_data.get("limit")
+        limit = int(limit) if limit else settings.INGREDIENTS_SEARCH_LIMIT
+        return search_ingredients(queryset, value, limit=limit)
+
+    def limit_filter(self, queryset, name, value):
+        """The value is used by 'name_filter'."""
+        return queryset
+
+
+def get_tags_choices():
+    return [(slug, slug) for slug in get_tags_ids()]
+
+
+class IntegerFilter(filters.NumberFilter):
+    """NumberFilter rejecting fractional values instead of truncating."""
+
+    field_class = forms.IntegerField
+
+
+class IntegerInFilter(filters.BaseInFilter, IntegerFilter):
+    pass
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        queryset=RecipeTag.objects.all(),
-        to_field_name="slug",
+    """
+    Recipes are filtered by tag slugs ('tags=lunch&tags=dinner') with any
+    of the tags or with all of them if 'tags_mode=all'.
+
+    Besides the simple filters, recipes can be searched by words in their
+    names and texts ('search') and by ingredients the user has
+    ('ingredients=1,2,3'). The ingredients match mode is set with
+    'ingredients_mode':
+        all - recipe has every ingredient from the list;
+        any - recipe has at least one of them (default);
+        at_least_n - recipe has at least 'ingredients_min' of them.
+    Recipes found by ingredients are ordered by the share of their
+    ingredients that are in the list.
+    """
+
+    TAGS_MODE_ALL = "all"
+    TAGS_MODE_ANY = "any"
+    TAGS_MODES = (
+        (TAGS_MODE_ALL, "Все теги"),
+        (TAGS_MODE_ANY, "Любой из тегов"),
+    )
+
+    INGREDIENTS_MODE_ALL = "all"
+    INGREDIENTS_MODE_ANY = "any"
+    INGREDIENTS_MODE_AT_LEAST_N = "at_least_n"
+    INGREDIENTS_MODES = (
+        (INGREDIENTS_MODE_ALL, "Все ингредиенты"),
+        (INGREDIENTS_MODE_ANY, "Любой из ингредиентов"),
+        (INGREDIENTS_MODE_AT_LEAST_N, "Не меньше N ингредиентов"),
+    )
+
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tags_choices, method="tags_filter"
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=TAGS_MODES, method="tags_mode_filter"
     )
     is_favorited = filters.BooleanFilter(method="is_favorited_filter")
     is_in_shopping_cart = filters.BooleanFilter(
         method="is_in_shopping_cart_filter"
     )
+    search = filters.CharFilter(method="search_filter")
+    ingredients = IntegerInFilter(method="ingredients_filter")
+    ingredients_mode = filters.ChoiceFilter(
+        choices=INGREDIENTS_MODES, method="ingredients_options_filter"
+    )
+    ingredients_min = IntegerFilter(
+        min_value=1, method="ingredients_options_filter"
+    )
+
+    def _get_user(self):
+        user = getattr(self.request, "user", None)
+        if user is None or not user.is_authenticated:
+            return None
+        return user
+
+    def tags_filter(self, queryset, name, value):
+        tags_ids = get_tags_ids()
+        match_all = (
+            self.form.cleaned_data.get("tags_mode") == self.TAGS_MODE_ALL
+        )
+        return queryset.tagged(
+            [tags_ids[slug] for slug in value if slug in tags_ids],
+            match_all=match_all,
+        )
+
+    def tags_mode_filter(self, queryset, name, value):
+        """The value is used by 'tags_filter'."""
+        return queryset
 
     def is_favorited_filter(self, queryset, name, value):
+        if "is_favorited" not in queryset.query.annotations:
+            queryset = queryset.with_favorites(user=self._get_user())
         qs = queryset.filter(is_favorited=value)
         return qs
 
     def is_in_shopping_cart_filter(self, queryset, name, value):
+        if "is_in_shopping_cart" not in queryset.query.annotations:
+            queryset = queryset.with_shopping_cart(user=self._get_user())
         qs = queryset.filter(is_in_shopping_cart=value)
         return qs
 
+    def search_filter(self, queryset, name, value):
+        """Full-text search, the most relevant recipes go first."""
+        return search_recipes(queryset, value)
+
+    def ingredients_filter(self, queryset, name, value):
+        mode = self.form.cleaned_data.get("ingredients_mode")
+        if mode == self.INGREDIENTS_MODE_ALL:
+            min_matches = len(set(value))
+        elif mode == self.INGREDIENTS_MODE_AT_LEAST_N:
+            min_matches = self.form.cleaned_data.get("ingredients_min") or 1
+        else:
+            min_matches = 1
+        return search_recipes_by_ingredients(queryset, value, min_matches)
+
+    def ingredients_options_filter(self, queryset, name, value):
+        """The values are used by 'ingredients_filter'."""
+        return queryset
+
     class Meta:
         model = Recipe
         fields = {
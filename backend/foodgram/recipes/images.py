@@ -0,0 +1,210 @@
+import os
+import time
+from io import BytesIO
+from pathlib import PurePath, PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_recipes_version
+from .models import Recipe
+
+IMAGE_FIELD = Recipe._meta.get_field("image")
+VARIANTS_DIR = "recipes/images/variants"
+
+
+def _save_options(image_format):
+    if image_format == "JPEG":
+        return {
+            "quality": settings.RECIPE_IMAGE_QUALITY,
+            "optimize": True,
+            "progressive": True,
+        }
+    if image_format == "WEBP":
+        return {"quality": settings.RECIPE_IMAGE_QUALITY, "method": 4}
+    return {"optimize": True}
+
+
+def _encode(image, image_format):
+    content = BytesIO()
+    image.save(content, format=image_format, **_save_options(image_format))
+    return ContentFile(content.getvalue())
+
+
+def store_recipe_image(image):
+    """
+    Saves decoded and validated uploaded 'image' to the storage and returns
+    its name. It is used before a transaction is opened, so no transaction
+    is kept open during file writing. The storage deduplicates files, so
+    the file is not deleted if the transaction fails: it may be shared.
+    Files left unreferenced are deleted by 'delete_orphan_images'.
+    """
+    filename = IMAGE_FIELD.generate_filename(None, image.name)
+    return IMAGE_FIELD.storage.save(filename, image)
+
+
+def needs_downscale(name):
+    """
+    Large images have to be downscaled. GIF images are never downscaled,
+    their animation would be lost.
+    """
+    storage = IMAGE_FIELD.storage
+    with storage.open(name) as file, Image.open(file) as image:
+        if image.format == "GIF":
+            return False
+        return (
+            storage.size(name) > settings.RECIPE_IMAGE_PROCESS_MIN_SIZE
+            or max(image.size) > settings.RECIPE_IMAGE_MAX_SIDE
+        )
+
+
+def optimize_image(name):
+    """
+    Returns content of the stored image downscaled to RECIPE_IMAGE_MAX_SIDE
+    and re-encoded in the same format.
+    """
+    with IMAGE_FIELD.storage.open(name) as file:
+        image = Image.open(file)
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        max_side = settings.RECIPE_IMAGE_MAX_SIDE
+        image.thumbnail((max_side, max_side))
+        return _encode(image, image_format)
+
+
+def build_image_variants(name):
+    """
+    Makes copies of the stored image of every RECIPE_IMAGE_VARIANT_WIDTHS
+    width that is less than the image width: in JPEG (PNG if the image is
+    transparent) and in WebP. Returns list of
+    '{"width": ..., "image": name, "webp": name}'.
+    It doesn't use database, so it can be run in other processes.
+    """
+    storage = IMAGE_FIELD.storage
+    stem = PurePosixPath(name).stem
+    variants = []
+    with storage.open(name) as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            image, image_format, extension = (
+                image.convert("RGBA"),
+                "PNG",
+                "png",
+            )
+        else:
+            image, image_format, extension = (
+                image.convert("RGB"),
+                "JPEG",
+                "jpg",
+            )
+
+        for width in sorted(settings.RECIPE_IMAGE_VARIANT_WIDTHS):
+            if width >= image.width:
+                break
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            prefix = f"{VARIANTS_DIR}/{stem}_{width}w"
+            variants.append(
+                {
+                    "width": width,
+                    "image": storage.save(
+                        f"{prefix}.{extension}", _encode(resized, image_format)
+                    ),
+                    "webp": storage.save(
+                        f"{prefix}.webp", _encode(resized, "WEBP")
+                    ),
+                }
+            )
+    return variants
+
+
+def process_recipe_image(recipe_id, name):
+    """
+    Background task for the recipe's pending image 'name': downscales a
+    large image and makes its variants. If the recipe has got another
+    image meanwhile, the results are thrown away. Replaced files are left
+    for 'delete_orphan_images'.
+    """
+    recipes = Recipe.objects.filter(id=recipe_id, image=name)
+    try:
+        if needs_downscale(name):
+            # The stored name is already hashed, the new file gets its own
+            # hash directory under 'upload_to'
+            filename = IMAGE_FIELD.generate_filename(
+                None, PurePosixPath(name).name
+            )
+            name = IMAGE_FIELD.storage.save(filename, optimize_image(name))
+        variants = build_image_variants(name)
+    except (OSError, ValueError):
+        recipes.update(image_status=Recipe.IMAGE_FAILED)
+        return
+
+    updated = recipes.update(
+        image=name,
+        image_variants=variants,
+        image_status=Recipe.IMAGE_READY,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        bump_recipes_version()
+
+
+def get_referenced_images():
+    """Returns names of all recipe images and their variants."""
+    names = set()
+    rows = Recipe.objects.values_list("image", "image_variants")
+    for image, variants in rows.iterator():
+        names.add(image)
+        for variant in variants:
+            names.add(variant["image"])
+            names.add(variant["webp"])
+    return names
+
+
+def find_orphan_images(min_age):
+    """
+    Walks over recipe images directory and returns '(name, size)' of files
+    that are older than 'min_age' seconds and not referenced by recipes.
+    Fresh files may belong to not committed recipes.
+    """
+    storage = IMAGE_FIELD.storage
+    upload_to = IMAGE_FIELD.upload_to.rstrip("/")
+    root = storage.path(upload_to)
+    modified_before = time.time() - min_age
+
+    candidates = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            stat = os.stat(path)
+            if stat.st_mtime < modified_before:
+                name = os.path.relpath(path, storage.location)
+                candidates.append((PurePath(name).as_posix(), stat.st_size))
+
+    # References are read after the walk: files referenced meanwhile are
+    # kept
+    referenced = get_referenced_images()
+    return [
+        (name, size) for name, size in candidates if name not in referenced
+    ]
+
+
+def delete_orphan_images(orphans, min_age):
+    """
+    Deletes found orphan files. A file that has been stored again after
+    it was found (see 'ContentHashStorage.save') is kept.
+    """
+    storage = IMAGE_FIELD.storage
+    modified_before = time.time() - min_age
+    deleted = []
+    for name, size in orphans:
+        try:
+            if os.stat(storage.path(name)).st_mtime >= modified_before:
+                continue
+        except FileNotFoundError:
+            continue
+        storage.delete(name)
+        deleted.append((name, size))
+    return deleted
@@ -0,0 +1,180 @@
+import random
+from collections import defaultdict
+from itertools import count
+from typing import Any, Dict
+
+from django.conf import settings
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....core.utils import chunked
+from ....users.factories import bulk_create_users
+from ....users.models import UserSubscription
+from ...factories import bulk_create_recipes
+from ...feed import fan_out_recipe, get_feed_page
+from ...models import FeedEntry, Recipe
+
+
+def per_author_requests(following_ids, size):
+    """How clients build the feed now: '?author=' request per author."""
+    recipes = []
+    for author_id in following_ids:
+        recipes.extend(Recipe.objects.filter(author_id=author_id)[:size])
+    recipes.sort(key=lambda recipe: (recipe.pub_date, recipe.id))
+    return recipes[-size:]
+
+
+def fan_out_on_read(following_ids, size, page):
+    recipes = Recipe.objects.filter(author_id__in=following_ids)
+    return list(recipes[page * size : (page + 1) * size])
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку (p50/p95) получения страницы ленты подписок: "
+        "запрос на каждого автора, один запрос по авторам (fan-out on "
+        "read) и лента подписчика (fan-out on write). Замеряет и запись "
+        "нового рецепта в ленты подписчиков. "
+        "Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--authors", type=int, default=1000)
+        parser.add_argument("--readers", type=int, default=1000)
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=100,
+            help="На сколько авторов подписан каждый читатель.",
+        )
+        parser.add_argument("--author-recipes", type=int, default=10)
+        parser.add_argument(
+            "--popular",
+            type=int,
+            default=10,
+            help="Сколько авторов не раздают рецепты в ленты.",
+        )
+        parser.add_argument("--pages", type=int, default=5)
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+        )
+
+    def seed(self, **options: Any) -> None:
+        authors = bulk_create_users(options["authors"], prefix="bench_author")
+        readers = bulk_create_users(options["readers"], prefix="bench_reader")
+        authors_ids = [author.id for author in authors]
+        self.following = {}
+        followers = defaultdict(list)
+        for reader in readers:
+            following_ids = random.sample(authors_ids, options["follows"])
+            self.following[reader.id] = following_ids
+            for author_id in following_ids:
+                followers[author_id].append(reader.id)
+        subscriptions = (
+            UserSubscription(follower_id=follower_id, following_id=author_id)
+            for author_id, followers_ids in followers.items()
+            for follower_id in followers_ids
+        )
+        for batch in chunked(subscriptions, 10000):
+            UserSubscription.objects.bulk_create(batch)
+
+        recipes_ids = bulk_create_recipes(
+            options["authors"] * options["author_recipes"], authors
+        )
+        popular_ids = set(authors_ids[: options["popular"]])
+        recipes = Recipe.objects.filter(id__in=recipes_ids).exclude(
+            author_id__in=popular_ids
+        )
+        entries = (
+            FeedEntry(
+                follower_id=follower_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for recipe_id, author_id, pub_date in recipes.values_list(
+                "id", "author_id", "pub_date"
+            ).iterator()
+            for follower_id in followers[author_id]
+        )
+        for batch in chunked(entries, 10000):
+            FeedEntry.objects.bulk_create(batch)
+        recipes.update(feed_fanout=True)
+        self.fan_out_author = authors[-1]
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        size = options["page_size"]
+        pages = options["pages"]
+        readers_ids = list(self.following)
+
+        # Cursors of the deep page are got beforehand, as clients have them
+        deep_positions = {}
+        for reader_id in random.sample(readers_ids, min(len(readers_ids), 20)):
+            after = None
+            for _ in range(pages):
+                _, after = get_feed_page(
+                    reader_id, self.following[reader_id], size, after=after
+                )
+            deep_positions[reader_id] = after
+
+        def timeline(deep):
+            if deep:
+                reader_id = random.choice(list(deep_positions))
+                after = deep_positions[reader_id]
+            else:
+                reader_id, after = random.choice(readers_ids), None
+            recipes_ids, _ = get_feed_page(
+                reader_id, self.following[reader_id], size, after=after
+            )
+            return list(Recipe.objects.filter(id__in=recipes_ids))
+
+        def on_read(deep):
+            following_ids = self.following[random.choice(readers_ids)]
+            return fan_out_on_read(following_ids, size, pages if deep else 0)
+
+        def per_author():
+            following_ids = self.following[random.choice(readers_ids)]
+            return per_author_requests(following_ids, size)
+
+        numbers = count()
+
+        def write():
+            recipe = Recipe.objects.create(
+                author=self.fan_out_author,
+                name=f"Новый рецепт {next(numbers)}",
+                image="recipes/images/benchmark.png",
+                text="Описание",
+                cooking_time=1,
+            )
+            fan_out_recipe(recipe.id)
+
+        repeat = options["repeat"]
+        return {
+            "feed_entries": FeedEntry.objects.count(),
+            "recipes": Recipe.objects.count(),
+            "follows": options["follows"],
+            "page_size": size,
+            "first_page": {
+                "per_author_requests": measure(per_author, repeat=repeat),
+                "fan_out_on_read": measure(
+                    lambda: on_read(False), repeat=repeat
+                ),
+                "timeline": measure(lambda: timeline(False), repeat=repeat),
+            },
+            f"page_{pages + 1}": {
+                "fan_out_on_read": measure(
+                    lambda: on_read(True), repeat=repeat
+                ),
+                "timeline_cursor": measure(
+                    lambda: timeline(True), repeat=repeat
+                ),
+            },
+            "fan_out_write": {
+                "followers": UserSubscription.objects.filter(
+                    following=self.fan_out_author
+                ).count(),
+                **measure(write, repeat=repeat),
+            },
+        }
@@ -0,0 +1,70 @@
+import os
+from io import BytesIO
+from itertools import cycle
+from tempfile import TemporaryDirectory
+from typing import Any, Dict
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....core.storage import ContentHashStorage
+
+
+def get_disk_usage(root):
+    files, size = 0, 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            files += 1
+            size += os.path.getsize(os.path.join(directory, filename))
+    return {"files": files, "size_kib": round(size / 1024, 1)}
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Сравнивает сохранение загруженных картинок рецептов в обычное "
+        "файловое хранилище и в хранилище с именами по хешу содержимого: "
+        "задержку сохранения (p50/p95) и занятое место на диске. "
+        "Картинки сохраняются во временный каталог."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--uploads", type=int, default=500)
+        parser.add_argument(
+            "--distinct",
+            type=int,
+            default=50,
+            help="Сколько среди загрузок разных картинок.",
+        )
+        parser.add_argument("--image-side", type=int, default=800)
+
+    def seed(self, **options: Any) -> None:
+        side = options["image_side"]
+        self.images = []
+        for _ in range(options["distinct"]):
+            content = BytesIO()
+            image = Image.effect_noise((side, side), 32).convert("RGB")
+            image.save(content, format="JPEG", quality=90)
+            self.images.append(content.getvalue())
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        results = {
+            "uploads": options["uploads"],
+            "distinct": options["distinct"],
+        }
+        for storage_class in (FileSystemStorage, ContentHashStorage):
+            with TemporaryDirectory() as root:
+                storage = storage_class(location=root)
+                images = cycle(self.images)
+
+                def upload():
+                    content = ContentFile(next(images), name="image.jpg")
+                    storage.save("recipes/images/image.jpg", content)
+
+                results[storage_class.__name__] = {
+                    **measure(upload, repeat=options["uploads"], warmup=0),
+                    **get_disk_usage(root),
+                }
+        return results
@@ -0,0 +1,106 @@
+import json
+import random
+from itertools import cycle
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db.models import Case, Q, Value, When
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....core.utils import chunked
+from ...models import Ingredient, MeasurementUnit
+from ...search import search_ingredients
+
+INGREDIENTS_FILE = settings.ROOT_DIR / "data" / "ingredients.json"
+
+
+def unlimited_icontains_search(queryset, value):
+    """The search how it was before trigram index and limit were added."""
+    qs = queryset.filter(Q(name__icontains=value))
+    qs = qs.annotate(
+        name_startswith=Case(
+            When(Q(name__istartswith=value), then=Value(True)),
+            default=Value(False),
+        ),
+    )
+    return qs.order_by("-name_startswith")
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку (p50/p95) поиска ингредиентов для автодополнения. "
+        "Ингредиенты из 'data/ingredients.json' размножаются в 'scale' раз. "
+        "Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--scale", type=int, default=100)
+        parser.add_argument("--terms", type=int, default=50)
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=settings.INGREDIENTS_SEARCH_LIMIT,
+        )
+
+    def seed(self, **options: Any) -> None:
+        with open(INGREDIENTS_FILE, encoding="utf-8") as file:
+            rows = [
+                (row["title"].lower(), row["dimension"].lower())
+                for row in json.load(file)
+                if row["title"] and row["dimension"]
+            ]
+        rows = list(dict(rows).items())
+        self.titles = [title for title, _ in rows]
+
+        units = {dimension for _, dimension in rows}
+        MeasurementUnit.objects.bulk_create(
+            (MeasurementUnit(name=unit) for unit in units),
+            ignore_conflicts=True,
+        )
+        units_ids = dict(
+            MeasurementUnit.objects.filter(name__in=units).values_list(
+                "name", "id"
+            )
+        )
+
+        ingredients = (
+            Ingredient(
+                name=f"{title} {copy}" if copy else title,
+                measurement_unit_id=units_ids[dimension],
+            )
+            for copy in range(options["scale"])
+            for title, dimension in rows
+        )
+        for batch in chunked(ingredients, 5000):
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        limit = options["limit"]
+        queryset = Ingredient.objects.select_related("measurement_unit")
+
+        # What user types: first 2-5 letters of an ingredient name.
+        terms = [
+            title[: random.randint(2, 5)]
+            for title in random.sample(self.titles, options["terms"])
+        ]
+        repeat = options["repeat"] * len(terms)
+
+        legacy_terms = cycle(terms)
+        search_terms = cycle(terms)
+
+        def legacy():
+            value = next(legacy_terms)
+            return list(unlimited_icontains_search(queryset, value))
+
+        def search():
+            value = next(search_terms)
+            return list(search_ingredients(queryset, value, limit=limit))
+
+        return {
+            "ingredients": Ingredient.objects.count(),
+            "terms": len(terms),
+            "limit": limit,
+            "unlimited_icontains": measure(legacy, repeat=repeat),
+            "search_ingredients": measure(search, repeat=repeat),
+        }
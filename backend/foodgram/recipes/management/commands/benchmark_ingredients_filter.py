@@ -0,0 +1,74 @@
+import random
+from typing import Any, Dict
+
+from django.conf import settings
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....users.factories import bulk_create_users
+from ...factories import (
+    bulk_add_ingredients,
+    bulk_create_catalog,
+    bulk_create_recipes,
+)
+from ...models import Recipe, RecipeIngredient
+from ...search import search_recipes_by_ingredients
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку (p50/p95) получения первой страницы рецептов, "
+        "найденных по ингредиентам, в режимах 'all', 'any' и "
+        "'at_least_n'. По умолчанию создается 1 млн ингредиентов в "
+        "рецептах. Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--recipe-ingredients", type=int, default=10)
+        parser.add_argument("--ingredients", type=int, default=1000)
+        parser.add_argument(
+            "--pantry",
+            type=int,
+            default=5,
+            help="Сколько ингредиентов передается в фильтр.",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+        )
+
+    def seed(self, **options: Any) -> None:
+        self.ingredients_ids, _ = bulk_create_catalog(options["ingredients"])
+        users = bulk_create_users(100)
+        recipes_ids = bulk_create_recipes(options["recipes"], users)
+        bulk_add_ingredients(
+            recipes_ids,
+            self.ingredients_ids,
+            options["recipe_ingredients"],
+        )
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        page_size = options["page_size"]
+        pantry = options["pantry"]
+        queryset = Recipe.objects.all()
+
+        def search(min_matches):
+            ingredients_ids = random.sample(self.ingredients_ids, pantry)
+            qs = search_recipes_by_ingredients(
+                queryset, ingredients_ids, min_matches
+            )
+            return list(qs[:page_size])
+
+        modes = {"any": 1, "at_least_n": min(2, pantry), "all": pantry}
+        results = {
+            "recipe_ingredients": RecipeIngredient.objects.count(),
+            "pantry": pantry,
+            "page_size": page_size,
+        }
+        for mode, min_matches in modes.items():
+            results[mode] = measure(
+                lambda: search(min_matches), repeat=options["repeat"]
+            )
+        return results
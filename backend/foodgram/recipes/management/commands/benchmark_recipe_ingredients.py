@@ -0,0 +1,81 @@
+from typing import Any, Dict
+
+from ....core.benchmark import BenchmarkCommand, measure, measure_memory
+from ....users.factories import bulk_create_users
+from ...factories import (
+    bulk_add_ingredients,
+    bulk_create_catalog,
+    bulk_create_recipes,
+)
+from ...models import Recipe
+
+
+def load_with_prefetch(recipes_ids):
+    """Loads recipe ingredients how it was before 'with_ingredient_rows'."""
+    recipes = list(
+        Recipe.objects.filter(id__in=recipes_ids).prefetch_related(
+            "recipeingredients__ingredient",
+            "recipeingredients__ingredient__measurement_unit",
+        )
+    )
+    return [
+        [
+            (
+                row.ingredient.id,
+                row.ingredient.name,
+                row.ingredient.measurement_unit.name,
+                row.amount,
+            )
+            for row in recipe.recipeingredients.all()
+        ]
+        for recipe in recipes
+    ]
+
+
+def load_with_rows(recipes_ids):
+    recipes = list(
+        Recipe.ext_objects.filter(id__in=recipes_ids).with_ingredient_rows()
+    )
+    return [recipe.ingredient_rows for recipe in recipes]
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Сравнивает загрузку ингредиентов страницы рецептов через "
+        "'prefetch_related' и через 'with_ingredient_rows': время, "
+        "количество запросов и пик выделенной памяти. "
+        "Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--page-sizes", type=int, nargs="+", default=[20, 100]
+        )
+        parser.add_argument("--recipe-ingredients", type=int, default=10)
+
+    def seed(self, **options: Any) -> None:
+        ingredients_ids, _ = bulk_create_catalog(200)
+        users = bulk_create_users(10)
+        self.recipes_ids = bulk_create_recipes(
+            max(options["page_sizes"]), users
+        )
+        bulk_add_ingredients(
+            self.recipes_ids, ingredients_ids, options["recipe_ingredients"]
+        )
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        results = {"recipe_ingredients": options["recipe_ingredients"]}
+        for page_size in options["page_sizes"]:
+            page = self.recipes_ids[:page_size]
+            results[f"page_{page_size}"] = {
+                name: {
+                    **measure(lambda: load(page), repeat=options["repeat"]),
+                    **measure_memory(lambda: load(page)),
+                }
+                for name, load in (
+                    ("prefetch_related", load_with_prefetch),
+                    ("with_ingredient_rows", load_with_rows),
+                )
+            }
+        return results
@@ -0,0 +1,88 @@
+import json
+import random
+from itertools import cycle
+from typing import Any, Dict
+
+from django.conf import settings
+from django.db.models import Q
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....core.utils import chunked
+from ....users.factories import bulk_create_users
+from ...models import Recipe
+from ...search import search_recipes
+
+INGREDIENTS_FILE = settings.ROOT_DIR / "data" / "ingredients.json"
+
+
+def name_icontains_search(queryset, value):
+    """The only search there was before: admin 'search_fields' scan."""
+    return queryset.filter(Q(name__icontains=value))
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку (p50/p95) получения первой страницы поиска "
+        "рецептов по названию и описанию. Слова для рецептов берутся из "
+        "'data/ingredients.json'. Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=500000)
+        parser.add_argument("--terms", type=int, default=50)
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+        )
+
+    def seed(self, **options: Any) -> None:
+        with open(INGREDIENTS_FILE, encoding="utf-8") as file:
+            words = {
+                word
+                for row in json.load(file)
+                for word in row["title"].lower().split()
+                if len(word) > 3 and word.isalpha()
+            }
+        self.words = sorted(words)
+
+        authors_ids = [user.id for user in bulk_create_users(100)]
+        recipes = (
+            Recipe(
+                author_id=authors_ids[number % len(authors_ids)],
+                name=" ".join(random.sample(self.words, 3) + [str(number)]),
+                image="recipes/images/benchmark.png",
+                text=" ".join(random.sample(self.words, 15)),
+                cooking_time=number % 50 + 1,
+            )
+            for number in range(options["recipes"])
+        )
+        for batch in chunked(recipes, 5000):
+            Recipe.objects.bulk_create(batch)
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        page_size = options["page_size"]
+        queryset = Recipe.objects.all()
+
+        terms = random.sample(self.words, options["terms"])
+        repeat = options["repeat"] * len(terms)
+
+        legacy_terms = cycle(terms)
+        search_terms = cycle(terms)
+
+        def legacy():
+            value = next(legacy_terms)
+            return list(name_icontains_search(queryset, value)[:page_size])
+
+        def search():
+            value = next(search_terms)
+            return list(search_recipes(queryset, value)[:page_size])
+
+        return {
+            "recipes": Recipe.objects.count(),
+            "terms": len(terms),
+            "page_size": page_size,
+            "name_icontains": measure(legacy, repeat=repeat),
+            "search_recipes": measure(search, repeat=repeat),
+        }
@@ -0,0 +1,70 @@
+from typing import Any, Dict
+
+from rest_framework.renderers import JSONRenderer
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....users.factories import bulk_create_users
+from ...factories import (
+    bulk_add_ingredients,
+    bulk_add_tags,
+    bulk_create_catalog,
+    bulk_create_recipes,
+)
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Сравнивает скорость сериализации списка рецептов в JSON "
+        "сериализаторами 'RecipeSerializer' и 'RecipeReadSerializer'. "
+        "Рецепты загружаются из базы один раз, замеряется только "
+        "сериализация. Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--recipe-ingredients", type=int, default=8)
+        parser.add_argument("--recipe-tags", type=int, default=2)
+
+    def seed(self, **options: Any) -> None:
+        ingredients_ids, tags_ids = bulk_create_catalog(200)
+        users = bulk_create_users(options["users"])
+        recipes_ids = bulk_create_recipes(options["recipes"], users)
+        bulk_add_ingredients(
+            recipes_ids, ingredients_ids, options["recipe_ingredients"]
+        )
+        bulk_add_tags(recipes_ids, tags_ids, options["recipe_tags"])
+
+        self.user = users[0]
+        self.recipes_ids = recipes_ids
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        # Users and recipes serializers import each other, so they can't be
+        # imported before the users app modules.
+        from ....users import serializers  # noqa: F401
+        from ...serializers import RecipeReadSerializer, RecipeSerializer
+        from ...views import RecipeViewSet
+
+        recipes = list(
+            RecipeViewSet.queryset.filter(
+                id__in=self.recipes_ids
+            ).with_user_state(user=self.user)
+        )
+
+        def serialize(serializer_class):
+            serializer = serializer_class(recipes, many=True)
+            return JSONRenderer().render(serializer.data)
+
+        results = {"recipes": len(recipes)}
+        for serializer_class in (RecipeSerializer, RecipeReadSerializer):
+            timings = measure(
+                lambda: serialize(serializer_class), repeat=options["repeat"]
+            )
+            per_1000_ms = timings["mean_ms"] * 1000 / len(recipes)
+            timings["per_1000_recipes_ms"] = round(per_1000_ms, 3)
+            timings["recipes_per_second"] = round(
+                len(recipes) / timings["mean_ms"] * 1000
+            )
+            results[serializer_class.__name__] = timings
+        return results
@@ -0,0 +1,76 @@
+from typing import Any, Dict
+
+from ....core.benchmark import BenchmarkCommand, measure, measure_memory
+from ....users.factories import bulk_create_users
+from ...cart import rebuild_cart_totals
+from ...exports import EXPORT_FORMATS, iter_cart_rows, stream_cart
+from ...factories import (
+    bulk_add_ingredients,
+    bulk_create_catalog,
+    bulk_create_recipes,
+)
+from ...models import RecipeCart
+from ...pdf import get_cart_rows, render_cart_pdf
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку и пиковую память выгрузки списка покупок в "
+        "форматах pdf, txt, csv и json для корзин из 10, 100 и 1000 "
+        "рецептов. Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            "--carts",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000],
+            help="Количество рецептов в корзинах.",
+        )
+        parser.add_argument("--ingredients", type=int, default=500)
+        parser.add_argument("--recipe-ingredients", type=int, default=10)
+
+    def seed(self, **options: Any) -> None:
+        ingredients_ids, _ = bulk_create_catalog(options["ingredients"])
+
+        self.users = bulk_create_users(len(options["carts"]))
+        recipes_ids = bulk_create_recipes(max(options["carts"]), self.users)
+        bulk_add_ingredients(
+            recipes_ids, ingredients_ids, options["recipe_ingredients"]
+        )
+        RecipeCart.objects.bulk_create(
+            RecipeCart(user=user, recipe_id=recipe_id)
+            for user, size in zip(self.users, options["carts"])
+            for recipe_id in recipes_ids[:size]
+        )
+        rebuild_cart_totals([user.id for user in self.users])
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        results = {}
+        for user, size in zip(self.users, options["carts"]):
+
+            def pdf():
+                return render_cart_pdf(get_cart_rows(user))
+
+            formats = {"pdf": pdf}
+            for export_format in EXPORT_FORMATS:
+
+                def export(export_format=export_format):
+                    response = stream_cart(iter_cart_rows(user), export_format)
+                    return b"".join(response.streaming_content)
+
+                formats[export_format] = export
+
+            results[f"{size}_recipes"] = {
+                "rows": len(get_cart_rows(user)),
+                **{
+                    name: {
+                        **measure(func, repeat=options["repeat"]),
+                        **measure_memory(func),
+                    }
+                    for name, func in formats.items()
+                },
+            }
+        return results
@@ -0,0 +1,57 @@
+import random
+from typing import Any, Dict
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....users.factories import bulk_create_users
+from ...factories import bulk_create_recipes, bulk_create_user_recipe_objects
+from ...models import Recipe, RecipeCart, RecipeFavorite
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Сравнивает способы получения 'is_favorited', 'is_in_shopping_cart' "
+        "и 'is_subscribed' для страницы рецептов: коррелированные "
+        "подзапросы EXISTS ('subquery') и три запроса по id страницы "
+        "('batch'). Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--favorites", type=int, default=1000000)
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--page-size", type=int, default=20)
+
+    def seed(self, **options: Any) -> None:
+        self.users = bulk_create_users(options["users"])
+        recipes_ids = bulk_create_recipes(options["recipes"], self.users)
+        bulk_create_user_recipe_objects(
+            RecipeFavorite, options["favorites"], self.users, recipes_ids
+        )
+        bulk_create_user_recipe_objects(
+            RecipeCart, options["favorites"] // 10, self.users, recipes_ids
+        )
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        page_size = options["page_size"]
+        user = random.choice(self.users)
+
+        def subquery_page():
+            queryset = (
+                Recipe.ext_objects.author_with_subscriptions(user=user)
+                .with_favorites(user=user)
+                .with_shopping_cart(user=user)
+            )
+            return list(queryset[:page_size])
+
+        def batch_page():
+            queryset = Recipe.ext_objects.with_user_state(user=user)
+            return list(queryset[:page_size])
+
+        return {
+            "recipes": options["recipes"],
+            "favorites": options["favorites"],
+            "page_size": page_size,
+            "subquery": measure(subquery_page, repeat=options["repeat"]),
+            "batch": measure(batch_page, repeat=options["repeat"]),
+        }
@@ -0,0 +1,42 @@
+from typing import Any, Optional
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ...cart import (
+    find_inconsistent_cart_totals,
+    get_cart_totals_user_ids,
+    rebuild_cart_totals,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Проверяет, что списки покупок пользователей (таблица "
+        "CartIngredientTotal) совпадают с рецептами в корзинах покупок. "
+        "Завершается с ошибкой, если найдены расхождения."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Пересчитать списки покупок с расхождениями.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        user_ids = find_inconsistent_cart_totals(get_cart_totals_user_ids())
+        if not user_ids:
+            self.stdout.write(self.style.SUCCESS("Расхождений не найдено."))
+            return
+
+        message = (
+            f"Списки покупок расходятся с корзинами у пользователей "
+            f"({len(user_ids)}): {', '.join(map(str, user_ids))}."
+        )
+        if not options["fix"]:
+            raise CommandError(message)
+
+        rebuild_cart_totals(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"{message} Исправлено."))
@@ -0,0 +1,44 @@
+from typing import Any, Optional
+
+from django.core.management.base import BaseCommand
+
+from ...images import delete_orphan_images, find_orphan_images
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет файлы картинок рецептов (и их уменьшенных копий), на "
+        "которые не ссылается ни один рецепт. Одинаковые картинки хранятся "
+        "одним файлом, поэтому они не удаляются вместе с рецептом."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help=(
+                "Файлы моложе этого количества секунд не удаляются: они "
+                "могут принадлежать еще не сохраненным рецептам."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, сколько файлов будет удалено.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        orphans = find_orphan_images(options["min_age"])
+        if options["dry_run"]:
+            message = "Будет удалено файлов"
+        else:
+            orphans = delete_orphan_images(orphans, options["min_age"])
+            message = "Удалено файлов"
+
+        size = sum(size for _, size in orphans)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{message}: {len(orphans)}, {size / 1024 / 1024:.1f} МиБ."
+            )
+        )
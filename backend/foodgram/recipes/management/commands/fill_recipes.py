@@ -1,6 +1,7 @@
 import random
 from typing import Any, Optional
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
 
 from ....core.constants import TAGS
@@ -65,5 +66,7 @@ class Command(BaseCommand):
 
         RecipeFavoriteFactory.create_batch(related_objects_amount)
         RecipeCartFactory.create_batch(related_objects_amount)
+        call_command("reconcile_counters", stdout=self.stdout)
+        call_command("rebuild_cart_totals", stdout=self.stdout)
 
         self.stdout.write(self.style.SUCCESS("Рецепты созданы успешно."))
@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from ....core.utils import chunked
+from ...cache import bump_recipes_version
+from ...images import build_image_variants, process_recipe_image
+from ...models import Recipe
+
+
+def try_build_image_variants(name):
+    try:
+        return build_image_variants(name)
+    except (OSError, ValueError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Делает уменьшенные копии (JPEG/PNG и WebP) картинок рецептов "
+        "шириной RECIPE_IMAGE_VARIANT_WIDTHS. По умолчанию только для "
+        "рецептов без копий. Картинки обрабатываются в отдельных процессах. "
+        "С '--pending' заново обрабатывает картинки, которые ждут обработки "
+        "дольше RECIPE_IMAGE_PENDING_TIMEOUT секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=2,
+            help="Количество процессов. 0 - обрабатывать в текущем процессе.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help=(
+                "Переделать копии всех картинок. Старые копии удаляет "
+                "команда 'delete_orphan_images'."
+            ),
+        )
+        parser.add_argument(
+            "--pending",
+            action="store_true",
+            help=(
+                "Обработать зависшие картинки (уменьшить и сделать копии) "
+                "в текущем процессе."
+            ),
+        )
+        parser.add_argument("--batch-size", type=int, default=100)
+
+    def handle_pending(self):
+        """
+        Processes images whose background task was lost, e.g. the worker
+        process was restarted before the task was run.
+        """
+        deadline = timezone.now() - timedelta(
+            seconds=settings.RECIPE_IMAGE_PENDING_TIMEOUT
+        )
+        rows = (
+            Recipe.objects.exclude(image="")
+            .filter(image_status=Recipe.IMAGE_PENDING, updated_at__lt=deadline)
+            .order_by("id")
+            .values_list("id", "image")
+        )
+        recipe_ids = []
+        for recipe_id, name in rows.iterator():
+            process_recipe_image(recipe_id, name)
+            recipe_ids.append(recipe_id)
+
+        failed = Recipe.objects.filter(
+            id__in=recipe_ids, image_status=Recipe.IMAGE_FAILED
+        ).count()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Зависшие картинки обработаны. Рецептов: {len(recipe_ids)}, "
+                f"с ошибками: {failed}."
+            )
+        )
+
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        if options["pending"]:
+            self.handle_pending()
+            return
+        recipes = Recipe.objects.exclude(image="").filter(
+            image_status=Recipe.IMAGE_READY
+        )
+        if not options["all"]:
+            recipes = recipes.filter(image_variants=[])
+        rows = recipes.order_by("id").values_list("id", "image")
+
+        build = map
+        executor = None
+        if options["workers"]:
+            # Forked workers must not share the parent's connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(max_workers=options["workers"])
+            build = executor.map
+
+        made, failed = 0, 0
+        try:
+            for batch in chunked(rows.iterator(), options["batch_size"]):
+                names = [name for _, name in batch]
+                results = build(try_build_image_variants, names)
+                for (recipe_id, name), variants in zip(batch, results):
+                    if variants is None:
+                        failed += 1
+                        continue
+                    # The recipe may have got another image meanwhile
+                    made += Recipe.objects.filter(
+                        id=recipe_id, image=name
+                    ).update(
+                        image_variants=variants, updated_at=timezone.now()
+                    )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if made:
+            bump_recipes_version()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Копии картинок сделаны. Рецептов: {made}, "
+                f"с ошибками: {failed}."
+            )
+        )
@@ -0,0 +1,32 @@
+from typing import Any, Optional
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ...cart import get_cart_totals_user_ids, rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает списки покупок пользователей (таблицу "
+        "CartIngredientTotal) по рецептам в корзинах покупок."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users",
+            type=int,
+            nargs="+",
+            help="id пользователей. По умолчанию пересчитываются все.",
+        )
+
+    @transaction.atomic
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        user_ids = options["users"] or get_cart_totals_user_ids()
+        rebuild_cart_totals(user_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Списки покупок пересчитаны. Пользователей: {len(user_ids)}."
+            )
+        )
@@ -0,0 +1,74 @@
+from typing import Any, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ....core.utils import chunked
+from ...models import Recipe, RecipeCart, RecipeFavorite
+
+User = get_user_model()
+
+
+def count_subquery(model, field):
+    """Counts 'model' objects related with the outer object by 'field'."""
+    subquery = (
+        model.objects.filter(**{field: OuterRef("id")})
+        .order_by()
+        .values(field)
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+def reconcile(queryset, counters):
+    """
+    Sets actual values for all 'counters' in objects which have any of them
+    drifted. 'counters' is a dict: {counter field: count expression}.
+    Returns the number of repaired objects.
+    """
+    actual = {f"actual_{field}": value for field, value in counters.items()}
+    drifted = Q()
+    for field in counters:
+        drifted |= ~Q(**{field: F(f"actual_{field}")})
+
+    drifted_ids = list(
+        queryset.annotate(**actual)
+        .filter(drifted)
+        .values_list("id", flat=True)
+    )
+    for ids in chunked(drifted_ids, 500):
+        queryset.filter(id__in=ids).update(**counters)
+    return len(drifted_ids)
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает счетчики рецептов (сколько раз добавили в избранное "
+        "и в корзину покупок) и пользователей (количество рецептов), если "
+        "они разошлись с реальными значениями."
+    )
+
+    @transaction.atomic
+    def handle(self, *args: Any, **options: Any) -> Optional[str]:
+        recipes_repaired = reconcile(
+            Recipe.objects.all(),
+            {
+                "favorites_count": count_subquery(RecipeFavorite, "recipe"),
+                "cart_count": count_subquery(RecipeCart, "recipe"),
+            },
+        )
+        users_repaired = reconcile(
+            User.objects.all(),
+            {"recipes_count": count_subquery(Recipe, "author")},
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Счетчики пересчитаны. Исправлено рецептов: "
+                f"{recipes_repaired}, пользователей: {users_repaired}."
+            )
+        )
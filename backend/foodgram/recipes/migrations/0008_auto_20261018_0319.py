@@ -0,0 +1,51 @@
+# Generated by Django 3.2.11 on 2026-10-18 03:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    subquery = (
+        model.objects.filter(**{field: OuterRef('id')})
+        .order_by()
+        .values(field)
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeFavorite = apps.get_model('recipes', 'RecipeFavorite')
+    RecipeCart = apps.get_model('recipes', 'RecipeCart')
+    User = apps.get_model('users', 'User')
+
+    Recipe.objects.update(
+        favorites_count=count_subquery(RecipeFavorite, 'recipe'),
+        cart_count=count_subquery(RecipeCart, 'recipe'),
+    )
+    User.objects.update(recipes_count=count_subquery(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_auto_20261018_0316'),
+        ('users', '0005_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Раз добавили в корзину покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Раз добавили в избранное'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
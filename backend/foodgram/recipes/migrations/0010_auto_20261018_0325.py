@@ -0,0 +1,36 @@
+# Generated by Django 3.2.11 on 2026-10-18 03:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_ingredient_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartPDF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cart_hash', models.CharField(max_length=64, verbose_name='Хэш списка покупок')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('file', models.FileField(blank=True, upload_to='carts/', verbose_name='Файл PDF')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_cart_pdfs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'PDF списка покупок',
+                'verbose_name_plural': 'PDF списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartpdf',
+            constraint=models.UniqueConstraint(fields=('user', 'cart_hash'), name='Unique ShoppingCartPDF per user and cart hash'),
+        ),
+    ]
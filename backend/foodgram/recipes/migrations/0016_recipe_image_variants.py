@@ -0,0 +1,18 @@
+# Generated by Django 3.2.11 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Уменьшенные копии картинки'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.11 on 2026-10-18 04:04
+
+from django.db import migrations, models
+import foodgram.core.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=foodgram.core.storage.ContentHashStorage(), upload_to='recipes/images/', verbose_name='Картинка'),
+        ),
+    ]
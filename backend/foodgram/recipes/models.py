@@ -1,13 +1,20 @@
+from functools import partial
+
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Sum
-from django.db.models.expressions import Exists, OuterRef
+from django.db.models import BooleanField, Count, F, Q, Sum, Window
+from django.db.models.expressions import Exists, OuterRef, RawSQL, Value
+from django.db.models.functions import RowNumber
 from django.db.models.query import Prefetch
 
 from ..core.constants import MAX_COOKING_TIME, MAX_INGREDIENT_AMOUNT
+from ..core.models import PostFetchHooksQuerySet
+from ..core.storage import ContentHashStorage
 from ..core.utils import cyrillic_slugify
+from ..users.cache import get_following_ids
 
 User = get_user_model()
 
@@ -105,9 +112,146 @@ class RecipeTag(models.Model):
         verbose_name_plural = "Теги рецептов"
 
 
-class RecipeQuerySet(models.QuerySet):
+class RecipeQuerySet(PostFetchHooksQuerySet):
+    @staticmethod
+    def _set_user_state(recipes, user=None):
+        """
+        Sets 'is_favorited', 'is_in_shopping_cart' and 'author.is_subscribed'
+        attributes on fetched recipes. Makes two queries limited to the
+        fetched recipes ids, followed authors ids are taken from cache (see
+        'users.cache.get_following_ids'). Results are merged in python.
+        """
+        favorited_ids = set()
+        in_shopping_cart_ids = set()
+        subscribed_ids = set()
+
+        if user is not None and recipes:
+            recipes_ids = [recipe.id for recipe in recipes]
+
+            favorited_ids = set(
+                RecipeFavorite.objects.filter(
+                    user=user,
+                    recipe_id__in=recipes_ids,
+                ).values_list("recipe_id", flat=True)
+            )
+            in_shopping_cart_ids = set(
+                RecipeCart.objects.filter(
+                    user=user,
+                    recipe_id__in=recipes_ids,
+                ).values_list("recipe_id", flat=True)
+            )
+            subscribed_ids = get_following_ids(user.id)
+
+        for recipe in recipes:
+            recipe.is_favorited = recipe.id in favorited_ids
+            recipe.is_in_shopping_cart = recipe.id in in_shopping_cart_ids
+            recipe.author.is_subscribed = recipe.author_id in subscribed_ids
+
+    @staticmethod
+    def _set_ingredient_rows(recipes):
+        """
+        Sets 'ingredient_rows' attribute on fetched recipes: list of
+        '(ingredient_id, name, measurement_unit, amount)' tuples. All rows
+        are fetched with one joined query without creating model objects.
+        """
+        rows_by_recipe = {recipe.id: [] for recipe in recipes}
+        if rows_by_recipe:
+            rows = (
+                RecipeIngredient.objects.filter(recipe_id__in=rows_by_recipe)
+                .order_by("id")
+                .values_list(
+                    "recipe_id",
+                    "ingredient_id",
+                    "ingredient__name",
+                    "ingredient__measurement_unit__name",
+                    "amount",
+                )
+            )
+            for recipe_id, *row in rows:
+                rows_by_recipe[recipe_id].append(tuple(row))
+
+        for recipe in recipes:
+            recipe.ingredient_rows = rows_by_recipe[recipe.id]
+
+    def with_user_state(self, user=None):
+        """
+        Alternative to 'with_favorites', 'with_shopping_cart' and
+        'author_with_subscriptions'. Instead of correlated subqueries for
+        every row the same attributes are set after the queryset is fetched.
+        It doesn't annotate queryset so the attributes can't be used in
+        filters.
+        """
+        qs = self.select_related("author")
+        return qs._add_post_fetch_hook(
+            partial(self._set_user_state, user=user)
+        )
+
+    def with_ingredient_rows(self):
+        """
+        Alternative to prefetching 'recipeingredients' with ingredients and
+        measurement units. See '_set_ingredient_rows'.
+        """
+        return self._add_post_fetch_hook(self._set_ingredient_rows)
+
+    def latest_by_authors(self, authors_ids, count):
+        """
+        Returns the latest 'count' recipes of every author. Recipes are
+        numbered per author with 'ROW_NUMBER() OVER (PARTITION BY author_id
+        ...)' window limited to 'authors_ids', the outer query takes the
+        first 'count' of them.
+        """
+        if count <= 0 or not authors_ids:
+            return self.none()
+        # Same order as 'Recipe.Meta.ordering'
+        numbered = (
+            Recipe.objects.filter(author_id__in=authors_ids)
+            .annotate(
+                row_number=Window(
+                    expression=RowNumber(),
+                    partition_by=[F("author_id")],
+                    order_by=[F("pub_date").desc(), F("id").desc()],
+                )
+            )
+            .order_by()
+            .values("id", "row_number")
+        )
+        sql, params = numbered.query.sql_with_params()
+        # Django can't filter by window functions, so the numbered query is
+        # wrapped with raw SQL
+        return self.filter(
+            id__in=RawSQL(
+                f"SELECT id FROM ({sql}) AS numbered WHERE row_number <= %s",
+                (*params, count),
+            )
+        )
+
+    def tagged(self, tags_ids, match_all=False):
+        """
+        Returns recipes with any (or all if 'match_all') of 'tags_ids'.
+        Tags are checked with 'id IN (SELECT recipe_id ...)' semi-join, so
+        recipes are not duplicated and no DISTINCT is needed.
+        """
+        tags_ids = set(tags_ids)
+        recipes_ids = Recipe.tags.through.objects.filter(
+            recipetag_id__in=tags_ids
+        ).values("recipe_id")
+        if match_all:
+            recipes_ids = (
+                recipes_ids.annotate(tags_count=Count("recipetag_id"))
+                .filter(tags_count=len(tags_ids))
+                .values("recipe_id")
+            )
+        return self.filter(id__in=recipes_ids)
+
     def with_favorites(self, user=None):
-        """Annotates recipes  with 'is_favorited' field."""
+        """
+        Annotates recipes  with 'is_favorited' field. Without user it is
+        constant 'False' instead of subquery.
+        """
+        if user is None:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField())
+            )
         subquery = RecipeFavorite.objects.filter(
             user=user,
             recipe=OuterRef("id"),
@@ -116,7 +260,14 @@ class RecipeQuerySet(models.QuerySet):
         return qs
 
     def with_shopping_cart(self, user=None):
-        """Annotates recipes  with 'is_in_shopping_cart' field."""
+        """
+        Annotates recipes  with 'is_in_shopping_cart' field. Without user it
+        is constant 'False' instead of subquery.
+        """
+        if user is None:
+            return self.annotate(
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
         subquery = RecipeCart.objects.filter(
             user=user,
             recipe=OuterRef("id"),
@@ -135,7 +286,26 @@ class RecipeQuerySet(models.QuerySet):
         return qs
 
 
+class RecipeManager(models.Manager):
+    """
+    'search_vector' is used only in SQL of the text search, so it isn't
+    loaded with recipes.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer("search_vector")
+
+
 class Recipe(models.Model):
+    IMAGE_PENDING = "pending"
+    IMAGE_READY = "ready"
+    IMAGE_FAILED = "failed"
+    IMAGE_STATUS_CHOICES = [
+        (IMAGE_PENDING, "Обрабатывается"),
+        (IMAGE_READY, "Готова"),
+        (IMAGE_FAILED, "Ошибка обработки"),
+    ]
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -147,10 +317,28 @@ class Recipe(models.Model):
         verbose_name="Название рецепта",
         db_index=True,
     )
+    # Identical images are stored once, unreferenced files are deleted by
+    # 'delete_orphan_images' command
     image = models.ImageField(
         upload_to="recipes/images/",
+        storage=ContentHashStorage(),
         verbose_name="Картинка",
     )
+    image_status = models.CharField(
+        max_length=10,
+        choices=IMAGE_STATUS_CHOICES,
+        default=IMAGE_READY,
+        editable=False,
+        verbose_name="Статус картинки",
+    )
+    # List of '{"width": ..., "image": name, "webp": name}', see
+    # 'recipes.images.build_image_variants'
+    image_variants = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        verbose_name="Уменьшенные копии картинки",
+    )
     text = models.TextField(
         max_length=1000,
         verbose_name="Описание рецепта",
@@ -177,17 +365,56 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name="Дата изменения",
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name="Раз добавили в избранное",
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        verbose_name="Раз добавили в корзину покупок",
+        default=0,
+        editable=False,
+    )
+    # Filled by the database trigger on Postgres, see 0012 migration. It is
+    # deferred by the managers.
+    search_vector = SearchVectorField(
+        verbose_name="Поисковый вектор",
+        null=True,
+        editable=False,
+    )
+    # The recipe is added to followers' feeds, see 'recipes.feed'. Until
+    # then (or for authors with too many followers) it's read from recipes.
+    feed_fanout = models.BooleanField(
+        verbose_name="Добавлен в ленты подписчиков",
+        default=False,
+        editable=False,
+    )
 
-    objects = models.Manager()
-    ext_objects = RecipeQuerySet.as_manager()
+    objects = RecipeManager()
+    ext_objects = RecipeManager.from_queryset(RecipeQuerySet)()
 
     class Meta:
-        ordering = ["-pub_date"]
+        ordering = ["-pub_date", "-id"]
         constraints = [
             models.UniqueConstraint(
                 fields=("author", "name"), name="Unique recipe per author"
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_id_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_feed_fallback_idx",
+                condition=Q(feed_fanout=False),
+            ),
+        ]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
 
@@ -223,6 +450,13 @@ class RecipeIngredient(models.Model):
                 name="Unique ingredient per recipe",
             ),
         ]
+        indexes = [
+            # Inverted index for recipes search by ingredients.
+            models.Index(
+                fields=["ingredient", "recipe"],
+                name="recipeingredient_ingr_rcp_idx",
+            ),
+        ]
         verbose_name = "Ингредиент в рецепте"
         verbose_name_plural = "Ингредиенты в рецептах"
 
@@ -230,6 +464,60 @@ class RecipeIngredient(models.Model):
         return f"{self.ingredient} в {self.recipe}"
 
 
+class FeedEntry(models.Model):
+    """
+    Recipe in the feed of the author's follower. Entries are written when
+    the recipe is created and when the author is followed, see
+    'recipes.feed'. 'author' and 'pub_date' are copied from the recipe to
+    unfollow and paginate the feed without joins.
+    """
+
+    # Indexed by the compound indexes below
+    follower = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Подписчик",
+        db_index=False,
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор",
+    )
+    pub_date = models.DateTimeField(verbose_name="Дата публикации")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("follower", "recipe"),
+                name="Unique FeedEntry per follower and recipe",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["follower", "-pub_date", "-recipe"],
+                name="feedentry_follower_pub_idx",
+            ),
+            models.Index(
+                fields=["follower", "author"],
+                name="feedentry_follower_author_idx",
+            ),
+        ]
+        verbose_name = "Рецепт в ленте"
+        verbose_name_plural = "Ленты подписок"
+
+    def __str__(self):
+        return f"'{self.recipe}' в ленте '{self.follower.username}'"
+
+
 class RecipeFavorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -287,3 +575,96 @@ class RecipeCart(models.Model):
             f"Рецепт '{self.recipe.name}' из корзины покупок "
             f"у '{self.user.username}'"
         )
+
+
+class CartIngredientTotal(models.Model):
+    """
+    Total amount of an ingredient in all recipes of user's shopping cart.
+    Kept up to date by the functions from 'cart' module.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="cart_totals",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="cart_totals",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField(verbose_name="Количество")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "ingredient"),
+                name="Unique CartIngredientTotal per user and ingredient",
+            ),
+        ]
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Ингредиенты в списках покупок"
+
+    def __str__(self):
+        return f"{self.ingredient} в списке покупок '{self.user.username}'"
+
+
+class ShoppingCartPDF(models.Model):
+    """
+    Rendered PDF with user's shopping list. 'cart_hash' is a hash of the
+    aggregated list, so the same list is never rendered twice.
+    """
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_pdfs",
+        verbose_name="Пользователь",
+    )
+    cart_hash = models.CharField(
+        max_length=64,
+        verbose_name="Хэш списка покупок",
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        verbose_name="Статус",
+    )
+    file = models.FileField(
+        upload_to="carts/",
+        blank=True,
+        verbose_name="Файл PDF",
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Дата создания",
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Дата изменения",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user", "cart_hash"),
+                name="Unique ShoppingCartPDF per user and cart hash",
+            ),
+        ]
+        verbose_name = "PDF списка покупок"
+        verbose_name_plural = "PDF списков покупок"
+
+    def __str__(self):
+        return f"Список покупок '{self.user.username}' ({self.status})"
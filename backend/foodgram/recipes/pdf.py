@@ -0,0 +1,125 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from xhtml2pdf import pisa
+
+from ..core.tasks import run_in_background
+from .exports import iter_cart_rows
+from .models import ShoppingCartPDF
+
+# Pending job is considered lost (e.g. the worker was restarted) after that
+PENDING_TIMEOUT = timedelta(minutes=5)
+
+
+class PDFRenderError(Exception):
+    pass
+
+
+def get_cart_rows(user):
+    """Returns user's shopping list as a list of dicts."""
+    return [
+        {
+            "name": name,
+            "measurement_unit": measurement_unit,
+            "amount": amount,
+        }
+        for name, measurement_unit, amount in iter_cart_rows(user)
+    ]
+
+
+def get_cart_hash(rows):
+    dump = json.dumps(rows, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(dump.encode()).hexdigest()
+
+
+def render_cart_pdf(rows):
+    """Renders shopping list to PDF and returns its content."""
+    context = {
+        "ingredient_list": rows,
+        "STATIC_ROOT": settings.STATIC_ROOT,
+    }
+    html = get_template("cart_list_pdf.html").render(context)
+
+    content = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=content)
+    if pisa_status.err:
+        raise PDFRenderError("Не удается подготовить PDF с списком.")
+    return content.getvalue()
+
+
+def render_cart_pdf_job(job_id, rows):
+    """Background task: renders PDF and stores it in the job."""
+    job = ShoppingCartPDF.objects.get(id=job_id)
+    try:
+        content = render_cart_pdf(rows)
+    except PDFRenderError:
+        job.status = ShoppingCartPDF.FAILED
+        job.save(update_fields=["status", "updated_at"])
+        return
+
+    job.file.save(f"{job.cart_hash}.pdf", ContentFile(content), save=False)
+    job.status = ShoppingCartPDF.DONE
+    job.save(update_fields=["file", "status", "updated_at"])
+
+
+def _delete_files(files):
+    for file in files:
+        file.delete(save=False)
+
+
+def delete_outdated_pdfs(user, actual_job):
+    """
+    Deletes outdated jobs of the user. Their files are deleted after the
+    transaction is committed, so a rollback leaves no jobs without files.
+    """
+    outdated = ShoppingCartPDF.objects.filter(user=user).exclude(
+        id=actual_job.id
+    )
+    files = [job.file for job in outdated if job.file]
+    outdated.delete()
+    transaction.on_commit(partial(_delete_files, files))
+
+
+def get_cart_pdf_job(user, rows, background=True):
+    """
+    Returns PDF job for the user's shopping list 'rows'. If the list has
+    changed since the last time, starts rendering in background worker (or
+    renders right away if 'background' is False).
+    Jobs of outdated lists are deleted.
+    The job is claimed in a short transaction, rendering is done after it,
+    so the job's row is not locked while PDF is rendered.
+    """
+    cart_hash = get_cart_hash(rows)
+
+    with transaction.atomic():
+        job, created = ShoppingCartPDF.objects.get_or_create(
+            user=user,
+            cart_hash=cart_hash,
+        )
+        is_queued = (
+            job.status == ShoppingCartPDF.PENDING
+            and job.updated_at > timezone.now() - PENDING_TIMEOUT
+        )
+        if created:
+            delete_outdated_pdfs(user, job)
+        elif job.status == ShoppingCartPDF.DONE or (is_queued and background):
+            return job
+        else:
+            job.status = ShoppingCartPDF.PENDING
+            job.save(update_fields=["status", "updated_at"])
+
+        if background:
+            run_in_background(render_cart_pdf_job, job.id, rows)
+
+    if not background:
+        render_cart_pdf_job(job.id, rows)
+    job.refresh_from_db()
+    return job
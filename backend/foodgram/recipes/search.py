@@ -0,0 +1,163 @@
+from functools import reduce
+from operator import add
+
+from django.db import connection
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    Q,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Length
+
+# Text search configuration the recipes 'search_vector' is built with
+# (see the trigger in 0012 migration).
+RECIPES_SEARCH_CONFIG = "russian"
+
+
+def _annotate_name_startswith(queryset, value):
+    return queryset.annotate(
+        name_startswith=Case(
+            When(
+                Q(name__istartswith=value),
+                then=Value(True),
+            ),
+            default=Value(False),
+            output_field=BooleanField(),
+        ),
+    )
+
+
+def _trigram_search(queryset, value):
+    """
+    Postgres backend. 'icontains' and 'istartswith' lookups are served by
+    GIN trigram index on 'UPPER(name)'. Matches are ranked by trigram
+    similarity.
+    """
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    qs = queryset.filter(Q(name__icontains=value))
+    qs = _annotate_name_startswith(qs, value)
+    qs = qs.annotate(similarity=TrigramSimilarity("name", value))
+    return qs.order_by("-name_startswith", "-similarity", "name")
+
+
+def _plain_search(queryset, value):
+    """
+    Fallback backend for databases without trigrams (SQLite in tests).
+    The shorter matched name the closer it is to the searched value.
+    """
+    qs = queryset.filter(Q(name__icontains=value))
+    qs = _annotate_name_startswith(qs, value)
+    qs = qs.annotate(name_length=Length("name"))
+    return qs.order_by("-name_startswith", "name_length", "name")
+
+
+def search_ingredients(queryset, value, limit=None):
+    """
+    Returns ingredients with 'value' in their names. Ingredients that start
+    with 'value' are listed first, others are ordered by similarity.
+    If 'limit' provided, returns no more than 'limit' ingredients.
+    """
+    if connection.vendor == "postgresql":
+        qs = _trigram_search(queryset, value)
+    else:
+        qs = _plain_search(queryset, value)
+
+    if limit is not None:
+        qs = qs[:limit]
+    return qs
+
+
+def _full_text_recipes_search(queryset, value):
+    """
+    Postgres backend. Matches are found by GIN index on the stored
+    'search_vector' and ranked by 'ts_rank', name matches weigh more.
+    """
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    query = SearchQuery(
+        value, config=RECIPES_SEARCH_CONFIG, search_type="websearch"
+    )
+    qs = queryset.filter(search_vector=query)
+    qs = qs.annotate(rank=SearchRank(F("search_vector"), query))
+    return qs.order_by("-rank", *qs.model._meta.ordering)
+
+
+def _plain_recipes_search(queryset, value):
+    """
+    Fallback backend for databases without full-text search (SQLite in
+    tests). Every word must be in the name or in the text of the recipe.
+    A word found in the name scores 2, in the text only 1. There is no
+    stemming, so the words are matched as substrings, and SQLite ignores
+    case of ASCII letters only.
+    """
+    words = value.split()
+    if not words:
+        return queryset
+
+    for word in words:
+        queryset = queryset.filter(
+            Q(name__icontains=word) | Q(text__icontains=word)
+        )
+    scores = (
+        Case(
+            When(Q(name__icontains=word), then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+        for word in words
+    )
+    qs = queryset.annotate(rank=reduce(add, scores))
+    return qs.order_by("-rank", *qs.model._meta.ordering)
+
+
+def search_recipes(queryset, value):
+    """
+    Returns recipes with words from 'value' in their names or texts,
+    the most relevant first.
+    """
+    if connection.vendor == "postgresql":
+        return _full_text_recipes_search(queryset, value)
+    return _plain_recipes_search(queryset, value)
+
+
+def search_recipes_by_ingredients(queryset, ingredients_ids, min_matches=1):
+    """
+    Returns recipes with at least 'min_matches' of 'ingredients_ids'
+    ("what can I cook with what I have"). Recipes are annotated with
+    'matched_ingredients' and 'coverage', the share of the recipe's
+    ingredients that are in 'ingredients_ids', and ordered by coverage.
+
+    Candidates are taken from the (ingredient, recipe) index, then both
+    counters are computed with one grouped aggregate over their rows.
+    """
+    from .models import RecipeIngredient
+
+    ingredients_ids = set(ingredients_ids)
+    candidates = RecipeIngredient.objects.filter(
+        ingredient_id__in=ingredients_ids
+    ).values("recipe_id")
+
+    qs = queryset.filter(id__in=candidates).annotate(
+        matched_ingredients=Count(
+            "recipeingredients",
+            filter=Q(recipeingredients__ingredient_id__in=ingredients_ids),
+            distinct=True,
+        ),
+        total_ingredients=Count("recipeingredients", distinct=True),
+    )
+    qs = qs.filter(matched_ingredients__gte=min_matches).annotate(
+        coverage=(
+            Cast("matched_ingredients", FloatField())
+            / Cast("total_ingredients", FloatField())
+        )
+    )
+    return qs.order_by(
+        "-coverage", "-matched_ingredients", *qs.model._meta.ordering
+    )
@@ -1,12 +1,76 @@
 from typing import Sequence
 
+from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.urls import reverse
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from ..core.tasks import run_in_background
+from ..core.utils import change_counter
 from ..users.serializers import UserSerializer
-from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag
+from .cart import (
+    get_recipes_amounts,
+    lock_recipes,
+    update_recipe_in_cart_totals,
+)
+from .feed import fan_out_recipe
+from .images import IMAGE_FIELD, process_recipe_image, store_recipe_image
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCartPDF,
+)
+
+User = get_user_model()
+
+IMAGE_VARIANTS_PARAM = "image_variants"
+
+
+def image_variants_requested(context):
+    """Image variants are added to recipes by '?image_variants=true'."""
+    request = context.get("request")
+    if request is None:
+        return False
+    # 'GET' works for both DRF and plain Django requests
+    value = request.GET.get(IMAGE_VARIANTS_PARAM, "")
+    return value.lower() in ("1", "true")
+
+
+def get_image_variants_urls(variants, request=None):
+    """Builds '{"width", "image", "webp"}' URLs of stored image variants."""
+    urls = []
+    for variant in variants:
+        image_url = IMAGE_FIELD.storage.url(variant["image"])
+        webp_url = IMAGE_FIELD.storage.url(variant["webp"])
+        if request is not None:
+            image_url = request.build_absolute_uri(image_url)
+            webp_url = request.build_absolute_uri(webp_url)
+        urls.append(
+            {"width": variant["width"], "image": image_url, "webp": webp_url}
+        )
+    return urls
+
+
+class ImageVariantsMixin:
+    """
+    Adds "image_variants" field to the end of recipe representation if it
+    is requested. See 'image_variants_requested'.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if image_variants_requested(self.context):
+            fields[IMAGE_VARIANTS_PARAM] = serializers.SerializerMethodField()
+        return fields
+
+    def get_image_variants(self, instance):
+        return get_image_variants_urls(
+            instance.image_variants, self.context.get("request")
+        )
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -27,7 +91,7 @@ class RecipeTagSerializer(serializers.ModelSerializer):
         read_only_fields = ["color", "name", "slug"]
 
 
-class BaseRecipeSerializer(serializers.ModelSerializer):
+class BaseRecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = [
@@ -80,7 +144,7 @@ class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
         ]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     """
     Simple recipes serializer but requires annotated queryset with
         - "is_favorited" field
@@ -106,7 +170,130 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = "__all__"
+        exclude = [
+            "favorites_count",
+            "cart_count",
+            "search_vector",
+            "updated_at",
+            "image_status",
+            "image_variants",
+            "feed_fanout",
+        ]
+
+
+class CurrentTimezoneDateTimeField(serializers.DateTimeField):
+    """
+    DateTimeField that looks up the current timezone once, not for every
+    value. It is meant to be created per request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._current_timezone = super().default_timezone()
+
+    def default_timezone(self):
+        return self._current_timezone
+
+
+class RecipeReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only version of 'RecipeSerializer' with the same output. It
+    doesn't use serializer fields and builds representation from plain
+    attributes, so it requires the same annotated and prefetched queryset.
+    Ingredients are taken from 'ingredient_rows' of recipes fetched with
+    'with_ingredient_rows'. Authors and tags are represented once per
+    serializer instance.
+    """
+
+    author_fields = UserSerializer.Meta.fields
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._authors = {}
+        self._tags = {}
+        self._pub_date_field = CurrentTimezoneDateTimeField()
+        self._image_variants = None
+
+    def _get_author(self, author):
+        data = self._authors.get(author.id)
+        if data is None:
+            data = {
+                field: getattr(author, field) for field in self.author_fields
+            }
+            data["is_subscribed"] = bool(data["is_subscribed"])
+            self._authors[author.id] = data
+        return data
+
+    def _get_tag(self, tag):
+        data = self._tags.get(tag.id)
+        if data is None:
+            data = {
+                "id": tag.id,
+                "color": tag.color,
+                "name": tag.name,
+                "slug": tag.slug,
+            }
+            self._tags[tag.id] = data
+        return data
+
+    @staticmethod
+    def _get_ingredient_rows(instance):
+        rows = getattr(instance, "ingredient_rows", None)
+        if rows is None:
+            rows = [
+                (
+                    recipeingredient.ingredient.id,
+                    recipeingredient.ingredient.name,
+                    recipeingredient.ingredient.measurement_unit.name,
+                    recipeingredient.amount,
+                )
+                for recipeingredient in instance.recipeingredients.all()
+            ]
+        return rows
+
+    def _get_image_url(self, image):
+        if not image:
+            return None
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(image.url)
+        return image.url
+
+    def to_representation(self, instance):
+        data = {
+            "id": instance.id,
+            "author": self._get_author(instance.author),
+            "tags": [self._get_tag(tag) for tag in instance.tags.all()],
+            "ingredients": [
+                {
+                    "id": ingredient_id,
+                    "name": name,
+                    "measurement_unit": measurement_unit,
+                    "amount": amount,
+                }
+                for ingredient_id, name, measurement_unit, amount in (
+                    self._get_ingredient_rows(instance)
+                )
+            ],
+            "is_favorited": bool(getattr(instance, "is_favorited", False)),
+            "is_in_shopping_cart": bool(
+                getattr(instance, "is_in_shopping_cart", False)
+            ),
+            "name": instance.name,
+            "image": self._get_image_url(instance.image),
+            "text": instance.text,
+            "cooking_time": instance.cooking_time,
+            "pub_date": self._pub_date_field.to_representation(
+                instance.pub_date
+            ),
+        }
+        if self._image_variants is None:
+            self._image_variants = image_variants_requested(self.context)
+        if self._image_variants:
+            data[IMAGE_VARIANTS_PARAM] = get_image_variants_urls(
+                instance.image_variants, self.context.get("request")
+            )
+        return data
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -192,18 +379,41 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         ), "каждый из параметров должен быть непустым."
 
         instance.tags.set(tags)
+        lock_recipes([instance.id])
+        old_amounts = get_recipes_amounts([instance.id])
         RecipeIngredient.objects.filter(recipe=instance).delete()
-        recipe_ingredients = (
+        recipe_ingredients = [
             RecipeIngredient(
                 recipe=instance,
                 ingredient=recipeingredient["ingredient"],
                 amount=recipeingredient["amount"],
             )
             for recipeingredient in recipeingredients
-        )
+        ]
         RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        if old_amounts:
+            new_amounts = {
+                recipe_ingredient.ingredient.id: recipe_ingredient.amount
+                for recipe_ingredient in recipe_ingredients
+            }
+            update_recipe_in_cart_totals(instance.id, old_amounts, new_amounts)
+
+    @staticmethod
+    def _store_image(validated_data):
+        """
+        Stores the new image (if it's provided) before the transaction is
+        opened. See 'store_recipe_image'.
+        """
+        image = validated_data.pop("image", None)
+        if image is None:
+            return None
+        return store_recipe_image(image)
+
+    @staticmethod
+    def _process_image(recipe):
+        """New image is processed in background after commit."""
+        run_in_background(process_recipe_image, recipe.id, recipe.image.name)
 
-    @transaction.atomic
     def create(self, validated_data):
         """
         Creates "Recipe" and sets tags and ingredients (recipeingredients) for
@@ -214,16 +424,26 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipeingredients = validated_data.pop("recipeingredients")
         tags = validated_data.pop("tags")
 
-        recipe = Recipe.objects.create(**validated_data)
+        image = self._store_image(validated_data)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(
+                image=image,
+                image_status=Recipe.IMAGE_PENDING,
+                **validated_data,
+            )
+            change_counter(
+                User.objects.filter(id=recipe.author_id), "recipes_count", 1
+            )
 
-        self._save_related_objects(
-            instance=recipe,
-            tags=tags,
-            recipeingredients=recipeingredients,
-        )
+            self._save_related_objects(
+                instance=recipe,
+                tags=tags,
+                recipeingredients=recipeingredients,
+            )
+            self._process_image(recipe)
+            run_in_background(fan_out_recipe, recipe.id)
         return recipe
 
-    @transaction.atomic
     def update(self, instance, validated_data):
         """
         Assumes that the whole object provided. It doesn't support partial
@@ -233,17 +453,57 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipeingredients = validated_data.pop("recipeingredients")
         tags = validated_data.pop("tags")
 
-        for (key, value) in validated_data.items():
-            setattr(instance, key, value)
-        instance.save()
-
-        self._save_related_objects(
-            instance=instance,
-            tags=tags,
-            recipeingredients=recipeingredients,
-        )
+        image = self._store_image(validated_data)
+        with transaction.atomic():
+            # The instance was loaded at the start of the request. Only the
+            # changed fields are written, so counters and fields set by
+            # background tasks meanwhile are not overridden.
+            update_fields = ["updated_at"]
+            if image is not None:
+                instance.image = image
+                instance.image_status = Recipe.IMAGE_PENDING
+                instance.image_variants = []
+                update_fields += ["image", "image_status", "image_variants"]
+            for key in ("name", "text", "cooking_time"):
+                if key in validated_data:
+                    setattr(instance, key, validated_data[key])
+                    update_fields.append(key)
+            instance.save(update_fields=update_fields)
+
+            self._save_related_objects(
+                instance=instance,
+                tags=tags,
+                recipeingredients=recipeingredients,
+            )
+            if image is not None:
+                self._process_image(instance)
         return instance
 
     def to_representation(self, instance):
         serializer = RecipeSerializer(instance, context=self.context)
         return serializer.data
+
+
+class ShoppingCartPDFSerializer(serializers.ModelSerializer):
+    """Status of shopping list PDF rendering."""
+
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingCartPDF
+        fields = [
+            "id",
+            "status",
+            "created_at",
+            "download_url",
+        ]
+
+    def get_download_url(self, obj):
+        if obj.status != ShoppingCartPDF.DONE:
+            return None
+
+        url = reverse("recipes-shopping-cart-pdf-download", args=[obj.id])
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from ..core.utils import change_counter
+from .cache import bump_catalog_version, bump_recipes_version
+from .cart import delete_recipe_from_cart_totals
+from .models import (
+    Ingredient,
+    MeasurementUnit,
+    Recipe,
+    RecipeCart,
+    RecipeFavorite,
+    RecipeIngredient,
+    RecipeTag,
+)
+
+User = get_user_model()
+
+CATALOG_MODELS = [Ingredient, MeasurementUnit, RecipeTag]
+# Models that anonymous recipes responses are rendered from
+RECIPES_MODELS = [Recipe, RecipeIngredient, *CATALOG_MODELS]
+
+
+for model in CATALOG_MODELS:
+    receiver(post_save, sender=model)(bump_catalog_version)
+    receiver(post_delete, sender=model)(bump_catalog_version)
+
+for model in RECIPES_MODELS:
+    receiver(post_save, sender=model)(bump_recipes_version)
+    receiver(post_delete, sender=model)(bump_recipes_version)
+receiver(m2m_changed, sender=Recipe.tags.through)(bump_recipes_version)
+
+
+@receiver(post_save, sender=User)
+def bump_recipes_version_on_author_change(update_fields=None, **kwargs):
+    """Logins update 'last_login' only, it is not in recipes responses."""
+    if update_fields is None or set(update_fields) - {"last_login"}:
+        bump_recipes_version()
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_from_recipes_lists(instance, **kwargs):
+    """
+    User's recipes, favorites and cart are deleted by cascade. Beforehand
+    the recipes are removed from other users' shopping lists and the
+    counters of the recipes the user favorited or carted are decreased.
+    """
+    recipes_ids = Recipe.objects.filter(author=instance).values_list(
+        "id", flat=True
+    )
+    for recipe_id in recipes_ids:
+        delete_recipe_from_cart_totals(recipe_id)
+
+    for model, counter_field in (
+        (RecipeFavorite, "favorites_count"),
+        (RecipeCart, "cart_count"),
+    ):
+        user_recipes_ids = model.objects.filter(user=instance).values(
+            "recipe_id"
+        )
+        change_counter(
+            Recipe.objects.filter(id__in=user_recipes_ids), counter_field, -1
+        )
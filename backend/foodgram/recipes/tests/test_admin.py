@@ -0,0 +1,125 @@
+from io import BytesIO
+from tempfile import mkdtemp
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ...users.factories import UserFactory
+from ..factories import (
+    IngredientFactory,
+    MeasurementUnitFactory,
+    RecipeFactory,
+    RecipeTagFactory,
+)
+from ..models import CartIngredientTotal, Recipe, RecipeCart, RecipeFavorite
+
+
+@override_settings(MEDIA_ROOT=mkdtemp(), RECIPE_IMAGE_VARIANT_WIDTHS=[20])
+class RecipeAdminCountersTests(TestCase):
+    """Admin keeps counters and processes images like the API does."""
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.admin = UserFactory(is_staff=True, is_superuser=True)
+        cls.author = UserFactory()
+        measurement_unit = MeasurementUnitFactory()
+        cls.ingredient = IngredientFactory(measurement_unit=measurement_unit)
+        cls.tag = RecipeTagFactory()
+        cls.recipe = RecipeFactory(
+            author=cls.author, ingredients=[cls.ingredient]
+        )
+
+    def setUp(self) -> None:
+        self.client.force_login(RecipeAdminCountersTests.admin)
+
+    def get_recipe(self):
+        return Recipe.objects.get(id=RecipeAdminCountersTests.recipe.id)
+
+    def test_favorite_and_cart_counters(self):
+        recipe = RecipeAdminCountersTests.recipe
+        for model, counter_field in (
+            (RecipeFavorite, "favorites_count"),
+            (RecipeCart, "cart_count"),
+        ):
+            with self.subTest(model=model.__name__):
+                opts = model._meta
+                self.client.post(
+                    reverse(f"admin:recipes_{opts.model_name}_add"),
+                    {"user": self.admin.id, "recipe": recipe.id},
+                )
+                self.assertEqual(getattr(self.get_recipe(), counter_field), 1)
+
+                obj = model.objects.get(user=self.admin, recipe=recipe)
+                self.client.post(
+                    reverse(
+                        f"admin:recipes_{opts.model_name}_delete",
+                        args=[obj.id],
+                    ),
+                    {"post": "yes"},
+                )
+                self.assertEqual(getattr(self.get_recipe(), counter_field), 0)
+
+        self.assertFalse(
+            CartIngredientTotal.objects.filter(user=self.admin).exists()
+        )
+
+    def test_recipes_count_after_delete(self):
+        author = RecipeAdminCountersTests.author
+        other_recipe = RecipeFactory(author=author)
+        # Factories don't change counters
+        type(author).objects.filter(id=author.id).update(recipes_count=2)
+
+        self.client.post(
+            reverse("admin:recipes_recipe_changelist"),
+            {
+                "action": "delete_selected",
+                "_selected_action": [other_recipe.id],
+                "post": "yes",
+            },
+        )
+        self.assertFalse(Recipe.objects.filter(id=other_recipe.id).exists())
+        author.refresh_from_db()
+        self.assertEqual(author.recipes_count, 1)
+
+    def test_new_image_is_processed(self):
+        recipe = RecipeAdminCountersTests.recipe
+        Recipe.objects.filter(id=recipe.id).update(
+            image_variants=[{"width": 20, "image": "old", "webp": "old"}]
+        )
+        recipe_ingredient = recipe.recipeingredients.get()
+        content = BytesIO()
+        Image.new("RGB", (40, 40), color="blue").save(content, format="PNG")
+
+        response = self.client.post(
+            reverse("admin:recipes_recipe_change", args=[recipe.id]),
+            {
+                "author": recipe.author_id,
+                "name": recipe.name,
+                "image": SimpleUploadedFile(
+                    "new.png", content.getvalue(), content_type="image/png"
+                ),
+                "text": recipe.text,
+                "cooking_time": recipe.cooking_time,
+                "tags": [RecipeAdminCountersTests.tag.id],
+                "recipeingredients-TOTAL_FORMS": 1,
+                "recipeingredients-INITIAL_FORMS": 1,
+                "recipeingredients-MIN_NUM_FORMS": 1,
+                "recipeingredients-MAX_NUM_FORMS": 1000,
+                "recipeingredients-0-id": recipe_ingredient.id,
+                "recipeingredients-0-recipe": recipe.id,
+                "recipeingredients-0-ingredient": self.ingredient.id,
+                "recipeingredients-0-amount": recipe_ingredient.amount,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+
+        recipe = self.get_recipe()
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
+        self.assertNotEqual(
+            recipe.image_variants[0]["image"],
+            "old",
+            msg="Копии новой картинки должны быть сделаны заново.",
+        )
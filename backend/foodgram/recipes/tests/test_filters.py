@@ -1,5 +1,7 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.test import APIClient, APITestCase, override_settings
 
 from ...users.factories import UserFactory
 from ..factories import (
@@ -79,6 +81,88 @@ class RecipesFilterTests(APITestCase):
             ),
         )
 
+    def test_recipes_tags_mode_filter(self):
+        """
+        Recipe with several tags is returned once, with 'tags_mode=all'
+        only recipes with every tag are returned.
+        """
+        client = RecipesFilterTests.authorized_client
+        recipe = RecipeFactory(
+            author=RecipesFilterTests.user,
+            tags=[RecipesFilterTests.tag1, RecipesFilterTests.tag2],
+        )
+
+        response_data = client.get(
+            URL_RECIPES_LIST + "?tags=tag1&tags=tag2&limit=20"
+        ).data
+        recipes_ids = [item["id"] for item in response_data["results"]]
+        self.assertEqual(response_data["count"], 9)
+        self.assertEqual(
+            len(recipes_ids),
+            len(set(recipes_ids)),
+            msg="Рецепты с несколькими тегами не должны повторяться.",
+        )
+
+        response_data = client.get(
+            URL_RECIPES_LIST + "?tags=tag1&tags=tag2&tags_mode=all"
+        ).data
+        self.assertEqual(
+            [item["id"] for item in response_data["results"]],
+            [recipe.id],
+            msg="С 'tags_mode=all' у рецепта должны быть все теги.",
+        )
+
+    def test_recipes_tags_filter_query(self):
+        """
+        Tags are filtered with semi-join: recipes query has neither
+        DISTINCT nor join of tags.
+        """
+        client = RecipesFilterTests.authorized_client
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(URL_RECIPES_LIST + "?tags=tag1&tags=tag2")
+        self.assertEqual(response.status_code, 200)
+
+        recipes_queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('SELECT "recipes_recipe"."id"')
+        ]
+        self.assertTrue(recipes_queries)
+        for sql in recipes_queries:
+            self.assertNotIn("DISTINCT", sql)
+            self.assertNotIn('JOIN "recipes_recipetag"', sql)
+            self.assertNotIn('JOIN "recipes_recipe_tags"', sql)
+
+    def test_recipes_unknown_tag_filter(self):
+        """Unknown tag slug is a validation error."""
+        client = RecipesFilterTests.authorized_client
+
+        response = client.get(URL_RECIPES_LIST, {"tags": "unknown"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipes_tags_filter_with_cursor_pagination(self):
+        """Filters work the same way in the keyset pagination mode."""
+        client = RecipesFilterTests.authorized_client
+        query_part_url = "?tags=tag1&tags=tag2&pagination=cursor&limit=5"
+
+        response_data = client.get(URL_RECIPES_LIST + query_part_url).data
+        results_count = len(response_data.get("results"))
+        next_url = response_data.get("next")
+        while next_url is not None:
+            response_data = client.get(next_url).data
+            results_count += len(response_data.get("results"))
+            next_url = response_data.get("next")
+
+        self.assertEqual(
+            results_count,
+            8,
+            msg=(
+                "Курсорная паджинация: проверьте фильтрацию по 2 тэгам. "
+                "Все страницы вместе должны содержать 8 рецептов."
+            ),
+        )
+
     def test_authorized_user_recipes_is_in_shopping_cart_filter(self):
         """Count objects in response. Should match to cart objects."""
         user = RecipesFilterTests.user
@@ -129,6 +213,27 @@ class RecipesFilterTests(APITestCase):
             msg="Создали 2 объектов в избранном. Должны их возвращать.",
         )
 
+    @override_settings(RECIPES_USER_STATE_STRATEGY="batch")
+    def test_batch_user_state_strategy_filters(self):
+        """Filters by user's state work with 'batch' strategy too."""
+        user = RecipesFilterTests.user
+        client = RecipesFilterTests.authorized_client
+        RecipeFavoriteFactory.create_batch(4, user=user)
+        RecipeCartFactory.create_batch(3, user=user)
+
+        for query_params, expected_count in (
+            ({"is_favorited": True}, 4),
+            ({"is_favorited": False}, 14),
+            ({"is_in_shopping_cart": True}, 3),
+        ):
+            with self.subTest(query_params=query_params):
+                response_data = client.get(URL_RECIPES_LIST, query_params).data
+                self.assertEqual(response_data.get("count"), expected_count)
+
+                for recipe in response_data.get("results"):
+                    for field, value in query_params.items():
+                        self.assertEqual(recipe[field], value)
+
     def test_unauthorized_user_recipes_author_filter(self):
         """Creates user in count objects in response while filtering."""
         other_user = UserFactory()
@@ -151,6 +256,180 @@ class RecipesFilterTests(APITestCase):
         )
 
 
+class RecipesSearchFilterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+
+        cls.user = UserFactory()
+        RecipeFactory(
+            author=cls.user,
+            name="Домашний борщ",
+            text="Сварить бульон, добавить свеклу.",
+        )
+        RecipeFactory(
+            author=cls.user,
+            name="Холодный суп",
+            text="Почти как борщ, только холодный.",
+        )
+        RecipeFactory(
+            author=cls.user,
+            name="Блины",
+            text="Смешать муку и молоко.",
+        )
+
+        cls.unauthorized_client = APIClient()
+
+    def search(self, value):
+        client = RecipesSearchFilterTests.unauthorized_client
+        response = client.get(URL_RECIPES_LIST, {"search": value})
+        return [recipe["name"] for recipe in response.data["results"]]
+
+    def test_search_by_name_and_text(self):
+        """Recipes are found by words in their names and texts."""
+        self.assertEqual(
+            self.search("борщ"),
+            ["Домашний борщ", "Холодный суп"],
+            msg="Рецепты с совпадением в названии должны идти первыми.",
+        )
+
+    def test_search_all_words_must_match(self):
+        """Every word of the query must be in the recipe."""
+        self.assertEqual(self.search("борщ свеклу"), ["Домашний борщ"])
+        self.assertEqual(self.search("борщ блины"), [])
+
+    def test_search_with_other_filters(self):
+        """Search is combined with other filters."""
+        other_author = UserFactory()
+        RecipeFactory(author=other_author, name="Другой борщ")
+        client = RecipesSearchFilterTests.unauthorized_client
+
+        response = client.get(
+            URL_RECIPES_LIST, {"search": "борщ", "author": other_author.id}
+        )
+        self.assertEqual(
+            [recipe["name"] for recipe in response.data["results"]],
+            ["Другой борщ"],
+        )
+
+
+class RecipesIngredientsFilterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+
+        cls.user = UserFactory()
+        unit = MeasurementUnitFactory()
+        cls.egg, cls.milk, cls.flour, cls.meat = (
+            IngredientFactory(name=name, measurement_unit=unit)
+            for name in ("яйца", "молоко", "мука", "мясо")
+        )
+        RecipeFactory(
+            author=cls.user,
+            name="Омлет",
+            ingredients=[cls.egg, cls.milk],
+        )
+        RecipeFactory(
+            author=cls.user,
+            name="Блины",
+            ingredients=[cls.egg, cls.milk, cls.flour],
+        )
+        RecipeFactory(
+            author=cls.user,
+            name="Пельмени",
+            ingredients=[cls.flour, cls.meat],
+        )
+
+        cls.unauthorized_client = APIClient()
+
+    def search(self, ingredients, **query_params):
+        client = RecipesIngredientsFilterTests.unauthorized_client
+        query_params["ingredients"] = ",".join(
+            str(ingredient.id) for ingredient in ingredients
+        )
+        response = client.get(URL_RECIPES_LIST, query_params)
+        return [recipe["name"] for recipe in response.data["results"]]
+
+    def test_ingredients_any_mode(self):
+        """
+        By default recipes with any of the ingredients are returned, the
+        recipes with larger share of ingredients go first.
+        """
+        self.assertEqual(
+            self.search([self.egg, self.milk]),
+            ["Омлет", "Блины"],
+            msg="Рецепты должны быть упорядочены по доле ингредиентов.",
+        )
+        self.assertEqual(
+            self.search([self.milk, self.meat]),
+            ["Пельмени", "Омлет", "Блины"],
+            msg="При равной доле новые рецепты идут первыми.",
+        )
+
+    def test_ingredients_all_mode(self):
+        """Recipes have to contain every ingredient."""
+        self.assertEqual(
+            self.search(
+                [self.egg, self.milk, self.flour], ingredients_mode="all"
+            ),
+            ["Блины"],
+        )
+
+    def test_ingredients_at_least_n_mode(self):
+        """Recipes have to contain at least 'ingredients_min' ingredients."""
+        self.assertEqual(
+            self.search(
+                [self.egg, self.flour, self.meat],
+                ingredients_mode="at_least_n",
+                ingredients_min=2,
+            ),
+            ["Пельмени", "Блины"],
+        )
+
+    def test_ingredients_fractional_values(self):
+        """Fractional ingredients ids and minimum are rejected."""
+        client = RecipesIngredientsFilterTests.unauthorized_client
+        for query_params in (
+            {"ingredients": f"{self.egg.id}.9"},
+            {
+                "ingredients": f"{self.egg.id},{self.milk.id}",
+                "ingredients_mode": "at_least_n",
+                "ingredients_min": "1.5",
+            },
+        ):
+            with self.subTest(query_params=query_params):
+                response = client.get(URL_RECIPES_LIST, query_params)
+                self.assertEqual(
+                    response.status_code,
+                    400,
+                    msg="Дробные значения должны отклоняться.",
+                )
+
+    def test_ingredients_with_tags_filter(self):
+        """Tags join doesn't change the number of matched ingredients."""
+        tag_1 = RecipeTagFactory(name="завтрак")
+        tag_2 = RecipeTagFactory(name="ужин")
+        RecipeFactory(
+            author=self.user,
+            name="Яичница",
+            ingredients=[self.egg],
+            tags=[tag_1, tag_2],
+        )
+
+        self.assertEqual(
+            self.search(
+                [self.egg, self.milk],
+                ingredients_mode="all",
+                tags=[tag_1.slug, tag_2.slug],
+            ),
+            [],
+        )
+        self.assertEqual(
+            self.search([self.egg], tags=[tag_1.slug, tag_2.slug]),
+            ["Яичница"],
+        )
+
+
 class IngredientsFilterTests(APITestCase):
     @classmethod
     def setUpTestData(cls) -> None:
@@ -194,3 +473,29 @@ class IngredientsFilterTests(APITestCase):
             "анаша",
             msg="Убедитесь, что фильтр по ингредиентам работает.",
         )
+
+    def test_ingredients_name_filter_limit(self):
+        """The number of found ingredients is limited with 'limit'."""
+        client = IngredientsFilterTests.unauthorized_client
+        query_params = {"name": "а", "limit": 1}
+
+        response_data = client.get(URL_INGREDIENTS_LIST, query_params).data
+        self.assertEqual(
+            len(response_data),
+            1,
+            msg="Убедитесь, что 'limit' ограничивает количество ингредиентов.",
+        )
+        self.assertEqual(
+            response_data[0]["name"],
+            "анаша",
+            msg="Ингредиенты, которые начинаются с 'name', идут первыми.",
+        )
+
+    @override_settings(INGREDIENTS_SEARCH_LIMIT=2)
+    def test_ingredients_name_filter_default_limit(self):
+        """Without 'limit' INGREDIENTS_SEARCH_LIMIT setting is used."""
+        client = IngredientsFilterTests.unauthorized_client
+        query_params = {"name": "а"}
+
+        response_data = client.get(URL_INGREDIENTS_LIST, query_params).data
+        self.assertEqual(len(response_data), 2)
@@ -1,9 +1,23 @@
+import json
+from datetime import timedelta
 from io import StringIO
+from tempfile import mkdtemp
 
+from django.core.files.base import ContentFile
 from django.core.management import call_command
-from django.test import TestCase
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
 from ...users.factories import UserFactory
+from ..factories import (
+    IngredientFactory,
+    MeasurementUnitFactory,
+    RecipeCartFactory,
+    RecipeFactory,
+    RecipeFavoriteFactory,
+)
+from ..models import CartIngredientTotal, Recipe, RecipeCart
 
 
 class FillRecipesTest(TestCase):
@@ -12,3 +26,323 @@ class FillRecipesTest(TestCase):
         out = StringIO()
         call_command("fill_recipes", 20, stdout=out)
         self.assertIn("Рецепты созданы успешно.", out.getvalue())
+
+
+class BenchmarkUserStateTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_user_state",
+            "--recipes=30",
+            "--favorites=60",
+            "--users=3",
+            "--repeat=2",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertIn("subquery", results)
+        self.assertIn("batch", results)
+
+
+class ReconcileCountersTest(TestCase):
+    def test_command_repairs_counters(self):
+        """Counters of objects created without views are repaired."""
+        user = UserFactory()
+        recipe = RecipeFactory(author=user)
+        RecipeFavoriteFactory(user=user, recipe=recipe)
+        Recipe.objects.filter(id=recipe.id).update(cart_count=5)
+
+        out = StringIO()
+        call_command("reconcile_counters", stdout=out)
+
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.cart_count, 0)
+        self.assertEqual(user.recipes_count, 1)
+        self.assertIn(
+            "Исправлено рецептов: 1, пользователей: 1.", out.getvalue()
+        )
+
+
+class BenchmarkIngredientSearchTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_ingredient_search",
+            "--scale=1",
+            "--terms=3",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertIn("search_ingredients", results)
+        self.assertIn("p95_ms", results["search_ingredients"])
+
+
+class BenchmarkShoppingCartTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_shopping_cart",
+            "--carts",
+            "1",
+            "2",
+            "--ingredients=5",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(set(results), {"1_recipes", "2_recipes", "database"})
+        for export_format in ("pdf", "txt", "csv", "json"):
+            self.assertIn("peak_kib", results["2_recipes"][export_format])
+
+
+class CartTotalsCommandsTest(TestCase):
+    def setUp(self) -> None:
+        self.user = UserFactory()
+        measurement_unit = MeasurementUnitFactory()
+        ingredients = IngredientFactory.create_batch(
+            2, measurement_unit=measurement_unit
+        )
+        self.recipe = RecipeFactory(author=self.user, ingredients=ingredients)
+        RecipeCartFactory(user=self.user, recipe=self.recipe)
+
+    def test_check_cart_totals_finds_and_fixes_drift(self):
+        out = StringIO()
+        call_command("check_cart_totals", stdout=out)
+        self.assertIn("Расхождений не найдено.", out.getvalue())
+
+        CartIngredientTotal.objects.filter(user=self.user).update(amount=1)
+        with self.assertRaises(CommandError):
+            call_command("check_cart_totals", stdout=StringIO())
+
+        call_command("check_cart_totals", "--fix", stdout=StringIO())
+        out = StringIO()
+        call_command("check_cart_totals", stdout=out)
+        self.assertIn("Расхождений не найдено.", out.getvalue())
+
+    def test_rebuild_cart_totals(self):
+        """Carts changed without maintenance functions are rebuilt."""
+        RecipeCart.objects.filter(user=self.user).delete()
+        other_user = UserFactory()
+        RecipeCart.objects.create(user=other_user, recipe=self.recipe)
+
+        out = StringIO()
+        call_command("rebuild_cart_totals", stdout=out)
+
+        self.assertIn("Пользователей: 2.", out.getvalue())
+        self.assertFalse(CartIngredientTotal.objects.filter(user=self.user))
+        self.assertEqual(
+            CartIngredientTotal.objects.filter(user=other_user).count(), 2
+        )
+
+
+class BenchmarkRecipeSerializerTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_recipe_serializer",
+            "--recipes=5",
+            "--users=2",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["recipes"], 5)
+        for name in ("RecipeSerializer", "RecipeReadSerializer"):
+            self.assertIn("per_1000_recipes_ms", results[name])
+
+
+class BenchmarkRecipeIngredientsTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_recipe_ingredients",
+            "--page-sizes",
+            "2",
+            "5",
+            "--recipe-ingredients=3",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        for page in ("page_2", "page_5"):
+            prefetch = results[page]["prefetch_related"]
+            rows = results[page]["with_ingredient_rows"]
+            self.assertIn("peak_kib", rows)
+            self.assertLess(
+                rows["queries"],
+                prefetch["queries"],
+                msg="Ингредиенты должны загружаться меньшим числом запросов.",
+            )
+
+
+class BenchmarkRecipeSearchTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_recipe_search",
+            "--recipes=20",
+            "--terms=2",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["terms"], 2)
+        for name in ("name_icontains", "search_recipes"):
+            self.assertEqual(results[name]["queries"], 1)
+
+
+class BenchmarkIngredientsFilterTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_ingredients_filter",
+            "--recipes=10",
+            "--recipe-ingredients=3",
+            "--ingredients=10",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["recipe_ingredients"], 30)
+        for mode in ("any", "at_least_n", "all"):
+            self.assertEqual(results[mode]["queries"], 1)
+
+
+@override_settings(MEDIA_ROOT=mkdtemp(), RECIPE_IMAGE_VARIANT_WIDTHS=[20, 50])
+class MakeRecipeImageVariantsTest(TestCase):
+    def test_command_output(self):
+        author = UserFactory()
+        recipes = RecipeFactory.create_batch(2, author=author)
+        storage = recipes[0].image.storage
+
+        out = StringIO()
+        call_command("make_recipe_image_variants", "--workers=0", stdout=out)
+        self.assertIn("Рецептов: 2, с ошибками: 0.", out.getvalue())
+
+        recipe = Recipe.objects.get(id=recipes[0].id)
+        self.assertEqual(
+            [variant["width"] for variant in recipe.image_variants], [20, 50]
+        )
+        old_variants = recipe.image_variants
+
+        out = StringIO()
+        call_command("make_recipe_image_variants", "--workers=0", stdout=out)
+        self.assertIn("Рецептов: 0", out.getvalue())
+
+        call_command(
+            "make_recipe_image_variants",
+            "--workers=0",
+            "--all",
+            stdout=StringIO(),
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(
+            recipe.image_variants,
+            old_variants,
+            msg="Одинаковые копии должны храниться одним файлом.",
+        )
+        for variant in recipe.image_variants:
+            self.assertTrue(storage.exists(variant["webp"]))
+
+    @override_settings(RECIPE_IMAGE_PENDING_TIMEOUT=60)
+    def test_pending_images(self):
+        author = UserFactory()
+        stale, fresh = RecipeFactory.create_batch(2, author=author)
+        Recipe.objects.filter(id__in=[stale.id, fresh.id]).update(
+            image_status=Recipe.IMAGE_PENDING
+        )
+        Recipe.objects.filter(id=stale.id).update(
+            updated_at=timezone.now() - timedelta(minutes=2)
+        )
+
+        out = StringIO()
+        call_command(
+            "make_recipe_image_variants",
+            "--workers=0",
+            "--pending",
+            stdout=out,
+        )
+        self.assertIn("Рецептов: 1, с ошибками: 0.", out.getvalue())
+
+        stale.refresh_from_db()
+        self.assertEqual(stale.image_status, Recipe.IMAGE_READY)
+        self.assertEqual(
+            [variant["width"] for variant in stale.image_variants], [20, 50]
+        )
+        fresh.refresh_from_db()
+        self.assertEqual(
+            fresh.image_status,
+            Recipe.IMAGE_PENDING,
+            msg="Недавно загруженные картинки не обрабатываются повторно.",
+        )
+
+
+class BenchmarkImageStorageTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_image_storage",
+            "--uploads=6",
+            "--distinct=2",
+            "--image-side=16",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["ContentHashStorage"]["files"], 2)
+        self.assertEqual(results["FileSystemStorage"]["files"], 7)
+
+
+@override_settings(MEDIA_ROOT=mkdtemp())
+class DeleteOrphanImagesTest(TestCase):
+    def test_command_output(self):
+        recipe = RecipeFactory(author=UserFactory())
+        orphan = recipe.image.storage.save(
+            "recipes/images/orphan.txt", ContentFile(b"orphan")
+        )
+
+        out = StringIO()
+        call_command(
+            "delete_orphan_images", "--min-age=0", "--dry-run", stdout=out
+        )
+        self.assertIn("Будет удалено файлов: 1", out.getvalue())
+        self.assertTrue(recipe.image.storage.exists(orphan))
+
+        out = StringIO()
+        call_command("delete_orphan_images", "--min-age=0", stdout=out)
+        self.assertIn("Удалено файлов: 1", out.getvalue())
+        self.assertFalse(recipe.image.storage.exists(orphan))
+        self.assertTrue(recipe.image.storage.exists(recipe.image.name))
+
+
+class BenchmarkFeedTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_feed",
+            "--authors=10",
+            "--readers=4",
+            "--follows=3",
+            "--author-recipes=2",
+            "--popular=1",
+            "--pages=1",
+            "--page-size=2",
+            "--repeat=1",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        first_page = results["first_page"]
+        self.assertEqual(first_page["per_author_requests"]["queries"], 3)
+        self.assertEqual(first_page["fan_out_on_read"]["queries"], 1)
+        self.assertEqual(results["page_2"]["timeline_cursor"]["queries"], 3)
@@ -1,7 +1,7 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
 
-from ...users.factories import UserFactory
+from ...users.factories import UserFactory, UserSubscriptionFactory
 from ..factories import (
     IngredientFactory,
     MeasurementUnitFactory,
@@ -115,6 +115,121 @@ class RecipeModelTest(TestCase):
             msg="Рецепт НЕ в избранном должен иметь атрибут 'False'.",
         )
 
+    def test_with_user_state_values(self):
+        """
+        'with_user_state' sets the same attributes as annotations do and
+        makes three extra queries whatever the number of recipes is.
+        """
+        user = RecipeModelTest.user_2
+        author = RecipeModelTest.user_1
+        recipe_1 = RecipeFactory(name="Рецепт в избранном", author=author)
+        recipe_2 = RecipeFactory(name="Рецепт в корзине", author=author)
+        RecipeFavoriteFactory(recipe=recipe_1, user=user)
+        RecipeCartFactory(recipe=recipe_2, user=user)
+        UserSubscriptionFactory(follower=user, following=author)
+
+        with self.assertNumQueries(4):
+            recipes = {
+                recipe.name: recipe
+                for recipe in Recipe.ext_objects.with_user_state(user=user)
+            }
+
+        self.assertTrue(recipes[recipe_1.name].is_favorited)
+        self.assertFalse(recipes[recipe_1.name].is_in_shopping_cart)
+        self.assertFalse(recipes[recipe_2.name].is_favorited)
+        self.assertTrue(recipes[recipe_2.name].is_in_shopping_cart)
+        self.assertTrue(
+            recipes[recipe_1.name].author.is_subscribed,
+            msg="Пользователь подписан на автора рецепта.",
+        )
+
+    def test_with_user_state_anonymous_user(self):
+        """Without user all the attributes are 'False' and no extra queries."""
+        with self.assertNumQueries(1):
+            recipe = Recipe.ext_objects.with_user_state(user=None).first()
+
+        self.assertFalse(recipe.is_favorited)
+        self.assertFalse(recipe.is_in_shopping_cart)
+        self.assertFalse(recipe.author.is_subscribed)
+
+    def test_with_ingredient_rows_values(self):
+        """
+        'with_ingredient_rows' sets the same ingredients as the recipe has
+        with one extra query for all the recipes.
+        """
+        author = RecipeModelTest.user_1
+        unit = MeasurementUnitFactory()
+        ingredients = IngredientFactory.create_batch(3, measurement_unit=unit)
+        recipe_1 = RecipeFactory(author=author, ingredients=ingredients)
+        recipe_2 = RecipeFactory(author=author, ingredients=ingredients[:1])
+        recipes_ids = [recipe_1.id, recipe_2.id]
+
+        with self.assertNumQueries(2):
+            recipes = {
+                recipe.id: recipe
+                for recipe in Recipe.ext_objects.filter(
+                    id__in=recipes_ids
+                ).with_ingredient_rows()
+            }
+
+        for recipe_id in recipes_ids:
+            expected = [
+                (
+                    row.ingredient.id,
+                    row.ingredient.name,
+                    row.ingredient.measurement_unit.name,
+                    row.amount,
+                )
+                for row in Recipe.objects.get(
+                    id=recipe_id
+                ).recipeingredients.order_by("id")
+            ]
+            self.assertEqual(recipes[recipe_id].ingredient_rows, expected)
+
+    def test_with_ingredient_rows_and_user_state(self):
+        """Both post fetch hooks are applied to the same queryset."""
+        user = RecipeModelTest.user_2
+        recipe = RecipeFactory(author=RecipeModelTest.user_1)
+        RecipeFavoriteFactory(recipe=recipe, user=user)
+
+        fetched = (
+            Recipe.ext_objects.filter(id=recipe.id)
+            .with_ingredient_rows()
+            .with_user_state(user=user)
+            .get()
+        )
+
+        self.assertTrue(fetched.is_favorited)
+        self.assertEqual(
+            len(fetched.ingredient_rows), recipe.recipeingredients.count()
+        )
+
+    def test_user_annotations_without_user_are_constant(self):
+        """Without user annotations are constant 'False' without subqueries."""
+        queryset = Recipe.ext_objects.with_favorites(
+            user=None
+        ).with_shopping_cart(user=None)
+
+        self.assertNotIn("EXISTS", str(queryset.query))
+        self.assertFalse(queryset.filter(is_favorited=True).exists())
+        for recipe in queryset:
+            self.assertFalse(recipe.is_favorited)
+            self.assertFalse(recipe.is_in_shopping_cart)
+
+    def test_search_vector_is_not_selected(self):
+        """
+        'search_vector' is deferred by managers and related managers, it
+        is used only in SQL of the search.
+        """
+        user = RecipeModelTest.user_1
+        for queryset in (
+            Recipe.objects.all(),
+            Recipe.ext_objects.with_user_state(user=user),
+            user.recipes.all(),
+        ):
+            with self.subTest(query=str(queryset.query)):
+                self.assertNotIn("search_vector", str(queryset.query))
+
     def test_recipe_author_and_name_is_unique(self):
         """Tries to clean the recipe with existed author and name."""
         user = RecipeModelTest.user_1
@@ -0,0 +1,315 @@
+from pathlib import Path
+from tempfile import mkdtemp
+
+from django.conf import settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase, override_settings
+
+from ...core.testing import PerformanceTestMixin
+from ...users.factories import UserFactory, UserSubscriptionFactory
+from ..factories import (
+    IngredientFactory,
+    MeasurementUnitFactory,
+    RecipeCartFactory,
+    RecipeFactory,
+    RecipeFavoriteFactory,
+    RecipeTagFactory,
+)
+from ..feed import fan_out_recipe
+from ..models import Recipe, RecipeIngredient
+
+BASELINES_PATH = Path(__file__).parent / "performance_baselines.json"
+SMALL_GIF = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAACVB"
+    "MVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNoAAAAggCB"
+    "yxOyYQAAAABJRU5ErkJggg=="
+)
+
+URL_RECIPES_LIST = reverse("recipes-list")
+URL_RECIPES_FEED = reverse("recipes-feed")
+URL_TAGS_LIST = reverse("tags-list")
+URL_INGREDIENTS_LIST = reverse("ingredients-list")
+URL_BULK_FAVORITE = reverse("recipes-bulk-favorite")
+URL_BULK_SHOPPING_CART = reverse("recipes-bulk-shopping-cart")
+URL_DOWNLOAD_SHOPPING_CART = reverse("recipes-download-shopping-cart")
+
+PAGE_SIZES = (1, 6, 20)
+
+
+@override_settings(MEDIA_ROOT=mkdtemp())
+class RecipesPerformanceTests(PerformanceTestMixin, APITestCase):
+    """
+    Query counts and time budgets of recipes endpoints. Query counts must
+    not depend on the page size: a growing count is an N+1 regression.
+    """
+
+    baselines_path = BASELINES_PATH
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = UserFactory()
+        authors = UserFactory.create_batch(5)
+
+        unit = MeasurementUnitFactory()
+        cls.ingredients = IngredientFactory.create_batch(
+            30, measurement_unit=unit
+        )
+        cls.tags = RecipeTagFactory.create_batch(3)
+        cls.recipes = []
+        for author in authors:
+            cls.recipes.extend(
+                RecipeFactory.create_batch(
+                    12, author=author, tags__num=2, ingredients__num=5
+                )
+            )
+        # Query counts of writes depend on the changed tags and ingredients,
+        # so they are fixed
+        cls.own_recipe = RecipeFactory(
+            author=cls.user,
+            tags=cls.tags[2:],
+            ingredients=cls.ingredients[10:12],
+        )
+
+        for recipe in cls.recipes[:20]:
+            RecipeFavoriteFactory(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[20:30]:
+            RecipeCartFactory(user=cls.user, recipe=recipe)
+        for author in authors[:3]:
+            UserSubscriptionFactory(follower=cls.user, following=author)
+        for recipe in cls.recipes:
+            fan_out_recipe(recipe.id)
+
+        cls.anonymous_client = APIClient()
+        cls.user_client = APIClient()
+        cls.user_client.force_authenticate(user=cls.user)
+
+    def get_clients(self):
+        return (
+            ("anonymous", self.anonymous_client),
+            ("user", self.user_client),
+        )
+
+    def test_catalog(self):
+        tag, ingredient = self.tags[0], self.ingredients[0]
+        cases = (
+            ("tags_list", URL_TAGS_LIST, {}, 1),
+            ("tags_detail", reverse("tags-detail", args=[tag.id]), {}, 1),
+            ("ingredients_list", URL_INGREDIENTS_LIST, {}, 1),
+            (
+                "ingredients_search",
+                URL_INGREDIENTS_LIST,
+                {"name": ingredient.name[:3], "limit": 10},
+                1,
+            ),
+            (
+                "ingredients_detail",
+                reverse("ingredients-detail", args=[ingredient.id]),
+                {},
+                1,
+            ),
+        )
+        for client_name, client in self.get_clients():
+            for name, url, params, queries in cases:
+                name = f"{name}[{client_name}]"
+                with self.subTest(name):
+                    self.assertEndpointBudget(
+                        name, lambda: client.get(url, params), queries
+                    )
+
+    def test_recipes_list(self):
+        tags = [tag.slug for tag in self.tags[:2]]
+        recipe = self.recipes[0]
+        ingredients = ",".join(
+            str(ingredient_id)
+            for ingredient_id in RecipeIngredient.objects.filter(
+                recipe=recipe
+            ).values_list("ingredient_id", flat=True)[:3]
+        )
+        word = recipe.name.split()[0]
+        # name, query params, queries of anonymous and of the user. Tags ids
+        # are cached in production, but the tests cache is dummy, so every
+        # 'get_tags_ids' call is a query.
+        cases = (
+            ("no_filters", {}, 5, 6),
+            ("tags", {"tags": tags}, 8, 9),
+            ("tags_all", {"tags": tags, "tags_mode": "all"}, 8, 9),
+            ("author", {"author": recipe.author_id}, 6, 7),
+            ("search", {"search": word}, 5, 6),
+            ("ingredients", {"ingredients": ingredients}, 5, 6),
+            (
+                "ingredients_all",
+                {"ingredients": ingredients, "ingredients_mode": "all"},
+                5,
+                6,
+            ),
+            (
+                "ingredients_at_least_n",
+                {
+                    "ingredients": ingredients,
+                    "ingredients_mode": "at_least_n",
+                    "ingredients_min": 2,
+                },
+                5,
+                6,
+            ),
+            # Anonymous has no favorites and cart, the page is empty
+            ("is_favorited", {"is_favorited": 1}, 1, 6),
+            ("is_in_shopping_cart", {"is_in_shopping_cart": 1}, 1, 6),
+            ("cursor", {"pagination": "cursor"}, 4, 5),
+            ("image_variants", {"image_variants": 1}, 5, 6),
+        )
+        for client_name, client in self.get_clients():
+            for filter_name, params, *queries in cases:
+                count = queries[client_name == "user"]
+                for limit in PAGE_SIZES:
+                    name = (
+                        f"recipes_list[{client_name},{filter_name},"
+                        f"limit={limit}]"
+                    )
+                    with self.subTest(name):
+                        self.assertEndpointBudget(
+                            name,
+                            lambda: client.get(
+                                URL_RECIPES_LIST, {**params, "limit": limit}
+                            ),
+                            count,
+                        )
+
+    def test_recipes_detail(self):
+        url = reverse("recipes-detail", args=[self.recipes[0].id])
+        for client_name, client, queries in (
+            ("anonymous", self.anonymous_client, 4),
+            ("user", self.user_client, 5),
+        ):
+            name = f"recipes_detail[{client_name}]"
+            with self.subTest(name):
+                self.assertEndpointBudget(
+                    name, lambda: client.get(url), queries
+                )
+
+    def test_feed(self):
+        for limit in PAGE_SIZES:
+            name = f"recipes_feed[limit={limit}]"
+            with self.subTest(name):
+                self.assertEndpointBudget(
+                    name,
+                    lambda: self.user_client.get(
+                        URL_RECIPES_FEED, {"limit": limit}
+                    ),
+                    8,
+                )
+
+    def test_recipe_write(self):
+        client = self.user_client
+        ingredients = [
+            {"id": ingredient.id, "amount": 10}
+            for ingredient in self.ingredients[:5]
+        ]
+        data = {
+            "ingredients": ingredients,
+            "tags": [tag.id for tag in self.tags[:2]],
+            "image": SMALL_GIF,
+            "name": "Новый рецепт",
+            "text": "Описание нового рецепта.",
+            "cooking_time": 20,
+        }
+        with self.subTest("recipes_create"):
+            self.assertEndpointBudget(
+                "recipes_create",
+                lambda: client.post(URL_RECIPES_LIST, data, format="json"),
+                35,
+                status_code=201,
+                undo=lambda: Recipe.objects.filter(name=data["name"]).delete(),
+            )
+
+        url = reverse("recipes-detail", args=[self.own_recipe.id])
+        with self.subTest("recipes_update"):
+            self.assertEndpointBudget(
+                "recipes_update",
+                lambda: client.patch(url, data, format="json"),
+                38,
+            )
+
+        recipes = iter(
+            RecipeFactory.create_batch(
+                settings.PERFORMANCE_REPEAT + 1,
+                author=self.user,
+                tags=self.tags[2:],
+                ingredients=self.ingredients[10:12],
+            )
+        )
+        with self.subTest("recipes_delete"):
+            self.assertEndpointBudget(
+                "recipes_delete",
+                lambda: client.delete(
+                    reverse("recipes-detail", args=[next(recipes).id])
+                ),
+                16,
+                status_code=204,
+            )
+
+    def test_recipe_actions(self):
+        client = self.user_client
+        recipe = self.recipes[-1]
+        # Cart changes update the cart's ingredient totals
+        for action, add_queries, remove_queries in (
+            ("favorite", 5, 4),
+            ("shopping_cart", 8, 7),
+        ):
+            url = reverse(
+                f"recipes-{action.replace('_', '-')}", args=[recipe.id]
+            )
+            with self.subTest(f"{action}_add"):
+                self.assertEndpointBudget(
+                    f"{action}_add",
+                    lambda: client.get(url),
+                    add_queries,
+                    status_code=201,
+                    undo=lambda: client.delete(url),
+                )
+            client.get(url)
+            with self.subTest(f"{action}_remove"):
+                self.assertEndpointBudget(
+                    f"{action}_remove",
+                    lambda: client.delete(url),
+                    remove_queries,
+                    status_code=204,
+                    undo=lambda: client.get(url),
+                )
+
+    def test_bulk_actions(self):
+        client = self.user_client
+        add_ids = [recipe.id for recipe in self.recipes[40:50]]
+        for action, url, queries in (
+            ("bulk_favorite", URL_BULK_FAVORITE, 6),
+            ("bulk_shopping_cart", URL_BULK_SHOPPING_CART, 9),
+        ):
+            with self.subTest(action):
+                self.assertEndpointBudget(
+                    action,
+                    lambda: client.post(
+                        url, {"add": add_ids, "remove": []}, format="json"
+                    ),
+                    queries,
+                    undo=lambda: client.post(
+                        url, {"add": [], "remove": add_ids}, format="json"
+                    ),
+                )
+
+    def test_download_shopping_cart(self):
+        for export_format, queries in (
+            ("txt", 1),
+            ("csv", 1),
+            ("json", 1),
+            ("pdf", 12),
+        ):
+            name = f"download_shopping_cart[{export_format}]"
+            with self.subTest(name):
+                self.assertEndpointBudget(
+                    name,
+                    lambda: self.user_client.get(
+                        URL_DOWNLOAD_SHOPPING_CART, {"format": export_format}
+                    ),
+                    queries,
+                )
@@ -1,25 +1,71 @@
+import base64
+import csv
+import json
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
 from tempfile import mkdtemp as tempfile_mkdtemp
+from unittest.mock import patch
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
+from PIL import Image
 from rest_framework import status
-from rest_framework.test import APIClient, APITestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (
+    APIClient,
+    APIRequestFactory,
+    APITestCase,
+    override_settings,
+)
 
-from ...users.factories import UserFactory
+from ...core.utils import change_counter
+from ...users.factories import UserFactory, UserSubscriptionFactory
+from ..cart import find_inconsistent_cart_totals
 from ..factories import (
     IngredientFactory,
     MeasurementUnitFactory,
     RecipeCartFactory,
     RecipeFactory,
+    RecipeFavoriteFactory,
     RecipeTagFactory,
 )
-from ..models import Recipe, RecipeCart, RecipeFavorite
+from ..feed import fan_out_recipe
+from ..images import process_recipe_image
+from ..models import (
+    CartIngredientTotal,
+    FeedEntry,
+    Ingredient,
+    Recipe,
+    RecipeCart,
+    RecipeFavorite,
+    RecipeTag,
+    ShoppingCartPDF,
+)
 
 TEMP_DIR = tempfile_mkdtemp()
+LOCMEM_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "foodgram-tests",
+    }
+}
 
 URL_RECIPES_LIST = reverse("recipes-list")
 URL_RECIPES_DETAIL = reverse("recipes-detail", args=[1])
+URL_RECIPES_FEED = reverse("recipes-feed")
 URL_DOWNLOAD_SHOPPING_CART = reverse("recipes-download-shopping-cart")
+URL_SHOPPING_CART_PDF = reverse("recipes-shopping-cart-pdf")
+URL_BULK_FAVORITE = reverse("recipes-bulk-favorite")
+URL_BULK_SHOPPING_CART = reverse("recipes-bulk-shopping-cart")
 URL_TAGS_LIST = reverse("tags-list")
 URL_INGREDIENTS_LIST = reverse("ingredients-list")
 
@@ -32,6 +78,7 @@ SMALL_GIF = (
 User = get_user_model()
 
 
+@override_settings(MEDIA_ROOT=TEMP_DIR)
 class RecipeViewTests(APITestCase):
     @classmethod
     def setUpTestData(cls) -> None:
@@ -105,6 +152,95 @@ class RecipeViewTests(APITestCase):
             ),
         )
 
+    def test_cursor_pagination_with_ranked_filters(self):
+        """
+        Search results are ordered by relevance, keyset pagination would
+        drop the order.
+        """
+        client = RecipeViewTests.unauthorized_client
+        ingredient_id = Ingredient.objects.values_list("id", flat=True)[0]
+        for params in (
+            {"search": "рецепт"},
+            {"ingredients": ingredient_id},
+        ):
+            with self.subTest(params=params):
+                response = client.get(
+                    URL_RECIPES_LIST, {**params, "pagination": "cursor"}
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+                self.assertIn("pagination", response.json())
+
+                response = client.get(URL_RECIPES_LIST, params)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cursor_pagination_mode(self):
+        """
+        With '?pagination=cursor' the response has no 'count' and 'next' links
+        walk through all recipes in '-pub_date' order without duplicates.
+        """
+        query_params = {
+            "pagination": "cursor",
+            "limit": 3,
+        }
+        client = RecipeViewTests.unauthorized_client
+
+        response_data = client.get(
+            path=URL_RECIPES_LIST,
+            data=query_params,
+        ).data
+        self.assertNotIn(
+            "count",
+            response_data,
+            msg="В режиме курсорной паджинации нет поля 'count'.",
+        )
+        self.assertIsNone(
+            response_data.get("previous"),
+            msg="У первой страницы нет ссылки на предыдущую страницу.",
+        )
+
+        received_ids = [recipe["id"] for recipe in response_data["results"]]
+        next_url = response_data.get("next")
+        while next_url is not None:
+            response_data = client.get(path=next_url).data
+            received_ids += [
+                recipe["id"] for recipe in response_data["results"]
+            ]
+            next_url = response_data.get("next")
+
+        expected_ids = list(
+            Recipe.objects.order_by("-pub_date", "-id").values_list(
+                "id", flat=True
+            )
+        )
+        self.assertEqual(
+            received_ids,
+            expected_ids,
+            msg=(
+                "Проходя по ссылкам 'next' нужно получить все рецепты "
+                "по одному разу в порядке '-pub_date'."
+            ),
+        )
+
+    def test_user_state_strategies_return_same_data(self):
+        """'subquery' and 'batch' strategies should return the same JSON."""
+        user = RecipeViewTests.user
+        recipe = RecipeFactory(author=RecipeViewTests.other_user)
+        RecipeCartFactory(user=user, recipe=recipe)
+        client = RecipeViewTests.authorized_client
+
+        responses = []
+        for strategy in ("subquery", "batch"):
+            with override_settings(RECIPES_USER_STATE_STRATEGY=strategy):
+                responses.append(client.get(URL_RECIPES_LIST).json())
+
+        self.assertEqual(
+            responses[0],
+            responses[1],
+            msg="Ответы с разными стратегиями должны совпадать.",
+        )
+
     def test_user_can_add_recipe_as_favorite(self):
         """
         Sends 'GET' request to 'favorite' url and checks
@@ -135,6 +271,34 @@ class RecipeViewTests(APITestCase):
             msg="Убедитесь, что рецепт попадает в избранное.",
         )
 
+    def test_favorite_and_shopping_cart_change_recipe_counters(self):
+        """Adding and removing recipe changes recipe's counters."""
+        recipe = RecipeFactory(author=RecipeViewTests.other_user)
+        client = RecipeViewTests.authorized_client
+
+        for url_name, counter in (
+            ("recipes-favorite", "favorites_count"),
+            ("recipes-shopping-cart", "cart_count"),
+        ):
+            with self.subTest(url_name=url_name):
+                url = reverse(url_name, args=[recipe.id])
+
+                client.get(path=url)
+                recipe.refresh_from_db()
+                self.assertEqual(
+                    getattr(recipe, counter),
+                    1,
+                    msg=f"После добавления '{counter}' должен стать 1.",
+                )
+
+                client.delete(path=url)
+                recipe.refresh_from_db()
+                self.assertEqual(
+                    getattr(recipe, counter),
+                    0,
+                    msg=f"После удаления '{counter}' должен стать 0.",
+                )
+
     def test_user_can_delete_favorite_recipe(self):
         """
         Sends 'DELETE' request to 'favorite' url and checks
@@ -443,6 +607,29 @@ class RecipeCreateViewTests(APITestCase):
             msg="Всего должно стать +1 рецепт от первоначального значения.",
         )
 
+    def test_create_and_delete_recipe_change_author_recipes_count(self):
+        """Author's 'recipes_count' follows recipes creation and deletion."""
+        client = self.authorized_client
+
+        response = client.post(URL_RECIPES_LIST, data=self.data, format="json")
+        self.user.refresh_from_db()
+        self.assertEqual(
+            self.user.recipes_count,
+            1,
+            msg="После создания рецепта 'recipes_count' автора равен 1.",
+        )
+
+        url_recipe_detail = reverse(
+            "recipes-detail", args=[response.data["id"]]
+        )
+        client.delete(url_recipe_detail)
+        self.user.refresh_from_db()
+        self.assertEqual(
+            self.user.recipes_count,
+            0,
+            msg="После удаления рецепта 'recipes_count' автора равен 0.",
+        )
+
     def test_recipe_without_tags_couldnt_be_created(self):
         """Posts recipe without tags. We should returns errors."""
 
@@ -635,6 +822,37 @@ class RecipeCreateViewTests(APITestCase):
             msg="Убедитесь, что данные обновляются в том же рецепте.",
         )
 
+    def test_recipe_patch_keeps_concurrent_counter_changes(self):
+        """
+        Recipe is favorited by other user after it's loaded for the update,
+        the counter is not overridden by the update.
+        """
+        from ..views import RecipeViewSet
+
+        recipe = RecipeFactory(author=self.user)
+        get_object = RecipeViewSet.get_object
+
+        def get_object_then_favorite(view):
+            instance = get_object(view)
+            change_counter(
+                Recipe.objects.filter(id=instance.id), "favorites_count", 1
+            )
+            return instance
+
+        with patch.object(
+            RecipeViewSet, "get_object", get_object_then_favorite
+        ):
+            response = self.authorized_client.patch(
+                reverse("recipes-detail", args=[recipe.id]),
+                data={**self.data, "name": "Новое имя"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, "Новое имя")
+        self.assertEqual(recipe.favorites_count, 1)
+
     def test_recipe_not_author_cant_patch_recipe(self):
         """Patchs existed recipe with same new name."""
         author = self.user
@@ -675,3 +893,1286 @@ class RecipeCreateViewTests(APITestCase):
             "Старое имя",
             msg="Убедитесь, что данные в рецепте не изменены.",
         )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CatalogCacheViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.measurement_unit = MeasurementUnitFactory()
+        IngredientFactory.create_batch(
+            5, measurement_unit=cls.measurement_unit
+        )
+        RecipeTagFactory.create_batch(3)
+
+        cls.unauthorized_client = APIClient()
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_catalog_lists_are_served_from_cache(self):
+        """The second request doesn't query database."""
+        client = CatalogCacheViewTests.unauthorized_client
+
+        for url in (URL_INGREDIENTS_LIST, URL_TAGS_LIST):
+            with self.subTest(url=url):
+                first_response = client.get(url)
+
+                with self.assertNumQueries(0):
+                    second_response = client.get(url)
+
+                self.assertEqual(
+                    first_response.content,
+                    second_response.content,
+                    msg="Закешированный ответ должен совпадать с исходным.",
+                )
+
+    def test_catalog_lists_not_modified_response(self):
+        """Request with the same 'If-None-Match' gets 304 without body."""
+        client = CatalogCacheViewTests.unauthorized_client
+
+        for url in (URL_INGREDIENTS_LIST, URL_TAGS_LIST):
+            with self.subTest(url=url):
+                etag = client.get(url).headers.get("ETag")
+                self.assertIsNotNone(etag, msg="В ответе должен быть ETag.")
+
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code,
+                    status.HTTP_304_NOT_MODIFIED,
+                )
+                self.assertEqual(response.content, b"")
+
+    def test_catalog_cache_invalidated_on_change(self):
+        """New ingredient or tag appears in the list right after creation."""
+        client = CatalogCacheViewTests.unauthorized_client
+
+        measurement_unit = CatalogCacheViewTests.measurement_unit
+
+        for url, create_object in (
+            (
+                URL_INGREDIENTS_LIST,
+                lambda: IngredientFactory(measurement_unit=measurement_unit),
+            ),
+            (URL_TAGS_LIST, RecipeTagFactory),
+        ):
+            with self.subTest(url=url):
+                response = client.get(url)
+                etag = response.headers.get("ETag")
+                count_before = len(response.json())
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    create_object()
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.json()), count_before + 1)
+
+    def test_tags_ids_map_is_cached(self):
+        """
+        Tag slugs of the recipes filter are resolved without a query and
+        a new tag can be used right after creation.
+        """
+        client = CatalogCacheViewTests.unauthorized_client
+        tag = RecipeTag.objects.first()
+
+        client.get(URL_RECIPES_LIST, {"tags": tag.slug})
+        with CaptureQueriesContext(connection) as context:
+            client.get(URL_RECIPES_LIST, {"tags": tag.slug})
+        self.assertFalse(
+            any(
+                query["sql"].startswith('SELECT "recipes_recipetag"."slug"')
+                for query in context.captured_queries
+            ),
+            msg="Slug тегов должны браться из кеша.",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            new_tag = RecipeTagFactory()
+        response = client.get(URL_RECIPES_LIST, {"tags": new_tag.slug})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_catalog_version_is_bumped_on_commit(self):
+        """
+        List rendered before the change is committed is not cached under
+        the new version.
+        """
+        client = CatalogCacheViewTests.unauthorized_client
+        etag = client.get(URL_TAGS_LIST).headers["ETag"]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            RecipeTagFactory()
+            response = client.get(URL_TAGS_LIST, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(
+                response.status_code, status.HTTP_304_NOT_MODIFIED
+            )
+        for callback in callbacks:
+            callback()
+
+        response = client.get(URL_TAGS_LIST, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class ShoppingCartPDFViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        measurement_unit = MeasurementUnitFactory()
+        cls.ingredients = IngredientFactory.create_batch(
+            3, measurement_unit=measurement_unit
+        )
+        cls.recipe = RecipeFactory(
+            author=cls.user, ingredients=cls.ingredients[:2]
+        )
+        cls.other_recipe = RecipeFactory(
+            author=cls.user, ingredients=cls.ingredients[1:]
+        )
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def setUp(self) -> None:
+        RecipeCartFactory(
+            user=ShoppingCartPDFViewTests.user,
+            recipe=ShoppingCartPDFViewTests.recipe,
+        )
+
+    def test_unchanged_cart_is_not_rendered_again(self):
+        client = ShoppingCartPDFViewTests.authorized_client
+        user = ShoppingCartPDFViewTests.user
+
+        first_response = client.get(URL_DOWNLOAD_SHOPPING_CART)
+        job = ShoppingCartPDF.objects.get(user=user)
+        second_response = client.get(URL_DOWNLOAD_SHOPPING_CART)
+
+        self.assertEqual(second_response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b"".join(first_response.streaming_content),
+            b"".join(second_response.streaming_content),
+        )
+        self.assertQuerysetEqual(
+            ShoppingCartPDF.objects.filter(user=user),
+            [job],
+            msg="Для неизмененного списка PDF не должен создаваться заново.",
+        )
+
+    def test_changed_cart_replaces_outdated_pdf(self):
+        client = ShoppingCartPDFViewTests.authorized_client
+        user = ShoppingCartPDFViewTests.user
+
+        client.get(URL_DOWNLOAD_SHOPPING_CART)
+        outdated_job = ShoppingCartPDF.objects.get(user=user)
+        outdated_file = outdated_job.file
+
+        RecipeCartFactory(
+            user=user,
+            recipe=ShoppingCartPDFViewTests.other_recipe,
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.get(URL_DOWNLOAD_SHOPPING_CART)
+        self.assertTrue(
+            outdated_file.storage.exists(outdated_file.name),
+            msg="Файл устаревшего PDF удаляется только после коммита.",
+        )
+        for callback in callbacks:
+            callback()
+        self.assertFalse(outdated_file.storage.exists(outdated_file.name))
+
+        jobs = ShoppingCartPDF.objects.filter(user=user)
+        self.assertEqual(jobs.count(), 1)
+        self.assertNotEqual(
+            jobs.get().cart_hash,
+            outdated_job.cart_hash,
+            msg="После изменения списка PDF должен создаваться заново.",
+        )
+
+    def test_background_pdf_job(self):
+        """
+        Start job, check its status and download PDF. Tasks are run
+        synchronously in tests, so the job is done right away.
+        """
+        client = ShoppingCartPDFViewTests.authorized_client
+
+        response = client.post(URL_SHOPPING_CART_PDF)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        job = response.json()
+        self.assertEqual(job["status"], ShoppingCartPDF.DONE)
+
+        status_url = reverse(
+            "recipes-shopping-cart-pdf-status", args=[job["id"]]
+        )
+        response = client.get(status_url)
+        self.assertEqual(response.json(), job)
+
+        response = client.get(job["download_url"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.headers.get("Content-Type"),
+            "application/pdf",
+            msg="Содержимое документа должен быть документ PDF.",
+        )
+
+    def test_download_shopping_cart_text_formats(self):
+        """Shopping list is streamed as plain text, CSV or JSON."""
+        client = ShoppingCartPDFViewTests.authorized_client
+        names = sorted(
+            ingredient.name
+            for ingredient in ShoppingCartPDFViewTests.ingredients[:2]
+        )
+
+        for export_format, content_type in (
+            ("txt", "text/plain; charset=utf-8"),
+            ("csv", "text/csv; charset=utf-8"),
+            ("json", "application/json"),
+        ):
+            with self.subTest(export_format=export_format):
+                response = client.get(
+                    URL_DOWNLOAD_SHOPPING_CART, {"format": export_format}
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    response.headers.get("Content-Type"), content_type
+                )
+
+        response = client.get(URL_DOWNLOAD_SHOPPING_CART, {"format": "csv"})
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ["name", "measurement_unit", "amount"])
+        self.assertEqual([row[0] for row in rows[1:]], names)
+
+        response = client.get(URL_DOWNLOAD_SHOPPING_CART, {"format": "json"})
+        rows = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["name"] for row in rows], names)
+        self.assertFalse(
+            ShoppingCartPDF.objects.exists(),
+            msg="Текстовые форматы не должны создавать PDF.",
+        )
+
+    def test_cant_download_empty_shopping_cart_text_formats(self):
+        client = ShoppingCartPDFViewTests.authorized_client
+        client.delete(
+            reverse(
+                "recipes-shopping-cart",
+                args=[ShoppingCartPDFViewTests.recipe.id],
+            )
+        )
+
+        for export_format in ("txt", "csv", "json"):
+            with self.subTest(export_format=export_format):
+                response = client.get(
+                    URL_DOWNLOAD_SHOPPING_CART, {"format": export_format}
+                )
+                self.assertEqual(
+                    response.status_code,
+                    status.HTTP_404_NOT_FOUND,
+                    msg="Пустой список покупок должен возвращать код 404.",
+                )
+
+    def test_other_user_cant_get_pdf_job(self):
+        client = ShoppingCartPDFViewTests.authorized_client
+        job_id = client.post(URL_SHOPPING_CART_PDF).json()["id"]
+
+        other_client = APIClient()
+        other_client.force_authenticate(user=UserFactory())
+        for name in (
+            "recipes-shopping-cart-pdf-status",
+            "recipes-shopping-cart-pdf-download",
+        ):
+            with self.subTest(name=name):
+                response = other_client.get(reverse(name, args=[job_id]))
+                self.assertEqual(
+                    response.status_code,
+                    status.HTTP_404_NOT_FOUND,
+                    msg="Чужой PDF должен быть недоступен.",
+                )
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class CartIngredientTotalViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.author = UserFactory()
+        cls.buyers = UserFactory.create_batch(2)
+        measurement_unit = MeasurementUnitFactory()
+        cls.ingredients = IngredientFactory.create_batch(
+            3, measurement_unit=measurement_unit
+        )
+        cls.tag = RecipeTagFactory()
+
+        cls.author_client = APIClient()
+        cls.author_client.force_authenticate(user=cls.author)
+        cls.buyer_clients = []
+        for buyer in cls.buyers:
+            client = APIClient()
+            client.force_authenticate(user=buyer)
+            cls.buyer_clients.append(client)
+
+    def setUp(self) -> None:
+        ingredients = CartIngredientTotalViewTests.ingredients
+        author = CartIngredientTotalViewTests.author
+        self.recipe = RecipeFactory(author=author, ingredients=ingredients[:2])
+        self.other_recipe = RecipeFactory(
+            author=author, ingredients=ingredients[1:]
+        )
+
+    def assertTotalsAreActual(self, user):
+        actual = {
+            ingredient.id: ingredient.amount
+            for ingredient in Ingredient.ext_objects.user_cart(user=user)
+        }
+        stored = dict(
+            CartIngredientTotal.objects.filter(user=user).values_list(
+                "ingredient_id", "amount"
+            )
+        )
+        self.assertEqual(
+            stored,
+            actual,
+            msg="Список покупок должен совпадать с рецептами в корзине.",
+        )
+
+    def test_cart_add_and_remove_change_totals(self):
+        client = CartIngredientTotalViewTests.buyer_clients[0]
+        buyer = CartIngredientTotalViewTests.buyers[0]
+
+        for recipe in (self.recipe, self.other_recipe):
+            url = reverse("recipes-shopping-cart", args=[recipe.id])
+            client.get(url)
+            self.assertTotalsAreActual(buyer)
+
+        for recipe in (self.recipe, self.other_recipe):
+            url = reverse("recipes-shopping-cart", args=[recipe.id])
+            client.delete(url)
+            self.assertTotalsAreActual(buyer)
+
+        self.assertFalse(CartIngredientTotal.objects.filter(user=buyer))
+
+    def test_recipe_ingredients_update_changes_totals(self):
+        ingredients = CartIngredientTotalViewTests.ingredients
+        for client in CartIngredientTotalViewTests.buyer_clients:
+            client.get(reverse("recipes-shopping-cart", args=[self.recipe.id]))
+            client.get(
+                reverse("recipes-shopping-cart", args=[self.other_recipe.id])
+            )
+
+        data = {
+            "ingredients": [
+                {"id": ingredients[1].id, "amount": 7},
+                {"id": ingredients[2].id, "amount": 3},
+            ],
+            "tags": [CartIngredientTotalViewTests.tag.id],
+            "image": SMALL_GIF,
+            "name": "Новое имя",
+            "text": "Новое описание рецепта.",
+            "cooking_time": "10",
+        }
+        response = CartIngredientTotalViewTests.author_client.patch(
+            reverse("recipes-detail", args=[self.recipe.id]),
+            data=data,
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        for buyer in CartIngredientTotalViewTests.buyers:
+            self.assertTotalsAreActual(buyer)
+
+    def test_recipe_delete_changes_totals(self):
+        buyers = CartIngredientTotalViewTests.buyers
+        for client in CartIngredientTotalViewTests.buyer_clients:
+            client.get(reverse("recipes-shopping-cart", args=[self.recipe.id]))
+
+        CartIngredientTotalViewTests.author_client.delete(
+            reverse("recipes-detail", args=[self.recipe.id])
+        )
+
+        self.assertEqual(
+            find_inconsistent_cart_totals([buyer.id for buyer in buyers]),
+            [],
+        )
+        self.assertFalse(CartIngredientTotal.objects.filter(user__in=buyers))
+
+    def test_user_delete_changes_totals_and_counters(self):
+        """
+        Recipes of the deleted user leave other users' shopping lists,
+        recipes the user favorited and carted get their counters back.
+        """
+        author = CartIngredientTotalViewTests.author
+        buyers = CartIngredientTotalViewTests.buyers
+        buyer_recipe = RecipeFactory(
+            author=buyers[1],
+            ingredients=CartIngredientTotalViewTests.ingredients[:1],
+        )
+        for client in CartIngredientTotalViewTests.buyer_clients:
+            client.get(reverse("recipes-shopping-cart", args=[self.recipe.id]))
+        for name in ("recipes-shopping-cart", "recipes-favorite"):
+            CartIngredientTotalViewTests.author_client.get(
+                reverse(name, args=[buyer_recipe.id])
+            )
+
+        author.delete()
+
+        self.assertEqual(
+            find_inconsistent_cart_totals([buyer.id for buyer in buyers]),
+            [],
+        )
+        buyer_recipe.refresh_from_db()
+        self.assertEqual(buyer_recipe.favorites_count, 0)
+        self.assertEqual(buyer_recipe.cart_count, 0)
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class BulkRecipeActionViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        measurement_unit = MeasurementUnitFactory()
+        ingredients = IngredientFactory.create_batch(
+            3, measurement_unit=measurement_unit
+        )
+        cls.recipes = RecipeFactory.create_batch(
+            10, author=cls.user, ingredients=ingredients
+        )
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def test_bulk_favorite_returns_item_statuses(self):
+        user = BulkRecipeActionViewTests.user
+        recipes = BulkRecipeActionViewTests.recipes
+        RecipeFavoriteFactory(user=user, recipe=recipes[0])
+        RecipeFavoriteFactory(user=user, recipe=recipes[1])
+        Recipe.objects.filter(id__in=[recipes[0].id, recipes[1].id]).update(
+            favorites_count=1
+        )
+        data = {
+            "add": [recipes[0].id, recipes[2].id, 10 ** 6],
+            "remove": [recipes[1].id, recipes[3].id],
+        }
+
+        response = BulkRecipeActionViewTests.authorized_client.post(
+            URL_BULK_FAVORITE, data=data, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json()["results"],
+            [
+                {
+                    "id": recipes[0].id,
+                    "action": "add",
+                    "status": "already_exists",
+                },
+                {"id": recipes[2].id, "action": "add", "status": "added"},
+                {"id": 10 ** 6, "action": "add", "status": "not_found"},
+                {"id": recipes[1].id, "action": "remove", "status": "removed"},
+                {
+                    "id": recipes[3].id,
+                    "action": "remove",
+                    "status": "not_found",
+                },
+            ],
+        )
+        self.assertEqual(
+            dict(
+                Recipe.objects.filter(
+                    id__in=[recipe.id for recipe in recipes[:3]]
+                ).values_list("id", "favorites_count")
+            ),
+            {recipes[0].id: 1, recipes[1].id: 0, recipes[2].id: 1},
+            msg="Счетчики избранного должны измениться.",
+        )
+
+    def test_bulk_actions_number_of_queries_is_constant(self):
+        client = BulkRecipeActionViewTests.authorized_client
+        recipes_ids = [
+            recipe.id for recipe in BulkRecipeActionViewTests.recipes
+        ]
+
+        for url in (URL_BULK_FAVORITE, URL_BULK_SHOPPING_CART):
+            with self.subTest(url=url):
+                queries = []
+                for size in (2, 8):
+                    for key in ("add", "remove"):
+                        data = {key: recipes_ids[:size]}
+                        with CaptureQueriesContext(connection) as context:
+                            client.post(url, data=data, format="json")
+                        queries.append(len(context.captured_queries))
+
+                self.assertEqual(
+                    queries[:2],
+                    queries[2:],
+                    msg="Число запросов не должно зависеть от количества id.",
+                )
+
+    def test_bulk_shopping_cart_changes_cart_totals(self):
+        client = BulkRecipeActionViewTests.authorized_client
+        user = BulkRecipeActionViewTests.user
+        recipes_ids = [
+            recipe.id for recipe in BulkRecipeActionViewTests.recipes
+        ]
+
+        client.post(
+            URL_BULK_SHOPPING_CART,
+            data={"add": recipes_ids[:5]},
+            format="json",
+        )
+        client.post(
+            URL_BULK_SHOPPING_CART,
+            data={"add": recipes_ids[5:], "remove": recipes_ids[:3]},
+            format="json",
+        )
+
+        self.assertEqual(
+            set(
+                RecipeCart.objects.filter(user=user).values_list(
+                    "recipe_id", flat=True
+                )
+            ),
+            set(recipes_ids[3:]),
+        )
+        self.assertEqual(find_inconsistent_cart_totals([user.id]), [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class RecipeActionQueriesTests(APITestCase):
+    """
+    Favorite and shopping cart actions don't use annotated queryset of the
+    viewset. Numbers include SAVEPOINT and RELEASE of 'atomic' blocks.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        measurement_unit = MeasurementUnitFactory()
+        ingredients = IngredientFactory.create_batch(
+            2, measurement_unit=measurement_unit
+        )
+        cls.recipe = RecipeFactory(author=cls.user, ingredients=ingredients)
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def test_favorite_number_of_queries(self):
+        client = RecipeActionQueriesTests.authorized_client
+        url = reverse(
+            "recipes-favorite", args=[RecipeActionQueriesTests.recipe.id]
+        )
+
+        # recipe, INSERT, counter
+        with self.assertNumQueries(5):
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # recipe, INSERT fails on unique constraint
+        with self.assertNumQueries(5):
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+        # DELETE, counter
+        with self.assertNumQueries(4):
+            response = client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        with self.assertNumQueries(3):
+            response = client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_shopping_cart_number_of_queries(self):
+        client = RecipeActionQueriesTests.authorized_client
+        url = reverse(
+            "recipes-shopping-cart", args=[RecipeActionQueriesTests.recipe.id]
+        )
+
+        # recipe, INSERT, counter and three for the shopping list
+        with self.assertNumQueries(8):
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        # DELETE, counter and three for the shopping list
+        with self.assertNumQueries(7):
+            response = client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_action_with_not_existing_recipe(self):
+        client = RecipeActionQueriesTests.authorized_client
+
+        for url in (
+            reverse("recipes-favorite", args=[10 ** 6]),
+            reverse("recipes-favorite", args=["abc"]),
+        ):
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class RecipeReadSerializerTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        authors = UserFactory.create_batch(2)
+        measurement_unit = MeasurementUnitFactory()
+        IngredientFactory.create_batch(5, measurement_unit=measurement_unit)
+        RecipeTagFactory.create_batch(3)
+        for author in authors:
+            RecipeFactory.create_batch(
+                3, author=author, ingredients__num=3, tags__num=2
+            )
+
+        recipe = Recipe.objects.first()
+        RecipeFavoriteFactory(user=cls.user, recipe=recipe)
+        RecipeCartFactory(user=cls.user, recipe=recipe)
+        UserSubscriptionFactory(follower=cls.user, following=authors[0])
+
+    def test_output_is_identical_to_recipe_serializer(self):
+        # Users and recipes serializers import each other, so the module is
+        # imported after the urls are loaded.
+        from ..serializers import RecipeReadSerializer, RecipeSerializer
+        from ..views import RecipeViewSet
+
+        request = APIRequestFactory().get(URL_RECIPES_LIST)
+        context = {"request": request}
+        user = RecipeReadSerializerTests.user
+        queryset = RecipeViewSet.queryset
+
+        for name, recipes in (
+            (
+                "subquery",
+                queryset.author_with_subscriptions(user=user)
+                .with_favorites(user=user)
+                .with_shopping_cart(user=user),
+            ),
+            ("batch", queryset.with_user_state(user=user)),
+            ("anonymous", queryset.with_user_state(user=None)),
+        ):
+            with self.subTest(queryset=name):
+                recipes = list(recipes.all())
+                expected = JSONRenderer().render(
+                    RecipeSerializer(recipes, many=True, context=context).data
+                )
+                actual = JSONRenderer().render(
+                    RecipeReadSerializer(
+                        recipes, many=True, context=context
+                    ).data
+                )
+                self.assertEqual(actual, expected)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_ROOT=TEMP_DIR)
+class AnonymousRecipesCacheViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        cls.tag = RecipeTagFactory()
+        cls.recipe = RecipeFactory(author=cls.user, tags=[cls.tag])
+
+        cls.unauthorized_client = APIClient()
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def test_anonymous_responses_are_cached(self):
+        """The second request with the same params doesn't query database."""
+        client = AnonymousRecipesCacheViewTests.unauthorized_client
+        url_detail = reverse(
+            "recipes-detail", args=[AnonymousRecipesCacheViewTests.recipe.id]
+        )
+
+        for url, params, same_params in (
+            (
+                URL_RECIPES_LIST,
+                f"?tags={self.tag.slug}&limit=5",
+                f"?limit=5&tags={self.tag.slug}",
+            ),
+            (url_detail, "", ""),
+        ):
+            with self.subTest(url=url):
+                first_response = client.get(url + params)
+
+                with self.assertNumQueries(0):
+                    second_response = client.get(url + same_params)
+
+                self.assertEqual(
+                    first_response.content,
+                    second_response.content,
+                    msg="Закешированный ответ должен совпадать с исходным.",
+                )
+                etag = second_response.headers.get("ETag")
+                self.assertEqual(first_response.headers.get("ETag"), etag)
+
+                response = client.get(url + params, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(
+                    response.status_code, status.HTTP_304_NOT_MODIFIED
+                )
+
+    def test_not_cached_requests(self):
+        """
+        Authorized users and requests with not cached params always query
+        database.
+        """
+        for client, params in (
+            (AnonymousRecipesCacheViewTests.authorized_client, ""),
+            (AnonymousRecipesCacheViewTests.unauthorized_client, "?search=a"),
+        ):
+            with self.subTest(params=params):
+                client.get(URL_RECIPES_LIST + params)
+                with CaptureQueriesContext(connection) as context:
+                    client.get(URL_RECIPES_LIST + params)
+                self.assertTrue(context.captured_queries)
+
+    def test_cache_invalidated_on_change(self):
+        """Cached pages are outdated when recipes or tags change."""
+        client = AnonymousRecipesCacheViewTests.unauthorized_client
+        author = AnonymousRecipesCacheViewTests.user
+
+        changes = (
+            ("recipe created", lambda: RecipeFactory(author=author)),
+            (
+                "tag changed",
+                lambda: RecipeTag.objects.filter(id=self.tag.id).get().save(),
+            ),
+        )
+        for name, change in changes:
+            with self.subTest(change=name):
+                client.get(URL_RECIPES_LIST)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+
+                with CaptureQueriesContext(connection) as context:
+                    response = client.get(URL_RECIPES_LIST)
+                self.assertTrue(context.captured_queries)
+                self.assertEqual(
+                    response.data["count"], Recipe.objects.count()
+                )
+
+    def test_login_does_not_invalidate_cache(self):
+        """Only 'last_login' of the user is changed on login."""
+        client = AnonymousRecipesCacheViewTests.unauthorized_client
+        client.get(URL_RECIPES_LIST)
+
+        user = AnonymousRecipesCacheViewTests.user
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=["last_login"])
+
+        with self.assertNumQueries(0):
+            client.get(URL_RECIPES_LIST)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, MEDIA_ROOT=TEMP_DIR)
+class RecipeConditionalRequestsViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        cls.other_user = UserFactory()
+        cls.recipe = RecipeFactory(author=cls.user)
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+        cls.other_client = APIClient()
+        cls.other_client.force_authenticate(user=cls.other_user)
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.url_detail = reverse(
+            "recipes-detail",
+            args=[RecipeConditionalRequestsViewTests.recipe.id],
+        )
+
+    def assertNotModified(self, url, queries=0, **headers):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        with self.assertNumQueries(queries):
+            response = client.get(url, **headers)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_304_NOT_MODIFIED,
+            msg="Актуальная версия рецептов не должна отправляться снова.",
+        )
+        self.assertEqual(response.content, b"")
+
+    def assertModified(self, url, etag):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_200_OK,
+            msg="После изменения рецепты должны отправляться снова.",
+        )
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_not_modified_responses(self):
+        """
+        Requests with actual 'If-None-Match' get 304 response without
+        queries. 'If-Modified-Since' of the detail is checked with one
+        query.
+        """
+        client = RecipeConditionalRequestsViewTests.authorized_client
+
+        for url in (URL_RECIPES_LIST, self.url_detail):
+            with self.subTest(url=url):
+                etag = client.get(url).headers.get("ETag")
+                self.assertIsNotNone(etag, msg="В ответе должен быть ETag.")
+                self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+        last_modified = client.get(self.url_detail).headers.get(
+            "Last-Modified"
+        )
+        self.assertIsNotNone(last_modified)
+        self.assertNotModified(
+            self.url_detail, queries=1, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+
+    def test_list_has_no_last_modified(self):
+        """
+        Deleted recipes don't change the latest 'updated_at' of a list, so
+        lists are validated with ETag only.
+        """
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        response = client.get(URL_RECIPES_LIST)
+        self.assertNotIn("Last-Modified", response.headers)
+
+        response = client.get(
+            URL_RECIPES_LIST,
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_invalid_recipe_id_not_found(self):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        url = URL_RECIPES_LIST + "abc/"
+        for headers in ({}, {"HTTP_IF_MODIFIED_SINCE": http_date()}):
+            with self.subTest(headers=headers):
+                response = client.get(url, **headers)
+                self.assertEqual(
+                    response.status_code, status.HTTP_404_NOT_FOUND
+                )
+
+    def test_validators_differ_for_users(self):
+        """User's state is in the response, so ETag differs for users."""
+        etag = RecipeConditionalRequestsViewTests.authorized_client.get(
+            self.url_detail
+        ).headers["ETag"]
+
+        response = RecipeConditionalRequestsViewTests.other_client.get(
+            self.url_detail, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_modified_after_create(self):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        etag = client.get(URL_RECIPES_LIST).headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeFactory(author=RecipeConditionalRequestsViewTests.user)
+
+        self.assertModified(URL_RECIPES_LIST, etag)
+
+    def test_modified_after_update(self):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        etags = {
+            url: client.get(url).headers["ETag"]
+            for url in (URL_RECIPES_LIST, self.url_detail)
+        }
+
+        recipe = Recipe.objects.get(
+            id=RecipeConditionalRequestsViewTests.recipe.id
+        )
+        recipe.cooking_time += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.save()
+
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertModified(url, etag)
+
+    def test_modified_after_delete(self):
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        recipe = RecipeFactory(author=RecipeConditionalRequestsViewTests.user)
+        etag = client.get(URL_RECIPES_LIST).headers["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+        self.assertModified(URL_RECIPES_LIST, etag)
+
+    def test_modified_after_favorite_change(self):
+        """Adding to favorites changes 'is_favorited' of the recipe."""
+        client = RecipeConditionalRequestsViewTests.authorized_client
+        etags = {
+            url: client.get(url).headers["ETag"]
+            for url in (URL_RECIPES_LIST, self.url_detail)
+        }
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.get(
+                reverse(
+                    "recipes-favorite",
+                    args=[RecipeConditionalRequestsViewTests.recipe.id],
+                )
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertModified(url, etag)
+
+
+def make_base64_image(size, image_format="PNG"):
+    content = BytesIO()
+    Image.new("RGB", size, color="red").save(content, format=image_format)
+    encoded = base64.b64encode(content.getvalue()).decode()
+    return f"data:image/{image_format.lower()};base64,{encoded}"
+
+
+@override_settings(RECIPE_IMAGE_MAX_SIDE=10)
+class RecipeImageViewTests(APITestCase):
+    def setUp(self) -> None:
+        media_settings = override_settings(MEDIA_ROOT=tempfile_mkdtemp())
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = UserFactory()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(user=self.user)
+
+        measurement_unit = MeasurementUnitFactory()
+        ingredient = IngredientFactory(measurement_unit=measurement_unit)
+        self.data = {
+            "ingredients": [{"id": ingredient.id, "amount": 10}],
+            "tags": [RecipeTagFactory().id],
+            "image": make_base64_image((40, 20)),
+            "name": "Рецепт с картинкой",
+            "text": "Описание рецепта.",
+            "cooking_time": "20",
+        }
+
+    def get_stored_images(self):
+        images_dir = Path(settings.MEDIA_ROOT) / "recipes" / "images"
+        return sorted(
+            path.relative_to(settings.MEDIA_ROOT).as_posix()
+            for path in images_dir.rglob("*")
+            if path.is_file()
+        )
+
+    def delete_orphan_images(self):
+        call_command("delete_orphan_images", "--min-age=0", stdout=StringIO())
+
+    def test_large_image_is_processed(self):
+        """
+        Large image is downscaled by background task, the original file is
+        left for orphans cleanup.
+        """
+        response = self.authorized_client.post(
+            URL_RECIPES_LIST, data=self.data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (10, 5))
+        self.assertRegex(
+            recipe.image.name,
+            r"^recipes/images/[0-9a-f]{2}/[0-9a-f]{64}\.png$",
+            msg="Обработанная картинка хранится рядом с исходной.",
+        )
+
+        self.delete_orphan_images()
+        self.assertEqual(
+            self.get_stored_images(),
+            [recipe.image.name],
+            msg="Исходная картинка должна быть удалена после обработки.",
+        )
+
+    def test_identical_images_are_stored_once(self):
+        self.data["image"] = make_base64_image((8, 4))
+        for number in range(2):
+            self.data["name"] = f"Рецепт с картинкой {number}"
+            response = self.authorized_client.post(
+                URL_RECIPES_LIST, data=self.data, format="json"
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        names = set(Recipe.objects.values_list("image", flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.get_stored_images(), sorted(names))
+
+        Recipe.objects.first().delete()
+        self.delete_orphan_images()
+        self.assertEqual(
+            self.get_stored_images(),
+            sorted(names),
+            msg="Картинка другого рецепта не должна быть удалена.",
+        )
+
+    def test_small_image_is_not_processed(self):
+        self.data["image"] = make_base64_image((8, 4))
+
+        response = self.authorized_client.post(
+            URL_RECIPES_LIST, data=self.data, format="json"
+        )
+
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (8, 4))
+
+    def test_image_is_stored_outside_transaction(self):
+        """No transaction is opened by the request while image is written."""
+        storage = Recipe._meta.get_field("image").storage
+        atomic_blocks = len(connection.savepoint_ids)
+        atomic_blocks_on_save = []
+        save = storage.save
+
+        def save_and_check(*args, **kwargs):
+            atomic_blocks_on_save.append(len(connection.savepoint_ids))
+            return save(*args, **kwargs)
+
+        with patch.object(storage, "save", side_effect=save_and_check):
+            self.authorized_client.post(
+                URL_RECIPES_LIST, data=self.data, format="json"
+            )
+
+        self.assertEqual(atomic_blocks_on_save[0], atomic_blocks)
+
+    def test_image_of_failed_transaction_is_orphan(self):
+        with patch(
+            "foodgram.recipes.serializers.change_counter",
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.authorized_client.post(
+                    URL_RECIPES_LIST, data=self.data, format="json"
+                )
+
+        self.assertFalse(Recipe.objects.filter(name=self.data["name"]))
+        self.assertEqual(len(self.get_stored_images()), 1)
+
+        call_command("delete_orphan_images", stdout=StringIO())
+        self.assertEqual(
+            len(self.get_stored_images()),
+            1,
+            msg="Свежая картинка может принадлежать рецепту в транзакции.",
+        )
+
+        self.delete_orphan_images()
+        self.assertEqual(
+            self.get_stored_images(),
+            [],
+            msg="Картинка не сохраненного рецепта должна быть удалена.",
+        )
+
+    def test_broken_image_processing_fails(self):
+        recipe = RecipeFactory(author=self.user)
+        name = recipe.image.storage.save(
+            "recipes/images/broken.png", ContentFile(b"not an image")
+        )
+        Recipe.objects.filter(id=recipe.id).update(image=name)
+
+        process_recipe_image(recipe.id, name)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_FAILED)
+        self.assertEqual(recipe.image.name, name)
+
+    @override_settings(
+        RECIPE_IMAGE_MAX_SIDE=100, RECIPE_IMAGE_VARIANT_WIDTHS=[16, 8, 40]
+    )
+    def test_image_variants_are_made(self):
+        """Variants narrower than the image are made in JPEG and WebP."""
+        response = self.authorized_client.post(
+            URL_RECIPES_LIST, data=self.data, format="json"
+        )
+
+        recipe = Recipe.objects.get(id=response.data["id"])
+        self.assertEqual(recipe.image_status, Recipe.IMAGE_READY)
+        self.assertEqual(
+            [variant["width"] for variant in recipe.image_variants], [8, 16]
+        )
+        storage = recipe.image.storage
+        for variant in recipe.image_variants:
+            for key, image_format in (("image", "JPEG"), ("webp", "WEBP")):
+                with self.subTest(width=variant["width"], key=key):
+                    with Image.open(storage.path(variant[key])) as image:
+                        self.assertEqual(image.format, image_format)
+                        self.assertEqual(image.width, variant["width"])
+
+    @override_settings(
+        RECIPE_IMAGE_MAX_SIDE=100, RECIPE_IMAGE_VARIANT_WIDTHS=[8]
+    )
+    def test_image_variants_field_is_opt_in(self):
+        from ..serializers import RecipeSerializer
+
+        response = self.authorized_client.post(
+            URL_RECIPES_LIST, data=self.data, format="json"
+        )
+        url = reverse("recipes-detail", args=[response.data["id"]])
+
+        response = self.authorized_client.get(url)
+        self.assertNotIn("image_variants", response.data)
+
+        response = self.authorized_client.get(url, {"image_variants": "true"})
+        variants = response.data["image_variants"]
+        self.assertEqual(len(variants), 1)
+        self.assertEqual(variants[0]["width"], 8)
+        self.assertTrue(variants[0]["webp"].startswith("http://testserver/"))
+        self.assertTrue(variants[0]["webp"].endswith(".webp"))
+
+        recipe = Recipe.ext_objects.with_user_state(user=self.user).get(
+            id=response.data["id"]
+        )
+        request = Request(APIRequestFactory().get(url, {"image_variants": 1}))
+        self.assertEqual(
+            response.content,
+            JSONRenderer().render(
+                RecipeSerializer(recipe, context={"request": request}).data
+            ),
+        )
+
+    def test_new_image_drops_old_variants(self):
+        recipe = RecipeFactory(author=self.user)
+        Recipe.objects.filter(id=recipe.id).update(
+            image_variants=[{"width": 8, "image": "a.jpg", "webp": "a.webp"}]
+        )
+        self.data["image"] = make_base64_image((8, 4))
+
+        response = self.authorized_client.patch(
+            reverse("recipes-detail", args=[recipe.id]),
+            data=self.data,
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, [])
+
+
+@override_settings(MEDIA_ROOT=TEMP_DIR)
+class RecipeFeedViewTests(APITestCase):
+    def setUp(self) -> None:
+        self.follower = UserFactory()
+        self.authors = UserFactory.create_batch(2)
+        self.stranger = UserFactory()
+        for author in self.authors:
+            UserSubscriptionFactory(follower=self.follower, following=author)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.follower)
+
+    def create_recipes(self, author, amount, fan_out=True):
+        recipes = RecipeFactory.create_batch(amount, author=author)
+        if fan_out:
+            for recipe in recipes:
+                fan_out_recipe(recipe.id)
+        return recipes
+
+    def get_feed_ids(self, **params):
+        """Walks over all the feed pages, returns recipes ids."""
+        ids = []
+        url = URL_RECIPES_FEED
+        while url is not None:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(recipe["id"] for recipe in response.data["results"])
+            url, params = response.data["next"], {}
+        return ids
+
+    def test_feed_requires_authentication(self):
+        response = APIClient().get(URL_RECIPES_FEED)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_feed_has_followed_authors_recipes(self):
+        recipes = [
+            *self.create_recipes(self.authors[0], 3),
+            *self.create_recipes(self.authors[1], 2),
+        ]
+        self.create_recipes(self.stranger, 2)
+
+        expected = [recipe.id for recipe in reversed(recipes)]
+        self.assertEqual(self.get_feed_ids(), expected)
+        self.assertEqual(
+            self.get_feed_ids(limit=2),
+            expected,
+            msg="Страницы по курсору должны идти без пропусков и повторов.",
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(follower=self.follower).count(), 5
+        )
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_not_fanned_out_recipes_are_read_from_recipes(self):
+        """
+        Recipes of authors with too many followers are not fanned out but
+        are in the feed along with fanned out recipes.
+        """
+        popular = self.create_recipes(self.authors[0], 3)
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=10):
+            usual = self.create_recipes(self.authors[1], 2)
+        self.assertFalse(
+            Recipe.objects.filter(id=popular[0].id, feed_fanout=True)
+        )
+
+        expected = [recipe.id for recipe in reversed(popular + usual)]
+        self.assertEqual(self.get_feed_ids(limit=2), expected)
+
+    def test_new_recipe_is_fanned_out(self):
+        measurement_unit = MeasurementUnitFactory()
+        ingredient = IngredientFactory(measurement_unit=measurement_unit)
+        client = APIClient()
+        client.force_authenticate(user=self.authors[0])
+
+        response = client.post(
+            URL_RECIPES_LIST,
+            data={
+                "ingredients": [{"id": ingredient.id, "amount": 10}],
+                "tags": [RecipeTagFactory().id],
+                "image": SMALL_GIF,
+                "name": "Новый рецепт",
+                "text": "Описание рецепта.",
+                "cooking_time": "20",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertTrue(
+            FeedEntry.objects.filter(
+                follower=self.follower, recipe_id=response.data["id"]
+            ).exists()
+        )
+        self.assertEqual(self.get_feed_ids(), [response.data["id"]])
+
+    @override_settings(FEED_BACKFILL_SIZE=2)
+    def test_follow_backfills_and_unfollow_clears_feed(self):
+        recipes = self.create_recipes(self.stranger, 3)
+        url = reverse("users-subscribe", args=[self.stranger.id])
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(
+            self.get_feed_ids(),
+            [recipes[2].id, recipes[1].id],
+            msg="В ленту должны добавиться последние рецепты автора.",
+        )
+
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_feed_ids(), [])
+
+    def test_broken_cursor(self):
+        response = self.client.get(URL_RECIPES_FEED, {"cursor": "broken"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
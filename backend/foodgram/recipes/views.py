@@ -1,52 +1,144 @@
 from django.conf import settings
-from django.http import HttpResponse
-from django.template.loader import get_template
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.exceptions import NotAcceptable, NotFound
+from rest_framework.exceptions import NotAcceptable, NotFound, ValidationError
 from rest_framework.permissions import (
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
-from xhtml2pdf import pisa
 
+from ..core.cache import (
+    get_user_state_changed_at,
+    json_response,
+    set_rendered,
+    touch_user_state,
+)
+from ..core.pagination import FoodgramCursorPagination
+from ..core.serializers import BulkActionSerializer
+from ..core.utils import change_counter, lock_rows, plan_bulk_action
+from ..users.cache import get_following_ids
 from ..users.permissions import IsAuthor, ReadOnly
+from .cache import get_catalog, get_recipes_cache_key, get_recipes_etag
+from .cart import (
+    add_to_cart_totals,
+    delete_recipe_from_cart_totals,
+    remove_from_cart_totals,
+)
+from .exports import EXPORT_FORMATS, iter_cart_rows, stream_cart
+from .feed import decode_cursor, encode_cursor, get_feed_page
 from .filters import IngredientFilter, RecipeFilter
-from .models import Ingredient, Recipe, RecipeCart, RecipeFavorite, RecipeTag
+from .models import (
+    Ingredient,
+    Recipe,
+    RecipeCart,
+    RecipeFavorite,
+    RecipeTag,
+    ShoppingCartPDF,
+)
+from .pdf import get_cart_pdf_job, get_cart_rows
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 from .serializers import (
     BaseRecipeSerializer,
     IngredientSerializer,
     RecipeCreateSerializer,
+    RecipeReadSerializer,
     RecipeSerializer,
     RecipeTagSerializer,
+    ShoppingCartPDFSerializer,
 )
 
+User = get_user_model()
+
 
-class RecipeTagViewSet(ReadOnlyModelViewSet):
+class CachedCatalogListMixin:
+    """
+    Serves unfiltered JSON list from cache as pre-rendered bytes with
+    'ETag' header. The cache is outdated by signals when any catalog
+    object changes.
+    """
+
+    catalog_name = None
+
+    def list(self, request, *args, **kwargs):
+        is_json = request.accepted_renderer.format == "json"
+        if request.query_params or not is_json:
+            return super().list(request, *args, **kwargs)
+
+        content, etag = get_catalog(
+            self.catalog_name,
+            self.get_queryset(),
+            self.get_serializer_class(),
+        )
+        return json_response(request, content, etag)
+
+
+class RecipeTagViewSet(CachedCatalogListMixin, ReadOnlyModelViewSet):
     queryset = RecipeTag.objects.all()
     serializer_class = RecipeTagSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     pagination_class = None
+    catalog_name = "tags"
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
-    queryset = Ingredient.objects.prefetch_related("measurement_unit")
+class IngredientViewSet(CachedCatalogListMixin, ReadOnlyModelViewSet):
+    queryset = Ingredient.objects.select_related("measurement_unit")
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = [IsAuthenticatedOrReadOnly]
     filterset_class = IngredientFilter
+    catalog_name = "ingredients"
 
 
 class RecipeViewSet(ModelViewSet):
-    queryset = (
-        Recipe.ext_objects.prefetch_related("tags")
-        .prefetch_related("recipeingredients__ingredient")
-        .prefetch_related("recipeingredients__ingredient__measurement_unit")
-    )
+    queryset = Recipe.ext_objects.prefetch_related(
+        "tags"
+    ).with_ingredient_rows()
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthor | ReadOnly]
     filterset_class = RecipeFilter
+    cursor_pagination_class = FoodgramCursorPagination
+    # Filters that order recipes by relevance
+    ranked_filters = ("search", "ingredients")
+
+    @property
+    def paginator(self):
+        """
+        Keyset pagination is opt-in: it is used when the request has
+        '?pagination=cursor' query param. Otherwise default pagination is used.
+        Keyset pagination orders recipes by date, so it can't be used with
+        filters ranking recipes by relevance.
+        """
+        if not hasattr(self, "_paginator"):
+            pagination_class = self.pagination_class
+            query_params = self.request.query_params
+            if query_params.get("pagination") == "cursor":
+                ranked = [
+                    name
+                    for name in self.ranked_filters
+                    if name in query_params
+                ]
+                if ranked:
+                    raise ValidationError(
+                        {
+                            "pagination": [
+                                "Курсорная паджинация несовместима с "
+                                f"фильтрами {', '.join(ranked)}."
+                            ]
+                        }
+                    )
+                pagination_class = self.cursor_pagination_class
+            self._paginator = pagination_class() if pagination_class else None
+        return self._paginator
 
     def get_queryset(self):
         user = self.request.user
@@ -54,6 +146,9 @@ class RecipeViewSet(ModelViewSet):
             user = None
 
         queryset = super().get_queryset()
+        if settings.RECIPES_USER_STATE_STRATEGY == "batch":
+            return queryset.with_user_state(user=user)
+
         queryset = (
             queryset.author_with_subscriptions(user=user)
             .with_favorites(user=user)
@@ -61,13 +156,181 @@ class RecipeViewSet(ModelViewSet):
         )
         return queryset
 
+    def get_object(self):
+        recipe = super().get_object()
+        # 'Last-Modified' of the detail response, see '_conditional_response'
+        self.recipe_updated_at = recipe.updated_at
+        return recipe
+
+    def _get_recipe_updated_at(self, pk):
+        """Returns 'updated_at' of the recipe or None if there is no such."""
+        try:
+            pk = self._get_recipe_id(pk)
+        except NotFound:
+            return None
+        return (
+            Recipe.objects.filter(id=pk)
+            .values_list("updated_at", flat=True)
+            .first()
+        )
+
+    def _conditional_response(self, request, view_method, pk=None):
+        """
+        Answers 304 without serializing recipes if the client has the
+        actual version. ETag is built from the recipes data version (bumped
+        on any change of recipes, see 'recipes.signals') and the time of
+        the last change of user's favorites, shopping cart or subscriptions,
+        so it's checked without queries. Detail responses also have
+        'Last-Modified', the latest of recipe's 'updated_at' and the user's
+        state time. Lists don't have it: deleted recipes and recipes which
+        left the filtered set don't move it.
+        """
+        user_id = request.user.id
+        changed_at = []
+        if user_id is not None:
+            changed_at.append(get_user_state_changed_at(user_id))
+        etag = quote_etag(get_recipes_etag(request, user_id, *changed_at))
+
+        def get_last_modified(updated_at):
+            if updated_at is None:
+                return None
+            # HTTP dates are precise to seconds
+            return int(max([updated_at, *changed_at]).timestamp())
+
+        last_modified = None
+        if pk is not None and "HTTP_IF_MODIFIED_SINCE" in request.META:
+            last_modified = get_last_modified(self._get_recipe_updated_at(pk))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = view_method()
+            if pk is not None:
+                last_modified = get_last_modified(self.recipe_updated_at)
+        response["ETag"] = etag
+        if last_modified is not None:
+            response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def _cached_response(self, request, view_method, pk=None):
+        """
+        Anonymous users get the same recipes pages, so the JSON responses
+        are cached (see 'get_recipes_cache_key'). Other responses support
+        conditional requests. Errors are raised before anything is cached.
+        """
+        if request.accepted_renderer.format != "json":
+            return view_method()
+
+        key = None
+        if not request.user.is_authenticated:
+            parts = [self.action] if pk is None else [self.action, pk]
+            key = get_recipes_cache_key(request, *parts)
+        if key is None:
+            return self._conditional_response(request, view_method, pk)
+
+        cached = cache.get(key)
+        if cached is not None:
+            return json_response(request, *cached)
+
+        response = view_method()
+        _, etag = set_rendered(
+            key,
+            JSONRenderer().render(response.data),
+            timeout=settings.RECIPES_CACHE_TIMEOUT,
+        )
+        response["ETag"] = quote_etag(etag)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(
+            request, lambda: super(RecipeViewSet, self).list(request)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            request,
+            lambda: super(RecipeViewSet, self).retrieve(request, **kwargs),
+            pk=kwargs["pk"],
+        )
+
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        """
+        Recipes of followed authors, newer first (see 'recipes.feed').
+        Pages are addressed with an opaque 'cursor' like in keyset
+        pagination, the response has 'next' link but no 'count'.
+        """
+        cursor = request.query_params.get("cursor")
+        after = None
+        if cursor is not None:
+            try:
+                after = decode_cursor(cursor)
+            except ValueError:
+                raise NotFound("Неверный курсор.")
+
+        size = self.cursor_pagination_class().get_page_size(request)
+        recipes_ids, next_position = get_feed_page(
+            request.user.id,
+            get_following_ids(request.user.id),
+            size,
+            after=after,
+        )
+        recipes = self.get_queryset().filter(id__in=recipes_ids)
+        recipes = sorted(
+            recipes,
+            key=lambda recipe: (recipe.pub_date, recipe.id),
+            reverse=True,
+        )
+
+        next_link = None
+        if next_position is not None:
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                "cursor",
+                encode_cursor(*next_position),
+            )
+        serializer = self.get_serializer(recipes, many=True)
+        return Response(
+            {"next": next_link, "previous": None, "results": serializer.data}
+        )
+
     def get_serializer_class(self):
         if self.action == "create" or self.action == "partial_update":
             return RecipeCreateSerializer
+        if self.action in ("list", "retrieve", "feed"):
+            return RecipeReadSerializer
         return RecipeSerializer
 
-    def _recipe_action_template(self, request, pk=None, related_model=None):
-        """Template for similar ViewSet actions."""
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        change_counter(
+            User.objects.filter(id=instance.author_id), "recipes_count", -1
+        )
+        delete_recipe_from_cart_totals(instance.id)
+        instance.delete()
+
+    @staticmethod
+    def _get_recipe_id(pk):
+        try:
+            return int(pk)
+        except (TypeError, ValueError):
+            raise NotFound("Рецепт не найден.")
+
+    def _recipe_action_template(
+        self,
+        request,
+        pk=None,
+        related_model=None,
+        counter_field=None,
+    ):
+        """
+        Template for similar ViewSet actions. Changes recipe's
+        'counter_field' along with related objects.
+        """
 
         allowed_methods = [
             "GET",
@@ -75,40 +338,120 @@ class RecipeViewSet(ModelViewSet):
         ]
 
         assert (
-            related_model is not None
-        ), "'related_model' (связанная модель) обязательный параметр."
+            related_model is not None and counter_field is not None
+        ), "'related_model' и 'counter_field' обязательные параметры."
 
         assert request.method in allowed_methods, (
             f"В request не допустимый метод. Поддерживаемые методы "
             f"{allowed_methods}"
         )
 
-        recipe = self.get_object()
+        pk = self._get_recipe_id(pk)
+        # Actions don't need annotated queryset of 'get_queryset'. Recipe
+        # is loaded only with the fields of the response.
+        recipe_queryset = Recipe.objects.filter(id=pk)
 
         if request.method == "GET":
-            is_related_obj_exists = related_model.objects.filter(
-                user=request.user,
-                recipe=recipe,
-            ).exists()
-            if is_related_obj_exists:
-                raise NotAcceptable("Такой рецепт у пользователя существует.")
-            related_model.objects.create(
-                user=request.user,
-                recipe=recipe,
+            recipe = get_object_or_404(
+                recipe_queryset.only("id", "name", "image", "cooking_time")
             )
+            self.check_object_permissions(request, recipe)
+            try:
+                # Unique constraint makes the action idempotent without
+                # checking if the object exists first.
+                with transaction.atomic():
+                    lock_rows(User.objects.filter(id=request.user.id))
+                    related_model.objects.create(
+                        user=request.user,
+                        recipe=recipe,
+                    )
+                    change_counter(recipe_queryset, counter_field, 1)
+                    if related_model is RecipeCart:
+                        add_to_cart_totals(request.user.id, [recipe.id])
+                    touch_user_state(request.user.id)
+            except IntegrityError:
+                raise NotAcceptable("Такой рецепт у пользователя существует.")
             serializer = BaseRecipeSerializer(recipe)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == "DELETE":
-            number_deleted_objects, _ = related_model.objects.filter(
-                user=request.user,
-                recipe=recipe,
-            ).delete()
+            with transaction.atomic():
+                lock_rows(User.objects.filter(id=request.user.id))
+                number_deleted_objects, _ = related_model.objects.filter(
+                    user=request.user,
+                    recipe_id=pk,
+                ).delete()
+                if number_deleted_objects != 0:
+                    change_counter(recipe_queryset, counter_field, -1)
+                    if related_model is RecipeCart:
+                        remove_from_cart_totals(request.user.id, [pk])
+                    touch_user_state(request.user.id)
 
             if number_deleted_objects == 0:
                 raise NotFound("Такой рецепт у пользователя не найден.")
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _bulk_recipe_action_template(
+        self, request, related_model=None, counter_field=None
+    ):
+        """
+        Adds and removes many recipes to 'related_model' list (favorites
+        or shopping cart) with constant number of queries. Returns status
+        of every item.
+        """
+        assert (
+            related_model is not None and counter_field is not None
+        ), "'related_model' и 'counter_field' обязательные параметры."
+
+        serializer = BulkActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add_ids = serializer.validated_data["add"]
+        remove_ids = serializer.validated_data["remove"]
+
+        user = request.user
+        existing_ids = set(
+            Recipe.objects.filter(id__in=add_ids).values_list("id", flat=True)
+        )
+        related_objects = related_model.objects.filter(
+            user=user, recipe_id__in=[*add_ids, *remove_ids]
+        )
+
+        with transaction.atomic():
+            # Changes of the user's lists are serialized on the user's row,
+            # so the planned changes are the actual ones and the counters
+            # and shopping list totals are changed by them exactly.
+            lock_rows(User.objects.filter(id=user.id))
+            related_ids = set(
+                related_objects.values_list("recipe_id", flat=True)
+            )
+            to_add, to_remove, results = plan_bulk_action(
+                add_ids, remove_ids, existing_ids, related_ids
+            )
+            if to_add:
+                related_model.objects.bulk_create(
+                    (
+                        related_model(user=user, recipe_id=recipe_id)
+                        for recipe_id in to_add
+                    ),
+                    ignore_conflicts=True,
+                )
+                recipes = Recipe.objects.filter(id__in=to_add)
+                change_counter(recipes, counter_field, 1)
+            if to_remove:
+                related_objects.filter(recipe_id__in=to_remove).delete()
+                recipes = Recipe.objects.filter(id__in=to_remove)
+                change_counter(recipes, counter_field, -1)
+
+            if related_model is RecipeCart:
+                if to_add:
+                    add_to_cart_totals(user.id, to_add)
+                if to_remove:
+                    remove_from_cart_totals(user.id, to_remove)
+            if to_add or to_remove:
+                touch_user_state(user.id)
+
+        return Response({"results": results})
+
     @action(
         methods=["get", "delete"],
         detail=True,
@@ -117,7 +460,9 @@ class RecipeViewSet(ModelViewSet):
     def favorite(self, request, pk=None):
         """Add or remove recipe to user's favorite list."""
         related_model = RecipeFavorite
-        return self._recipe_action_template(request, pk, related_model)
+        return self._recipe_action_template(
+            request, pk, related_model, counter_field="favorites_count"
+        )
 
     @action(
         methods=["get", "delete"],
@@ -127,33 +472,126 @@ class RecipeViewSet(ModelViewSet):
     def shopping_cart(self, request, pk=None):
         """Add or remove recipe in user's shopping cart."""
         related_model = RecipeCart
-        return self._recipe_action_template(request, pk, related_model)
+        return self._recipe_action_template(
+            request, pk, related_model, counter_field="cart_count"
+        )
+
+    @action(
+        methods=["post"],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_favorite(self, request):
+        """
+        Add and remove many recipes to user's favorite list. Expects
+        '{"add": [ids], "remove": [ids]}'.
+        """
+        return self._bulk_recipe_action_template(
+            request, RecipeFavorite, counter_field="favorites_count"
+        )
 
     @action(
+        methods=["post"],
         detail=False,
         permission_classes=[IsAuthenticated],
     )
+    def bulk_shopping_cart(self, request):
+        """
+        Add and remove many recipes in user's shopping cart. Expects
+        '{"add": [ids], "remove": [ids]}'.
+        """
+        return self._bulk_recipe_action_template(
+            request, RecipeCart, counter_field="cart_count"
+        )
+
+    @action(
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            JSONRenderer,
+            PDFRenderer,
+            PlainTextRenderer,
+            CSVRenderer,
+        ],
+    )
     def download_shopping_cart(self, request):
         """
         Generate and return list of ingredient's form user's shopping cart.
+        PDF is rendered only if the list has changed since the last time.
+        With '?format=txt|csv|json' the list is streamed without PDF.
         """
-        user = request.user
-        queryset = Ingredient.ext_objects.user_cart(user=user)
+        export_format = request.query_params.get("format", "pdf")
+        if export_format in EXPORT_FORMATS:
+            response = stream_cart(iter_cart_rows(request.user), export_format)
+            if response is None:
+                raise NotFound("Список покупок пустой.")
+            return response
 
-        if not queryset.exists():
+        rows = get_cart_rows(user=request.user)
+        if not rows:
             raise NotFound("Список покупок пустой.")
 
-        context = {"ingredient_list": queryset}
-        context["STATIC_ROOT"] = settings.STATIC_ROOT
+        job = get_cart_pdf_job(request.user, rows, background=False)
+        return self._cart_pdf_file_response(job)
 
-        template_path = "cart_list_pdf.html"
-        template = get_template(template_path)
-        html = template.render(context)
+    def _cart_pdf_file_response(self, job):
+        if job.status == ShoppingCartPDF.FAILED:
+            raise NotAcceptable("Не удается подготовить PDF с списком.")
+        if job.status != ShoppingCartPDF.DONE:
+            raise NotFound("PDF со списком покупок еще не готов.")
 
-        response = HttpResponse(content_type="application/pdf")
-        response["Content-Disposition"] = 'attachment; filename="cart.pdf"'
+        return FileResponse(
+            job.file.open("rb"),
+            as_attachment=True,
+            filename="cart.pdf",
+            content_type="application/pdf",
+        )
 
-        pisa_status = pisa.CreatePDF(html, dest=response)
-        if pisa_status.err:
-            raise NotAcceptable("Не удается подготовить PDF с списком.")
-        return response
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_pdf(self, request):
+        """
+        Start rendering PDF with user's shopping list in background.
+        Returns the job status with 202 code or with 200 code if the PDF
+        is ready.
+        """
+        rows = get_cart_rows(user=request.user)
+        if not rows:
+            raise NotFound("Список покупок пустой.")
+
+        job = get_cart_pdf_job(request.user, rows)
+        serializer = ShoppingCartPDFSerializer(
+            job,
+            context=self.get_serializer_context(),
+        )
+        code = status.HTTP_202_ACCEPTED
+        if job.status == ShoppingCartPDF.DONE:
+            code = status.HTTP_200_OK
+        return Response(serializer.data, status=code)
+
+    @action(
+        detail=False,
+        url_path=r"shopping_cart_pdf/(?P<job_id>\d+)",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_pdf_status(self, request, job_id=None):
+        """Return status of PDF rendering."""
+        job = get_object_or_404(ShoppingCartPDF, id=job_id, user=request.user)
+        serializer = ShoppingCartPDFSerializer(
+            job,
+            context=self.get_serializer_context(),
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        url_path=r"shopping_cart_pdf/(?P<job_id>\d+)/download",
+        permission_classes=[IsAuthenticated],
+    )
+    def shopping_cart_pdf_download(self, request, job_id=None):
+        """Return rendered PDF."""
+        job = get_object_or_404(ShoppingCartPDF, id=job_id, user=request.user)
+        return self._cart_pdf_file_response(job)
@@ -0,0 +1,49 @@
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from ..core.cache import bump_version, versioned_key
+from .models import UserSubscription
+
+FOLLOWING_NAMESPACE = "users:following"
+
+
+def _get_following_ids_from_db(user_id):
+    return frozenset(
+        UserSubscription.objects.filter(follower_id=user_id).values_list(
+            "following_id", flat=True
+        )
+    )
+
+
+def _get_namespace(user_id):
+    return f"{FOLLOWING_NAMESPACE}:{user_id}"
+
+
+def get_following_ids(user_id):
+    """
+    Returns frozenset of ids of users followed by the user. It replaces
+    subscriptions subqueries: 'is_subscribed' is set in python and
+    subscriptions list is paginated by the ids.
+
+    Ids are cached per version of the user's subscriptions. A fill made
+    from the database read before a change is committed lands under the
+    outdated version, so it can't override the change.
+    """
+    key = versioned_key(_get_namespace(user_id), "ids")
+    following_ids = cache.get(key)
+    if following_ids is None:
+        following_ids = _get_following_ids_from_db(user_id)
+        cache.add(key, following_ids, timeout=settings.FOLLOWING_CACHE_TIMEOUT)
+    return following_ids
+
+
+def invalidate_following_ids(user_id):
+    """
+    Outdates the user's cached following ids once the transaction is
+    committed. It must be called on every subscriptions change, changes
+    made elsewhere (e.g. in admin) are noticed no later than the timeout.
+    """
+    transaction.on_commit(partial(bump_version, _get_namespace(user_id)))
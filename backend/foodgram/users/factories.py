@@ -6,6 +6,25 @@ from .models import UserSubscription
 User = get_user_model()
 
 
+def bulk_create_users(amount, prefix="bulk_user"):
+    """
+    Fast creation of many users without password hashing. Users can't log
+    in, they are for benchmarks only.
+    Users are fetched again because not every database sets primary keys
+    after 'bulk_create'.
+    """
+    users = (
+        User(
+            username=f"{prefix}_{number}",
+            email=f"{prefix}_{number}@foodgram.ru",
+            password="!",
+        )
+        for number in range(amount)
+    )
+    User.objects.bulk_create(users, batch_size=1000)
+    return list(User.objects.filter(username__startswith=f"{prefix}_"))
+
+
 class UserSubscriptionFactory(factory.django.DjangoModelFactory):
     """
     Picks rundom user object and set it as follower.
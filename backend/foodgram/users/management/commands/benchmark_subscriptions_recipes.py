@@ -0,0 +1,88 @@
+import random
+from typing import Any, Dict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import OuterRef, Prefetch, Subquery
+
+from ....core.benchmark import BenchmarkCommand, measure
+from ....recipes.factories import bulk_create_recipes
+from ....recipes.models import Recipe
+from ...factories import bulk_create_users
+from ...models import UserSubscription
+
+User = get_user_model()
+
+
+def legacy_limit_recipes(queryset, count):
+    """'limit_recipes' how it was: correlated sliced subquery per recipe."""
+    recipes = Recipe.objects.filter(author__id=OuterRef("author_id"))
+    recipes_ids = Subquery(recipes.values_list("id", flat=True)[:count])
+    prefetch = Prefetch(
+        "recipes", queryset=Recipe.objects.filter(id__in=recipes_ids)
+    )
+    return queryset.prefetch_related(prefetch)
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Замеряет задержку (p50/p95) получения страницы подписок с "
+        "ограниченным количеством рецептов (recipes_limit): коррелированный "
+        "подзапрос против ROW_NUMBER() по авторам страницы. "
+        "Тестовые данные удаляются после замеров."
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--authors", type=int, default=1000)
+        parser.add_argument("--author-recipes", type=int, default=500)
+        parser.add_argument("--recipes-limit", type=int, default=3)
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=settings.REST_FRAMEWORK["PAGE_SIZE"],
+        )
+
+    def seed(self, **options: Any) -> None:
+        (self.follower,) = bulk_create_users(1, prefix="bench_follower")
+        authors = bulk_create_users(options["authors"], prefix="bench_author")
+        UserSubscription.objects.bulk_create(
+            UserSubscription(follower=self.follower, following=author)
+            for author in authors
+        )
+        bulk_create_recipes(
+            options["authors"] * options["author_recipes"], authors
+        )
+
+    def run(self, **options: Any) -> Dict[str, Any]:
+        page_size = options["page_size"]
+        count = options["recipes_limit"]
+        pages = max(options["authors"] // page_size, 1)
+        queryset = (
+            User.ext_objects.order_by("id")
+            .filter(
+                id__in=self.follower.following.values_list(
+                    "following", flat=True
+                )
+            )
+            .with_subscriptions(user=self.follower)
+        )
+
+        def fetch_page(limited_queryset):
+            offset = random.randrange(pages) * page_size
+            users = list(limited_queryset[offset : offset + page_size])
+            return [list(user.recipes.all()) for user in users]
+
+        return {
+            "recipes": Recipe.objects.count(),
+            "page_size": page_size,
+            "recipes_limit": count,
+            "correlated_subquery": measure(
+                lambda: fetch_page(legacy_limit_recipes(queryset, count)),
+                repeat=options["repeat"],
+            ),
+            "row_number": measure(
+                lambda: fetch_page(queryset.limit_recipes(count)),
+                repeat=options["repeat"],
+            ),
+        }
@@ -1,47 +1,71 @@
+from functools import partial
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
-from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models import (
+    BooleanField,
+    F,
+    Prefetch,
+    Q,
+    Value,
+    prefetch_related_objects,
+)
 from django.utils.translation import gettext_lazy as _
 
+from ..core.models import PostFetchHooksQuerySet
+
+
+class UserQuerySet(PostFetchHooksQuerySet):
+    @staticmethod
+    def _set_subscriptions(users, user):
+        from .cache import get_following_ids
+
+        following_ids = get_following_ids(user.id) if users else ()
+        for following in users:
+            following.is_subscribed = following.id in following_ids
 
-class UserQuerySet(models.QuerySet):
     def with_subscriptions(self, user=None):
         """
-        If user object provided annotates queryset with "is_subscribed" field.
-        If user wasn't provided it still annotests with the field but it
-        allways "False".
+        If user object provided sets "is_subscribed" attribute on fetched
+        users from the cached set of users followed by the user (see
+        'users.cache.get_following_ids'), no subquery is made. It isn't an
+        annotation, so it can't be used in filters.
+        If user wasn't provided it annotates with the field but it
+        allways "False", constant instead of subquery.
         """
-        subquery = UserSubscription.objects.filter(
-            follower=user,
-            following_id=OuterRef("id"),
+        if user is None:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self._add_post_fetch_hook(
+            partial(self._set_subscriptions, user=user)
         )
-        qs = self.annotate(is_subscribed=Exists(subquery))
-        return qs
 
-    def with_recipes_count(self):
-        """Annotates queryset with amount of user's recipes."""
-        qs = self.annotate(recipes_count=Count("recipes"))
-        return qs
+    @staticmethod
+    def _set_limited_recipes(users, count):
+        """
+        Prefetches 'recipes' of fetched users: the latest 'count' recipes of
+        every user with one query, see 'RecipeQuerySet.latest_by_authors'.
+        """
+        from ..recipes.models import Recipe
+
+        authors_ids = [user.id for user in users]
+        recipes = Recipe.ext_objects.latest_by_authors(authors_ids, count)
+        prefetch_related_objects(users, Prefetch("recipes", queryset=recipes))
 
     def limit_recipes(self, count: int = None):
         """
         Prefetch user's list with their recipes.
         The number of user's recipes is limited with 'count'.
         If 'count' attribute is less than 0 then 0 recipes returns.
+        Recipes are fetched for the fetched users only, see
+        '_set_limited_recipes'.
         """
-        from ..recipes.models import Recipe
-
-        count = 0 if count < 0 else count
-
-        recipes = Recipe.objects.filter(author__id=OuterRef("author_id"))
-        recipes_sliced_values_qs = recipes.values_list("id", flat=True)[:count]
-        subquery_recipes_ids = Subquery(recipes_sliced_values_qs)
-        recipes_sliced_qs = Recipe.objects.filter(id__in=subquery_recipes_ids)
-
-        prefetch = Prefetch("recipes", queryset=recipes_sliced_qs)
-        qs = self.prefetch_related(prefetch)
-        return qs
+        count = max(int(count), 0)
+        return self._add_post_fetch_hook(
+            partial(self._set_limited_recipes, count=count)
+        )
 
 
 class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
@@ -56,6 +80,11 @@ class User(AbstractUser):
         blank=False,
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name="Количество рецептов",
+        default=0,
+        editable=False,
+    )
 
     objects = UserManager()
     ext_objects = CustomUserManager()
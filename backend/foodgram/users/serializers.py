@@ -34,9 +34,7 @@ class UserCreateSerializer(djoser_serializers.UserCreateSerializer):
 class UserWithRecipesSerializer(UserSerializer):
     """Returns users list with their recipes.
 
-    User queryset have to be annotated with:
-        - is_subscribed
-        - recipes_count
+    User queryset have to be annotated with "is_subscribed" field.
     """
 
     from foodgram.recipes.serializers import BaseRecipeSerializer
@@ -1,3 +1,4 @@
+import json
 from io import StringIO
 
 from django.core.management import call_command
@@ -9,3 +10,23 @@ class FillUsersTest(TestCase):
         out = StringIO()
         call_command("fill_users", 5, stdout=out)
         self.assertIn("Пользователи созданы успешно.", out.getvalue())
+
+
+class BenchmarkSubscriptionsRecipesTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command(
+            "benchmark_subscriptions_recipes",
+            "--authors=4",
+            "--author-recipes=5",
+            "--page-size=2",
+            "--repeat=2",
+            stdout=out,
+        )
+        results = json.loads(out.getvalue())
+
+        self.assertEqual(results["recipes"], 20)
+        self.assertEqual(
+            results["row_number"]["queries"],
+            results["correlated_subquery"]["queries"],
+        )
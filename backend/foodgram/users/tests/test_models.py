@@ -3,6 +3,8 @@ from django.core.exceptions import ValidationError
 from django.db import IntegrityError
 from django.test import TestCase
 
+from ...recipes.factories import RecipeFactory
+from ...recipes.models import Recipe
 from ..factories import UserFactory
 from ..models import UserSubscription
 
@@ -46,3 +48,48 @@ class UserModelTest(TestCase):
         constraint_name = "Unique subscription - prevent user follow himself"
         with self.assertRaisesMessage(IntegrityError, constraint_name):
             UserSubscription.objects.create(follower=user, following=user)
+
+
+class UserQuerySetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.authors = UserFactory.create_batch(4)
+        for author, recipes_count in zip(cls.authors, (0, 2, 3, 7)):
+            RecipeFactory.create_batch(recipes_count, author=author)
+
+    def test_limit_recipes_with_uneven_recipes_counts(self):
+        """Every user gets their latest recipes up to the limit."""
+        authors_ids = [author.id for author in UserQuerySetTest.authors]
+        users = User.ext_objects.filter(id__in=authors_ids).order_by("id")
+
+        for count, expected_counts in (
+            (0, [0, 0, 0, 0]),
+            (1, [0, 1, 1, 1]),
+            (3, [0, 2, 3, 3]),
+            (10, [0, 2, 3, 7]),
+        ):
+            with self.subTest(count=count):
+                with self.assertNumQueries(2 if count else 1):
+                    limited_users = list(users.limit_recipes(count))
+                    recipes = [
+                        list(user.recipes.all()) for user in limited_users
+                    ]
+
+                self.assertEqual(
+                    [len(user_recipes) for user_recipes in recipes],
+                    expected_counts,
+                )
+                for user, user_recipes in zip(limited_users, recipes):
+                    latest = list(Recipe.objects.filter(author=user)[:count])
+                    self.assertEqual(user_recipes, latest)
+
+    def test_limit_recipes_with_sliced_queryset(self):
+        """Recipes are fetched for the page of users with one query."""
+        users = User.ext_objects.order_by("id").limit_recipes(2)
+        with self.assertNumQueries(2):
+            users = list(users[1:4])
+            self.assertEqual(
+                [len(user.recipes.all()) for user in users],
+                [2, 2, 2],
+            )
@@ -0,0 +1,138 @@
+from pathlib import Path
+from tempfile import mkdtemp
+
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase, override_settings
+
+from ...core.testing import PerformanceTestMixin
+from ...recipes.factories import (
+    IngredientFactory,
+    MeasurementUnitFactory,
+    RecipeFactory,
+    RecipeTagFactory,
+)
+from ..factories import UserFactory, UserSubscriptionFactory
+
+BASELINES_PATH = Path(__file__).parent / "performance_baselines.json"
+
+URL_USERS_LIST = reverse("users-list")
+URL_USERS_ME = reverse("users-me")
+URL_SUBSCRIPTIONS_LIST = reverse("subscriptions-list")
+URL_BULK_SUBSCRIBE = reverse("users-bulk-subscribe")
+
+PAGE_SIZES = (1, 6, 20)
+
+
+@override_settings(MEDIA_ROOT=mkdtemp())
+class UsersPerformanceTests(PerformanceTestMixin, APITestCase):
+    """
+    Query counts and time budgets of users endpoints. Query counts must
+    not depend on the page size: a growing count is an N+1 regression.
+    """
+
+    baselines_path = BASELINES_PATH
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user = UserFactory()
+        cls.authors = UserFactory.create_batch(30)
+
+        unit = MeasurementUnitFactory()
+        IngredientFactory.create_batch(10, measurement_unit=unit)
+        RecipeTagFactory.create_batch(3)
+        for author in cls.authors:
+            RecipeFactory.create_batch(5, author=author)
+        for author in cls.authors[:25]:
+            UserSubscriptionFactory(follower=cls.user, following=author)
+
+        cls.anonymous_client = APIClient()
+        cls.user_client = APIClient()
+        cls.user_client.force_authenticate(user=cls.user)
+
+    def test_users(self):
+        client = self.user_client
+        for limit in PAGE_SIZES:
+            name = f"users_list[limit={limit}]"
+            with self.subTest(name):
+                self.assertEndpointBudget(
+                    name,
+                    lambda: client.get(URL_USERS_LIST, {"limit": limit}),
+                    3,
+                )
+
+        url = reverse("users-detail", args=[self.authors[0].id])
+        for client_name, client, queries in (
+            ("anonymous", self.anonymous_client, 1),
+            ("user", self.user_client, 2),
+        ):
+            name = f"users_detail[{client_name}]"
+            with self.subTest(name):
+                self.assertEndpointBudget(
+                    name, lambda: client.get(url), queries
+                )
+
+        # The user is authenticated without queries in tests
+        with self.subTest("users_me"):
+            self.assertEndpointBudget(
+                "users_me", lambda: self.user_client.get(URL_USERS_ME), 0
+            )
+
+    def test_subscriptions(self):
+        # Recipes of the page's users are fetched with one query with and
+        # without 'recipes_limit'
+        for recipes_limit in (None, 3):
+            for limit in PAGE_SIZES:
+                params = {"limit": limit}
+                if recipes_limit is not None:
+                    params["recipes_limit"] = recipes_limit
+                name = (
+                    f"subscriptions_list[limit={limit},"
+                    f"recipes_limit={recipes_limit}]"
+                )
+                with self.subTest(name):
+                    self.assertEndpointBudget(
+                        name,
+                        lambda: self.user_client.get(
+                            URL_SUBSCRIPTIONS_LIST, params
+                        ),
+                        4,
+                    )
+
+    def test_subscribe(self):
+        client = self.user_client
+        url = reverse("users-subscribe", args=[self.authors[-1].id])
+        with self.subTest("subscribe"):
+            self.assertEndpointBudget(
+                "subscribe",
+                lambda: client.get(url),
+                11,
+                status_code=201,
+                undo=lambda: client.delete(url),
+            )
+        client.get(url)
+        with self.subTest("unsubscribe"):
+            self.assertEndpointBudget(
+                "unsubscribe",
+                lambda: client.delete(url),
+                6,
+                status_code=204,
+                undo=lambda: client.get(url),
+            )
+
+        add_ids = [author.id for author in self.authors[25:29]]
+        with self.subTest("bulk_subscribe"):
+            self.assertEndpointBudget(
+                "bulk_subscribe",
+                lambda: client.post(
+                    URL_BULK_SUBSCRIBE,
+                    {"add": add_ids, "remove": []},
+                    format="json",
+                ),
+                7,
+                undo=lambda: client.post(
+                    URL_BULK_SUBSCRIBE,
+                    {"add": [], "remove": add_ids},
+                    format="json",
+                ),
+            )
@@ -1,13 +1,23 @@
+import re
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from foodgram.users.models import UserSubscription
 from rest_framework import status
 from rest_framework.test import APIClient, APITestCase
 
+from foodgram.users.models import UserSubscription
+
+from .. import cache as following_cache
 from ..factories import UserFactory, UserSubscriptionFactory
 
 URL_USERS_LIST = reverse("users-list")
 URL_SUBSRIPRIONS_LIST = reverse("subscriptions-list")
 URL_USER_DETAIL = reverse("users-detail", args=[1])
+URL_BULK_SUBSCRIBE = reverse("users-bulk-subscribe")
 
 
 class UsersViewTests(APITestCase):
@@ -248,3 +258,195 @@ class UsersViewTests(APITestCase):
             1,
             msg="Убедитесь, что объект подписки есть, но только один.",
         )
+
+
+class BulkSubscribeViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        cls.authors = UserFactory.create_batch(10)
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def test_bulk_subscribe_returns_item_statuses(self):
+        user = BulkSubscribeViewTests.user
+        authors = BulkSubscribeViewTests.authors
+        UserSubscriptionFactory(follower=user, following=authors[0])
+        UserSubscriptionFactory(follower=user, following=authors[1])
+        data = {
+            "add": [authors[0].id, authors[2].id, user.id, 10 ** 6],
+            "remove": [authors[1].id, authors[3].id],
+        }
+
+        response = BulkSubscribeViewTests.authorized_client.post(
+            URL_BULK_SUBSCRIBE, data=data, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [item["status"] for item in response.json()["results"]],
+            [
+                "already_exists",
+                "added",
+                "not_allowed",
+                "not_found",
+                "removed",
+                "not_found",
+            ],
+        )
+        self.assertQuerysetEqual(
+            UserSubscription.objects.filter(follower=user)
+            .order_by("following_id")
+            .values_list("following_id", flat=True),
+            [authors[0].id, authors[2].id],
+        )
+
+    def test_bulk_subscribe_number_of_queries_is_constant(self):
+        client = BulkSubscribeViewTests.authorized_client
+        authors_ids = [author.id for author in BulkSubscribeViewTests.authors]
+
+        queries = []
+        for size in (2, 8):
+            data = {"add": authors_ids[:size]}
+            with CaptureQueriesContext(connection) as context:
+                client.post(URL_BULK_SUBSCRIBE, data=data, format="json")
+            queries.append(len(context.captured_queries))
+            data = {"remove": authors_ids[:size]}
+            with CaptureQueriesContext(connection) as context:
+                client.post(URL_BULK_SUBSCRIBE, data=data, format="json")
+            queries.append(len(context.captured_queries))
+
+        self.assertEqual(
+            queries[:2],
+            queries[2:],
+            msg="Число запросов не должно зависеть от количества id.",
+        )
+
+    def test_bulk_subscribe_validates_data(self):
+        client = BulkSubscribeViewTests.authorized_client
+        author_id = BulkSubscribeViewTests.authors[0].id
+
+        for data in ({}, {"add": [author_id], "remove": [author_id]}):
+            with self.subTest(data=data):
+                response = client.post(
+                    URL_BULK_SUBSCRIBE, data=data, format="json"
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "foodgram-users-tests",
+        }
+    }
+)
+class FollowingCacheViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        super().setUpTestData()
+        cls.user = UserFactory()
+        cls.authors = UserFactory.create_batch(3)
+
+        cls.authorized_client = APIClient()
+        cls.authorized_client.force_authenticate(user=cls.user)
+
+    def setUp(self) -> None:
+        cache.clear()
+
+    def get_subscribed(self):
+        response = FollowingCacheViewTests.authorized_client.get(
+            URL_USERS_LIST, {"limit": 10}
+        )
+        return {
+            user["id"]
+            for user in response.data["results"]
+            if user["is_subscribed"]
+        }
+
+    def test_subscribe_updates_cached_following_ids(self):
+        client = FollowingCacheViewTests.authorized_client
+        author = FollowingCacheViewTests.authors[0]
+        url = reverse("users-subscribe", args=[author.id])
+        self.assertEqual(self.get_subscribed(), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.get_subscribed(), {author.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get_subscribed(), set())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.post(
+                URL_BULK_SUBSCRIBE,
+                data={"add": [author.id], "remove": []},
+                format="json",
+            )
+        self.assertEqual(self.get_subscribed(), {author.id})
+
+    def test_stale_fill_does_not_override_change(self):
+        """
+        Following ids read before a subscription is committed are not
+        served after the commit.
+        """
+        user = FollowingCacheViewTests.user
+        author = FollowingCacheViewTests.authors[0]
+        read_from_db = following_cache._get_following_ids_from_db
+
+        def read_before_subscribe(user_id):
+            following_ids = read_from_db(user_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                UserSubscriptionFactory(follower=user, following=author)
+                following_cache.invalidate_following_ids(user.id)
+            return following_ids
+
+        with patch.object(
+            following_cache,
+            "_get_following_ids_from_db",
+            side_effect=read_before_subscribe,
+        ):
+            self.assertEqual(
+                following_cache.get_following_ids(user.id), frozenset()
+            )
+        self.assertEqual(
+            following_cache.get_following_ids(user.id), {author.id}
+        )
+
+    def test_subscriptions_are_paginated_by_cached_ids(self):
+        """
+        With cached following ids the list doesn't query subscriptions and
+        doesn't count users.
+        """
+        user = FollowingCacheViewTests.user
+        authors = FollowingCacheViewTests.authors
+        for author in authors:
+            UserSubscriptionFactory(follower=user, following=author)
+        client = FollowingCacheViewTests.authorized_client
+        client.get(URL_SUBSRIPRIONS_LIST)
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(URL_SUBSRIPRIONS_LIST, {"limit": 2})
+
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual(
+            [user["id"] for user in response.data["results"]],
+            [authors[0].id, authors[1].id],
+        )
+        for query in context.captured_queries:
+            self.assertNotIn("COUNT(", query["sql"])
+            self.assertNotIn("users_usersubscription", query["sql"])
+            for ids in re.findall(r" IN \(([\d, ]+)\)", query["sql"]):
+                self.assertNotIn(
+                    authors[2].id,
+                    [int(user_id) for user_id in ids.split(",")],
+                    msg="В запросе должны быть только id со страницы.",
+                )
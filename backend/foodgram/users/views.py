@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
 from rest_framework.decorators import action
@@ -8,6 +9,11 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from ..core.cache import touch_user_state
+from ..core.serializers import BulkActionSerializer
+from ..core.utils import lock_rows, plan_bulk_action
+from ..recipes.feed import backfill_feed, remove_from_feed
+from .cache import get_following_ids, invalidate_following_ids
 from .filters import SubscriptionFilter
 from .models import UserSubscription
 from .serializers import UserSubscriptionSerializer, UserWithRecipesSerializer
@@ -17,9 +23,7 @@ User = get_user_model()
 
 class CustomUserQuerysetMixin:
     """
-    Adds annotated UserQueryset with fields
-    - is_subsribed
-    - recipe_count
+    Adds annotated UserQueryset with 'is_subsribed' field.
     """
 
     queryset = User.ext_objects.order_by("id")
@@ -30,7 +34,7 @@ class CustomUserQuerysetMixin:
             user = None
 
         queryset = super().get_queryset()
-        queryset = queryset.with_recipes_count().with_subscriptions(user=user)
+        queryset = queryset.with_subscriptions(user=user)
         return queryset
 
 
@@ -55,7 +59,12 @@ class CustomUserViewSet(CustomUserQuerysetMixin, DjoserUserViewSet):
             }
             serializer = serializer(data=data, context=context)
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                lock_rows(User.objects.filter(id=follower.id))
+                serializer.save()
+                backfill_feed(follower.id, [following.id])
+                touch_user_state(follower.id)
+                invalidate_following_ids(follower.id)
 
             response_data = UserWithRecipesSerializer(
                 following,
@@ -64,16 +73,80 @@ class CustomUserViewSet(CustomUserQuerysetMixin, DjoserUserViewSet):
             return Response(response_data.data, status=status.HTTP_201_CREATED)
 
         if request.method == "DELETE":
-            number_deleted_objects, _ = UserSubscription.objects.filter(
-                follower=follower,
-                following=following,
-            ).delete()
+            with transaction.atomic():
+                lock_rows(User.objects.filter(id=follower.id))
+                number_deleted_objects, _ = UserSubscription.objects.filter(
+                    follower=follower,
+                    following=following,
+                ).delete()
+                if number_deleted_objects != 0:
+                    remove_from_feed(follower.id, [following.id])
+                    touch_user_state(follower.id)
+                    invalidate_following_ids(follower.id)
 
             if number_deleted_objects == 0:
                 raise NotFound("Пользователь не подписан.")
 
             return Response("OK", status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["post"],
+        permission_classes=[IsAuthenticated],
+    )
+    def bulk_subscribe(self, request):
+        """
+        Follow and unfollow many users with constant number of queries.
+        Expects '{"add": [ids], "remove": [ids]}', returns status of every
+        item.
+        """
+        serializer = BulkActionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add_ids = serializer.validated_data["add"]
+        remove_ids = serializer.validated_data["remove"]
+
+        follower = request.user
+        existing_ids = set(
+            User.objects.filter(id__in=add_ids).values_list("id", flat=True)
+        )
+        subscriptions = UserSubscription.objects.filter(
+            follower=follower, following_id__in=[*add_ids, *remove_ids]
+        )
+
+        with transaction.atomic():
+            # Subscriptions of the follower are changed one request at a
+            # time, so the planned changes are the actual ones
+            lock_rows(User.objects.filter(id=follower.id))
+            following_ids = set(
+                subscriptions.values_list("following_id", flat=True)
+            )
+            to_add, to_remove, results = plan_bulk_action(
+                add_ids,
+                remove_ids,
+                existing_ids,
+                following_ids,
+                forbidden_ids={follower.id},
+            )
+            if to_add:
+                UserSubscription.objects.bulk_create(
+                    (
+                        UserSubscription(
+                            follower=follower, following_id=following_id
+                        )
+                        for following_id in to_add
+                    ),
+                    ignore_conflicts=True,
+                )
+                backfill_feed(follower.id, to_add)
+            if to_remove:
+                subscriptions.filter(following_id__in=to_remove).delete()
+                remove_from_feed(follower.id, to_remove)
+            if to_add or to_remove:
+                touch_user_state(follower.id)
+                invalidate_following_ids(follower.id)
+
+        return Response({"results": results})
+
 
 class SubscriptionViewSet(
     CustomUserQuerysetMixin,
@@ -89,9 +162,39 @@ class SubscriptionViewSet(
     serializer_class = UserWithRecipesSerializer
     filterset_class = SubscriptionFilter
 
+    def get_following_ids(self):
+        """Sorted ids of followed users, see 'get_following_ids'."""
+        if not hasattr(self, "_following_ids"):
+            self._following_ids = sorted(
+                get_following_ids(self.request.user.id)
+            )
+        return self._following_ids
+
+    def is_paginated(self):
+        """Whether 'paginate_queryset' makes a page of the followed users."""
+        return self.paginator is not None and bool(
+            self.paginator.get_page_size(self.request)
+        )
+
     def get_queryset(self):
         queryset = super().get_queryset()
-        user = self.request.user
-        user_follow_list = user.following.values_list("following", flat=True)
-        queryset = queryset.filter(id__in=user_follow_list)
+        # Paginated users are filtered by the page's ids only, filtering by
+        # all the followed ids would send the whole list to the database
+        if not self.is_paginated():
+            queryset = queryset.filter(id__in=self.get_following_ids())
+        # Without 'recipes_limit' filter all recipes of the page's users are
+        # listed, they are prefetched with one query
+        if not self.request.query_params.get("recipes_limit"):
+            queryset = queryset.prefetch_related("recipes")
         return queryset
+
+    def paginate_queryset(self, queryset):
+        """
+        Paginates the cached ids of followed users instead of the queryset,
+        so no 'COUNT(*)' query is made. Only users of the page are fetched.
+        Users are ordered by id, like the queryset.
+        """
+        page_ids = super().paginate_queryset(self.get_following_ids())
+        if page_ids is None:
+            return None
+        return list(queryset.filter(id__in=page_ids))